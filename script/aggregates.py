@@ -0,0 +1,313 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# --------------------------------------------------------------------------------------------------
+# Katabase project: github.com/katabase/
+# Aggregates of the prices over the whole corpus (option --cubes of extractor_json.py)
+#
+# * PROCESS BREAKDOWN *
+# - file_partials() groups the descs of a file by each dimension of DIMENSIONS (sell year, type
+#   of catalogue, term, format and author) and computes, for each group, the number of descs and
+#   the partial statistics of their prices in constant francs: number of prices, sum, sum of the
+#   squared deviations from the mean, lowest and highest price and histogram (see PRICE_BINS) ;
+#   the price of an item with several descs is counted once in each group. the partials of several
+#   files are merged as in Chan et al. (see cube_row()), which keeps the variance accurate ;
+# - CubeStore keeps these partials in a SQLite database (one row per file, dimension and group)
+#   and, from them, the `cubes` table: one row per dimension and group with the statistics over the
+#   whole corpus. extractor_json.py calls CubeStore.update() with the results of each file: if the
+#   file changed since the last run, its partials are replaced and the groups it belongs to (before
+#   or after the change) are marked ; CubeStore.prune() drops the files that no longer exist ; when
+#   the changes are committed, only the rows of the marked groups are computed again ;
+# - query_cube() reads the rows of a dimension ; if __name__ == "__main__", it prints them as
+#   JSON Lines.
+# usage: python3 aggregates.py --by year [--db ../output/cubes.sqlite] [--min-descs 10]
+# --------------------------------------------------------------------------------------------------
+
+
+import os
+import re
+import json
+import sqlite3
+import argparse
+from bisect import bisect_right
+
+
+curdir = os.path.abspath(os.path.dirname(os.path.abspath(__file__)))
+
+DIMENSIONS = ["year", "cat_type", "term", "format", "author"]
+# lower bounds of the bins of the histograms, in constant francs ; the last bin has no upper bound
+PRICE_BINS = [0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+CUBE_COLUMNS = ["dimension", "key", "descs", "priced", "total_price_c", "mean_price_c", "variance_price_c",
+				"low_price_c", "high_price_c", "histogram"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+	source TEXT PRIMARY KEY,
+	hash TEXT
+);
+CREATE TABLE IF NOT EXISTS partials (
+	source TEXT NOT NULL,
+	dimension TEXT NOT NULL,
+	key NOT NULL,
+	descs INTEGER,
+	priced INTEGER,
+	total REAL,
+	m2 REAL,
+	low REAL,
+	high REAL,
+	histogram TEXT,
+	PRIMARY KEY (source, dimension, key)
+);
+CREATE INDEX IF NOT EXISTS partials_group ON partials(dimension, key);
+CREATE TABLE IF NOT EXISTS cubes (
+	dimension TEXT NOT NULL,
+	key NOT NULL,
+	descs INTEGER,
+	priced INTEGER,
+	total_price_c REAL,
+	mean_price_c REAL,
+	variance_price_c REAL,
+	low_price_c REAL,
+	high_price_c REAL,
+	histogram TEXT,
+	PRIMARY KEY (dimension, key)
+);
+"""
+
+
+# ============== PARTIAL AGGREGATES ============== #
+def file_partials(output_dict, catalog_dict):
+	"""
+	compute the partial aggregates of a file
+	:param output_dict: the data on the descs of the file, from item_extractor()
+	:param catalog_dict: the data on the catalogue of the file, from catalog_extractor()
+	:return: dict mapping (dimension, key) to [descs, priced, total, m2, low, high, histogram]
+	"""
+	cat_type = next((data.get("cat_type") for data in catalog_dict.values()), None)
+	partials = {}
+	priced = set()  # (dimension, key, item) whose price was added: all the descs of an item have its price
+	for desc_id, data in output_dict.items():
+		sell_date = data.get("sell_date")
+		years = re.findall(r"\d{4}", sell_date) if sell_date else []
+		keys = {"year": int(years[0]) if years else None, "cat_type": cat_type, "term": data["term"],
+				"format": data["format"], "author": data["author"]}
+		price_c = data.get("price_c")
+		for dimension in DIMENSIONS:
+			if keys[dimension] is None:
+				continue
+			partial = partials.get((dimension, keys[dimension]))
+			if partial is None:
+				partial = partials[(dimension, keys[dimension])] = [0, 0, 0.0, 0.0, None, None, [0] * len(PRICE_BINS)]
+			partial[0] += 1
+			if price_c is not None and (dimension, keys[dimension], item_id(desc_id)) not in priced:
+				priced.add((dimension, keys[dimension], item_id(desc_id)))
+				add_price(partial, price_c)
+	return partials
+
+
+def item_id(desc_id):
+	"""
+	:param desc_id: the @xml:id of a desc (CAT_000112_e18_d1)
+	:return: the @xml:id of its item (CAT_000112_e18)
+	"""
+	return desc_id.rsplit("_d", 1)[0]
+
+
+def add_price(partial, price_c):
+	"""
+	add a price to a partial aggregate (Welford's update of the sum of the squared deviations)
+	:param partial: [descs, priced, total, m2, low, high, histogram], updated in place
+	:param price_c: a price in constant francs
+	:return: None
+	"""
+	delta = price_c - partial[2] / partial[1] if partial[1] else 0.0
+	partial[1] += 1
+	partial[2] += price_c
+	partial[3] += delta * (price_c - partial[2] / partial[1])
+	partial[4] = price_c if partial[4] is None else min(partial[4], price_c)
+	partial[5] = price_c if partial[5] is None else max(partial[5], price_c)
+	partial[6][max(bisect_right(PRICE_BINS, price_c) - 1, 0)] += 1
+	return None
+
+
+# ============== CUBES ============== #
+class CubeStore:
+	"""
+	SQLite database holding the partial aggregates of each file and the cubes built from them.
+	used as a context manager, the changes are committed if no exception is raised, else rolled back.
+	"""
+	def __init__(self, path):
+		"""
+		:param path: path to the database ; it is created if it doesn't exist
+		"""
+		self.path = path
+		self.connection = sqlite3.connect(path)
+		self.connection.executescript(SCHEMA)
+		self.updated = 0  # number of files whose partials were replaced
+		self.skipped = 0  # number of files that were unchanged
+		self.dirty = set()  # (dimension, key) groups whose row of the cubes table must be computed again
+
+	def update(self, source, output_dict, catalog_dict, source_hash=None):
+		"""
+		replace the partial aggregates of an XML file and mark its groups (see refresh())
+		:param source: the path of the XML file, relative to Catalogues/
+		:param output_dict: the items of the file, as returned by item_extractor()
+		:param catalog_dict: the catalogue data of the file, as returned by catalog_extractor()
+		:param source_hash: a hash of the file and of the extraction ; if it is the same as
+							the one stored, the partials of the file are left as they are
+		:return: True if the partials were replaced, False if the file was unchanged
+		"""
+		row = self.connection.execute("SELECT hash FROM sources WHERE source = ?", (source,)).fetchone()
+		if source_hash is not None and row is not None and row[0] == source_hash:
+			self.skipped += 1
+			return False
+		groups = self.delete(source)
+		partials = file_partials(output_dict, catalog_dict)
+		self.connection.executemany(
+			"INSERT INTO partials (source, dimension, key, descs, priced, total, m2, low, high, histogram) "
+			"VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+			((source, dimension, key, *partial[:6], json.dumps(partial[6]))
+			 for (dimension, key), partial in partials.items())
+		)
+		self.connection.execute("INSERT OR REPLACE INTO sources (source, hash) VALUES (?, ?)", (source, source_hash))
+		self.dirty |= groups | set(partials)
+		self.updated += 1
+		return True
+
+	def delete(self, source):
+		"""
+		delete the partial aggregates of an XML file ; the groups of the file are not marked
+		:param source: the path of the XML file, relative to Catalogues/
+		:return: set of the (dimension, key) groups in which the file had descs
+		"""
+		groups = set(self.connection.execute("SELECT dimension, key FROM partials WHERE source = ?", (source,)))
+		self.connection.execute("DELETE FROM partials WHERE source = ?", (source,))
+		self.connection.execute("DELETE FROM sources WHERE source = ?", (source,))
+		return groups
+
+	def prune(self, sources):
+		"""
+		delete the partial aggregates of the XML files that are not in `sources`
+		:param sources: the paths of the current XML files, relative to Catalogues/
+		:return: the number of files whose partials were deleted
+		"""
+		sources = set(sources)
+		stored = [row[0] for row in self.connection.execute("SELECT source FROM sources")]
+		deleted = [source for source in stored if source not in sources]
+		for source in deleted:
+			self.dirty |= self.delete(source)
+		return len(deleted)
+
+	def refresh(self):
+		"""
+		compute again the rows of the cubes table of the marked groups, from the partials of every file
+		:return: the number of rows computed
+		"""
+		refreshed = len(self.dirty)
+		for dimension, key in sorted(self.dirty, key=repr):
+			rows = self.connection.execute(
+				"SELECT descs, priced, total, m2, low, high, histogram FROM partials "
+				"WHERE dimension = ? AND key = ? ORDER BY source", (dimension, key)
+			).fetchall()
+			if not rows:
+				self.connection.execute("DELETE FROM cubes WHERE dimension = ? AND key = ?", (dimension, key))
+				continue
+			self.connection.execute(
+				f"INSERT OR REPLACE INTO cubes ({', '.join(CUBE_COLUMNS)}) "
+				f"VALUES ({', '.join('?' * len(CUBE_COLUMNS))})", cube_row(dimension, key, rows)
+			)
+		self.dirty.clear()
+		return refreshed
+
+	def commit(self):
+		self.refresh()
+		self.connection.commit()
+		self.connection.close()
+
+	def abort(self):
+		self.connection.rollback()
+		self.connection.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, exc_traceback):
+		if exc_type is None:
+			self.commit()
+		else:
+			self.abort()
+		return False
+
+
+def cube_row(dimension, key, rows):
+	"""
+	add up the partial aggregates of a group
+	:param dimension: the dimension of the group (see DIMENSIONS)
+	:param key: the value of the dimension
+	:param rows: the (descs, priced, total, m2, low, high, histogram) rows of the partials table
+	:return: tuple of values, in the order of CUBE_COLUMNS
+	"""
+	descs = sum(row[0] for row in rows)
+	priced = sum(row[1] for row in rows)
+	histogram = [0] * len(PRICE_BINS)
+	for row in rows:
+		for i, count in enumerate(json.loads(row[6])):
+			histogram[i] += count
+	if not priced:
+		return dimension, key, descs, 0, None, None, None, None, None, json.dumps(histogram)
+	# sums of the squared deviations merged as in Chan et al., "Updating formulae and a pairwise
+	# algorithm for computing sample variances" (1979)
+	count, total, m2 = 0, 0.0, 0.0
+	for row in rows:
+		if not row[1]:
+			continue
+		if count:
+			delta = row[2] / row[1] - total / count
+			m2 += row[3] + delta * delta * count * row[1] / (count + row[1])
+		else:
+			m2 = row[3]
+		count += row[1]
+		total += row[2]
+	mean = total / priced
+	# population variance, as in pricestats.price_stats()
+	variance = m2 / priced
+	low = min(row[4] for row in rows if row[4] is not None)
+	high = max(row[5] for row in rows if row[5] is not None)
+	return dimension, key, descs, priced, total, mean, variance, low, high, json.dumps(histogram)
+
+
+# ============== QUERIES ============== #
+def query_cube(path, dimension, min_descs=None):
+	"""
+	get the rows of a cube
+	:param path: path to the database
+	:param dimension: the dimension of the cube (see DIMENSIONS)
+	:param min_descs: only return the groups with at least this number of descs
+	:return: list of dicts, with the columns of CUBE_COLUMNS (the histogram being a list of counts
+			 for each bin of PRICE_BINS), ordered by key
+	"""
+	query = f"SELECT {', '.join(CUBE_COLUMNS)} FROM cubes WHERE dimension = ?"
+	params = [dimension]
+	if min_descs is not None:
+		query += " AND descs >= ?"
+		params.append(min_descs)
+	query += " ORDER BY key"
+	connection = sqlite3.connect(path)
+	connection.row_factory = sqlite3.Row
+	try:
+		return [{**row, "histogram": json.loads(row["histogram"])} for row in map(dict, connection.execute(query, params))]
+	finally:
+		connection.close()
+
+
+# ============== COMMAND LINE INTERFACE ============== #
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="read the aggregates written by extractor_json.py --cubes")
+	parser.add_argument("--db", default=f"{curdir}/../output/cubes.sqlite",
+						help="path to the database ; default: output/cubes.sqlite")
+	parser.add_argument("--by", choices=DIMENSIONS, required=True, help="dimension of the aggregates")
+	parser.add_argument("--min-descs", type=int, help="minimum number of descs of a group")
+	args = parser.parse_args()
+
+	for row in query_cube(args.db, args.by, args.min_descs):
+		print(json.dumps(row, ensure_ascii=False))
@@ -0,0 +1,115 @@
+import os
+import re
+import statistics
+import glob
+import tempfile
+import unittest
+from lxml import etree
+
+from extractor_json import item_extractor, catalog_extractor, curdir
+from aggregates import *
+
+
+def brute_force(results, dimension):
+    # the aggregates of a dimension, computed from the descs of every file: key -> (descs, prices),
+    # the price of an item with several descs in the group being counted once
+    groups = {}
+    for output_dict, catalog_dict in results:
+        cat_type = next(iter(catalog_dict.values()), {}).get("cat_type")
+        for desc_id, data in output_dict.items():
+            years = re.findall(r"\d{4}", data.get("sell_date") or "")
+            key = {"year": int(years[0]) if years else None, "cat_type": cat_type, "term": data["term"],
+                   "format": data["format"], "author": data["author"]}[dimension]
+            if key is not None:
+                descs, prices = groups.setdefault(key, (0, {}))
+                if data.get("price_c") is not None:
+                    prices[desc_id.rsplit("_d", 1)[0]] = data["price_c"]
+                groups[key] = (descs + 1, prices)
+    return groups
+
+
+class Price_cubes(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db = os.path.join(self.tmpdir.name, "cubes.sqlite")
+        self.results = {}
+        for file in sorted(glob.glob(f"{curdir}/../Catalogues/101-200/*.xml"))[:12]:
+            tree = etree.parse(file)
+            self.results[os.path.basename(file)] = (item_extractor(tree, {}), catalog_extractor(tree, {}))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def check(self, results):
+        for dimension in DIMENSIONS:
+            groups = brute_force(results, dimension)
+            rows = query_cube(self.db, dimension)
+            self.assertEqual([row["key"] for row in rows], sorted(groups))
+            for row in rows:
+                descs, prices = groups[row["key"]]
+                prices = list(prices.values())
+                self.assertEqual(row["descs"], descs)
+                self.assertEqual(row["priced"], len(prices))
+                self.assertEqual(sum(row["histogram"]), len(prices))
+                if prices:
+                    self.assertAlmostEqual(row["total_price_c"], sum(prices))
+                    self.assertAlmostEqual(row["mean_price_c"], sum(prices) / len(prices))
+                    self.assertAlmostEqual(row["variance_price_c"], statistics.pvariance(prices),
+                                           delta=1e-9 * max(statistics.pvariance(prices), 1.0))
+                    self.assertEqual((row["low_price_c"], row["high_price_c"]), (min(prices), max(prices)))
+                else:
+                    self.assertIsNone(row["mean_price_c"])
+
+    def test_same_as_brute_force(self):
+        with CubeStore(self.db) as cubes:
+            for source, (output_dict, catalog_dict) in self.results.items():
+                cubes.update(source, output_dict, catalog_dict, source_hash="1")
+        self.check(self.results.values())
+
+    def test_incremental(self):
+        with CubeStore(self.db) as cubes:
+            for source, (output_dict, catalog_dict) in self.results.items():
+                cubes.update(source, output_dict, catalog_dict, source_hash="1")
+        sources = list(self.results)
+        # a file changes (its first desc loses its price) and another one is deleted
+        output_dict, catalog_dict = self.results[sources[0]]
+        changed = dict(output_dict)
+        first = next(iter(changed))
+        changed[first] = {**changed[first], "price_c": None}
+        with CubeStore(self.db) as cubes:
+            self.assertFalse(cubes.update(sources[1], *self.results[sources[1]], source_hash="1"))
+            self.assertTrue(cubes.update(sources[0], changed, catalog_dict, source_hash="2"))
+            self.assertEqual(cubes.prune(sources[:-1]), 1)
+        self.check([(changed, catalog_dict)] + [self.results[s] for s in sources[1:-1]])
+
+    def test_lot(self):
+        # an item with two descs: its price is counted once, and each of its descs
+        data = {"sell_date": "1887", "term": 7, "format": 8, "author": "Hugo", "price_c": 100.0}
+        output_dict = {"CAT_000112_e18_d1": data, "CAT_000112_e18_d2": dict(data, author="Vigny"),
+                       "CAT_000112_e19_d1": dict(data, price_c=50.0)}
+        partials = file_partials(output_dict, {})
+        self.assertEqual(partials[("year", 1887)][:3], [3, 2, 150.0])
+        self.assertEqual(partials[("author", "Vigny")][:3], [1, 1, 100.0])
+
+    def test_stable_variance(self):
+        # large prices with a small spread: the sum of the squares loses every digit of the variance
+        prices = [1e9 + p for p in [4.0, 7.0, 13.0, 16.0]]
+        with CubeStore(self.db) as cubes:
+            for i, price in enumerate(prices):
+                data = {"sell_date": "1887", "term": None, "format": None, "author": None, "price_c": price}
+                cubes.update(str(i), {f"CAT_{i}_e1_d1": data, f"CAT_{i}_e2_d1": dict(data, price_c=price + 1)}, {})
+        row = query_cube(self.db, "year")[0]
+        self.assertAlmostEqual(row["variance_price_c"], statistics.pvariance(prices + [p + 1 for p in prices]))
+
+    def test_histogram(self):
+        partial = [0, 0, 0.0, 0.0, None, None, [0] * len(PRICE_BINS)]
+        for price in [0.0, 0.5, 1.0, 9.99, 10.0, 20000.0]:
+            add_price(partial, price)
+        self.assertEqual(partial[6][:5], [2, 1, 0, 1, 1])
+        self.assertEqual(partial[6][-1], 1)
+        self.assertEqual((partial[4], partial[5]), (0.0, 20000.0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,202 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# --------------------------------------------------------------------------------------------------
+# Katabase project: github.com/katabase/
+# Index of the authors of the corpus, built during the extraction (option --authors of extractor_json.py)
+#
+# * PROCESS BREAKDOWN *
+# - surname() normalises the text of a tei:name[@type="author"] to the surname kept in the data
+#   of the descs ; the same names come back in thousands of tei:items, so the result is computed
+#   once for each distinct text and then read from a cache ;
+# - AuthorIndex.add() adds the results of a file to the index, in the order of the files: for each
+#   author, the wikidata ids found with its name, the ids of its items (the keys of export_item.json),
+#   the catalogues in which it appears and the history of its prices (sell date, price, currency and
+#   price in constant francs of each priced item, once for an item with several descs) ;
+# - AuthorIndex.write() saves the index to a JSON file (output/author_index.json) and
+#   AuthorIndex.load() reads it back: an author is then found with a dict lookup, by its name
+#   (lookup()) or by its wikidata id (by_wikidata()), without reading export_item.json again.
+# usage: python3 authors.py "HUGO (Victor)" [--wikidata wd:Q535] [--index ../output/author_index.json]
+# --------------------------------------------------------------------------------------------------
+
+
+import os
+import re
+import sys
+import json
+import argparse
+from functools import lru_cache
+
+from records import intern_text
+
+
+INDEX_VERSION = 2  # version of the format of the JSON file ; load() refuses the other versions
+author_pattern = re.compile(r'^([^\(|.|,|;|-]+)')
+
+
+# ============== NORMALISATION ============== #
+@lru_cache(maxsize=None)
+def surname(name):
+	"""
+	get the surname of an author from the text of a tei:name[@type="author"] ; the results
+	are cached, as the same texts are found in many items
+	:param name: the text of the tei:name, or None
+	:return: the surname (interned, see records.intern_text()), or None if there is none
+	"""
+	if name is None:
+		return None
+	# We only keep the surname of the author : we stop the match at the first
+	# parenthesis or dot and we keep the first match.
+	match = author_pattern.match(name)
+	if match is None:
+		return None
+	# We remove blankspaces.
+	return intern_text(match[1].strip())
+
+
+# ============== INDEX ============== #
+class AuthorIndex:
+	"""
+	inverted index of the corpus: author -> wikidata ids, items, catalogues and prices
+	"""
+	def __init__(self, authors=None):
+		"""
+		:param authors: dict mapping each author to its entry (see entry()), or None for an empty index
+		"""
+		self.authors = authors if authors is not None else {}
+		self.wikidata = {}  # wikidata id -> names of the authors with this id
+		self.folded = {}  # casefolded name -> names of the authors, to find a name whatever its case
+		for name, entry in self.authors.items():
+			self.link(name, entry)
+
+	@staticmethod
+	def entry():
+		"""
+		:return: a new entry of the index: the wikidata ids of the author, the ids of its
+				 items, the ids of the catalogues and the prices, as [item id, sell date,
+				 price, currency, price in constant francs] lists
+		"""
+		return {"wikidata_ids": [], "items": [], "catalogues": [], "prices": []}
+
+	def link(self, name, entry):
+		"""
+		add an author to the secondary indexes (wikidata ids and casefolded names)
+		:param name: the name of the author
+		:param entry: its entry in the index
+		:return: None
+		"""
+		for wikidata_id in entry["wikidata_ids"]:
+			names = self.wikidata.setdefault(wikidata_id, [])
+			if name not in names:
+				names.append(name)
+		names = self.folded.setdefault(name.casefold(), [])
+		if name not in names:
+			names.append(name)
+		return None
+
+	def add(self, output_dict, catalog_dict):
+		"""
+		add the results of a file to the index
+		:param output_dict: the data on the descs of the file, from item_extractor()
+		:param catalog_dict: the data on the catalogue of the file, from catalog_extractor()
+		:return: None
+		"""
+		catalogues = list(catalog_dict)
+		priced = set()  # (author, item id) of the prices added ; the items of a file are added together
+		for desc_id, data in output_dict.items():
+			name = data["author"]
+			if name is None:
+				continue
+			entry = self.authors.get(name)
+			if entry is None:
+				entry = self.authors[name] = self.entry()
+				self.link(name, entry)
+			wikidata_id = data["author_wikidata_id"]
+			if wikidata_id is not None and wikidata_id not in entry["wikidata_ids"]:
+				entry["wikidata_ids"].append(wikidata_id)
+				self.link(name, entry)
+			entry["items"].append(desc_id)
+			for cat_id in catalogues:
+				# the items of a file are added together: only the last catalogue has to be checked
+				if not entry["catalogues"] or entry["catalogues"][-1] != cat_id:
+					entry["catalogues"].append(cat_id)
+			if data["price"] is not None:
+				# the descs of an item share its price: it is only added once, for the item
+				item_id = desc_id.rsplit("_d", 1)[0]
+				if (name, item_id) not in priced:
+					priced.add((name, item_id))
+					entry["prices"].append([item_id, data.get("sell_date"), data["price"], data.get("currency"),
+											data.get("price_c")])
+		return None
+
+	def lookup(self, name):
+		"""
+		find an author by its name
+		:param name: the surname of the author, or the full text of a tei:name[@type="author"]
+		:return: tuple of (name, entry): the name of the author in the index and its entry ;
+				 (None, None) if there is no such author
+		"""
+		key = surname(name)
+		if key is None:
+			return None, None
+		if key in self.authors:
+			return key, self.authors[key]
+		# the same name can be written in another case in some catalogues
+		names = self.folded.get(key.casefold())
+		if names:
+			return names[0], self.authors[names[0]]
+		return None, None
+
+	def by_wikidata(self, wikidata_id):
+		"""
+		:param wikidata_id: a wikidata id, as in the @ref of the tei:names ("wd:Q535")
+		:return: dict mapping the name of each author with this id to its entry
+		"""
+		return {name: self.authors[name] for name in self.wikidata.get(wikidata_id, [])}
+
+	def write(self, path):
+		"""
+		write the index to a JSON file ; the file is replaced only once it is fully written
+		:param path: path to the JSON file
+		:return: None
+		"""
+		with open(f"{path}.part", mode="w", encoding="utf-8") as f:
+			json.dump({"version": INDEX_VERSION, "authors": dict(sorted(self.authors.items()))}, f)
+		os.replace(f"{path}.part", path)
+		return None
+
+	@classmethod
+	def load(cls, path):
+		"""
+		read an index written by write()
+		:param path: path to the JSON file
+		:return: the AuthorIndex
+		"""
+		with open(path, mode="r", encoding="utf-8") as f:
+			data = json.load(f)
+		if data.get("version") != INDEX_VERSION:
+			raise ValueError(f"{path}: version {data.get('version')} of the author index, "
+							 f"expected {INDEX_VERSION} ; run extractor_json.py --authors again")
+		return cls(data["authors"])
+
+
+# ============== COMMAND LINE INTERFACE ============== #
+if __name__ == "__main__":
+	curdir = os.path.abspath(os.path.dirname(os.path.abspath(__file__)))
+	parser = argparse.ArgumentParser(description="find an author in the index written by extractor_json.py --authors")
+	parser.add_argument("name", nargs="?", default=None, help="the name of the author")
+	parser.add_argument("--wikidata", default=None, help="find the authors with this wikidata id (wd:Q535)")
+	parser.add_argument("--index", default=f"{curdir}/../output/author_index.json",
+						help="path of the index ; default: output/author_index.json")
+	args = parser.parse_args()
+
+	index = AuthorIndex.load(args.index)
+	if args.wikidata is not None:
+		found = index.by_wikidata(args.wikidata)
+	else:
+		name, entry = index.lookup(args.name)
+		found = {name: entry} if name is not None else {}
+	if not found:
+		print("no such author")
+		sys.exit(1)
+	print(json.dumps(found, indent=4, ensure_ascii=False))
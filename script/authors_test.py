@@ -0,0 +1,75 @@
+import os
+import glob
+import tempfile
+import unittest
+from lxml import etree
+
+from extractor_json import item_extractor, catalog_extractor, curdir
+from authors import *
+
+
+class Author_index(unittest.TestCase):
+
+    def setUp(self):
+        self.files = sorted(glob.glob(f"{curdir}/../Catalogues/1-100/*.xml"))[:10]
+        self.output = {}
+        self.index = AuthorIndex()
+        for file in self.files:
+            tree = etree.parse(file)
+            file_output = item_extractor(tree, {}, records=True)
+            self.index.add(file_output, catalog_extractor(tree, {}))
+            self.output.update(file_output)
+
+    def test_surname(self):
+        self.assertEqual(surname("ADANSON (Michel"), "ADANSON")
+        self.assertEqual(surname("HUGO. Victor"), "HUGO")
+        self.assertEqual(surname(" CHERUBINI, Luigi"), "CHERUBINI")
+        self.assertIsNone(surname("(anonyme)"))
+        self.assertIsNone(surname(None))
+        self.assertIs(surname("".join(["BARRY (", "Mme"])), surname("BARRY (Mme"))
+
+    def test_same_as_items(self):
+        # the index holds every item with an author, and nothing else
+        authored = {desc_id: data for desc_id, data in self.output.items() if data["author"] is not None}
+        self.assertEqual(sorted(i for entry in self.index.authors.values() for i in entry["items"]), sorted(authored))
+        for desc_id, data in authored.items():
+            name, entry = self.index.lookup(data["author"])
+            self.assertEqual(name, data["author"])
+            self.assertIn(desc_id, entry["items"])
+            self.assertIn(desc_id.split("_e")[0], entry["catalogues"])
+            if data["author_wikidata_id"] is not None:
+                self.assertIn(data["author_wikidata_id"], entry["wikidata_ids"])
+                self.assertIn(name, self.index.by_wikidata(data["author_wikidata_id"]))
+            if data["price"] is not None:
+                self.assertIn([desc_id.rsplit("_d", 1)[0], data.get("sell_date"), data["price"], data.get("currency"),
+                               data.get("price_c")], entry["prices"])
+        # the price of an item with several descs is only in the history once
+        for entry in self.index.authors.values():
+            item_ids = [price[0] for price in entry["prices"]]
+            self.assertEqual(len(item_ids), len(set(item_ids)))
+
+    def test_lookup(self):
+        name = next(iter(self.index.authors))
+        self.assertEqual(self.index.lookup(name)[0], name)
+        self.assertEqual(self.index.lookup(f"{name} (Jean)")[0], name)
+        self.assertEqual(self.index.lookup(name.lower())[0], name)
+        self.assertEqual(self.index.lookup("NOBODY IN THE CORPUS"), (None, None))
+        self.assertEqual(self.index.by_wikidata("wd:Q0"), {})
+
+    def test_write_load(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "author_index.json")
+            self.index.write(path)
+            self.assertEqual(os.listdir(tmpdir), ["author_index.json"])
+            loaded = AuthorIndex.load(path)
+            self.assertEqual(loaded.authors, self.index.authors)
+            self.assertEqual({k: sorted(v) for k, v in loaded.wikidata.items()},
+                             {k: sorted(v) for k, v in self.index.wikidata.items()})
+            with open(path, mode="w") as f:
+                f.write('{"version": 0, "authors": {}}')
+            with self.assertRaises(ValueError):
+                AuthorIndex.load(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,272 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# --------------------------------------------------------------------------------------------------
+# Katabase project: github.com/katabase/
+# Benchmark of the extraction pipeline of extractor_json.py, with a regression guard
+#
+# * PROCESS BREAKDOWN *
+# - the workloads are the real corpus (every file of Catalogues/) and a synthetic catalogue: the
+#   biggest catalogue of the corpus that has prices, with its items repeated 10 and 100 times
+#   (scale_catalogue()) ;
+# - each workload is loaded in memory and run in a new process, started with "spawn" rather than
+#   forked: it doesn't inherit the memory of this process (the corpus read to find the sample),
+#   so that its peak memory (RSS) is the one of the workload ;
+#   the time spent on each stage of the pipeline is measured separately: parsing, item
+#   extraction (item_extractor(), which also converts the price of each desc), catalogue
+#   extraction (catalog_extractor()), conversion of all the prices in one batch
+#   (PriceConverter.convert_batch()) and serialization (writers.JsonObjectWriter) ;
+#   the best time of several runs is kept for each stage ;
+# - the results (timings, throughput in descs per second, peak RSS) are printed and can be
+#   saved as a JSON baseline (--save) ; with --check, the results are compared to the baseline
+#   and the script exits with an error if a stage is slower (or the memory higher) than the
+#   baseline by more than a threshold.
+# usage: python3 bench_extraction.py [--limit N] [--scales 10 100] [--save | --check] [--threshold 0.25]
+# --------------------------------------------------------------------------------------------------
+
+
+import os
+import re
+import sys
+import glob
+import json
+import time
+import copy
+import shutil
+import argparse
+import resource
+import tempfile
+from contextlib import redirect_stdout
+from multiprocessing import get_context
+from lxml import etree
+
+from extractor_json import item_extractor, catalog_extractor, price_converter, curdir, TEI, XML_ID
+from writers import JsonObjectWriter
+
+
+STAGES = ["parse", "item_extraction", "catalog_extraction", "price_conversion", "serialization"]
+BASELINE = f"{curdir}/bench_baseline.json"  # default path of the baseline
+THRESHOLD = 0.25  # a stage is a regression if it is more than 25% slower than in the baseline
+MIN_TIME = 0.1  # stages faster than this (in seconds) are too noisy to be compared
+
+
+# ============== WORKLOADS ============== #
+def load_corpus(files):
+	"""
+	read the catalogues in memory, so that reading the files is not timed
+	:param files: list of paths to XML catalogues
+	:return: list of the contents of the files, as bytes
+	"""
+	documents = []
+	for file in files:
+		with open(file, mode="rb") as f:
+			documents.append(f.read())
+	return documents
+
+
+def priced_catalogues(files):
+	"""
+	get the catalogues that have prices, to build the synthetic workloads
+	:param files: list of paths to XML catalogues
+	:return: list of the files that have a tei:measure[@commodity="currency"]
+	"""
+	return [file for file, document in zip(files, load_corpus(files)) if b'commodity="currency"' in document]
+
+
+def scale_catalogue(document, factor):
+	"""
+	build a synthetic catalogue by repeating the tei:items of a catalogue: each copy of an item
+	and of its descs gets a new @xml:id (the original one followed by "_" and the copy's number)
+	:param document: the content of an XML catalogue, as bytes
+	:param factor: the number of copies of each tei:item
+	:return: the content of the synthetic catalogue, as bytes
+	"""
+	root = etree.fromstring(document)
+	for item in list(root.iter(f"{TEI}item")):
+		previous = item
+		for n in range(2, factor + 1):
+			clone = copy.deepcopy(item)
+			for element in clone.iter(f"{TEI}item", f"{TEI}desc"):
+				if element.get(XML_ID) is not None:
+					element.set(XML_ID, f"{element.get(XML_ID)}_{n}")
+			previous.addnext(clone)
+			previous = clone
+	return etree.tostring(root, encoding="utf-8", xml_declaration=True)
+
+
+def price_rows(output_dict):
+	"""
+	get the prices converted by item_extractor(), to convert them again in one batch
+	:param output_dict: the data on the descs, from item_extractor()
+	:return: list of (year, currency, price) tuples
+	"""
+	return [(re.findall(r"\d{4}", data["sell_date"])[0], data["currency"], data["price"])
+			for data in output_dict.values() if "price_c" in data]
+
+
+# ============== MEASURES ============== #
+def time_stages(documents, tmpdir):
+	"""
+	run the whole pipeline once on the documents, timing each stage
+	:param documents: list of XML catalogues, as bytes
+	:param tmpdir: directory in which the JSON files are written
+	:return: tuple of (timings, descs, catalogues): the time spent on each stage (in seconds),
+			 the number of descs and the number of catalogues extracted
+	"""
+	timings = dict.fromkeys(STAGES, 0.0)
+	output_dict, catalog_dict = {}, {}
+	for document in documents:
+		start = time.perf_counter()
+		tree = etree.fromstring(document)
+		parsed = time.perf_counter()
+		prices = {}  # the prices of the items, read once for both extractors (as in extract_file())
+		item_extractor(tree, output_dict, prices=prices)
+		items = time.perf_counter()
+		catalog_extractor(tree, catalog_dict, prices=prices)
+		timings["parse"] += parsed - start
+		timings["item_extraction"] += items - parsed
+		timings["catalog_extraction"] += time.perf_counter() - items
+
+	rows = price_rows(output_dict)
+	start = time.perf_counter()
+	price_converter.convert_batch(rows)
+	timings["price_conversion"] = time.perf_counter() - start
+
+	start = time.perf_counter()
+	with JsonObjectWriter(os.path.join(tmpdir, "export_item.json")) as item_writer, \
+			JsonObjectWriter(os.path.join(tmpdir, "export_catalog.json")) as catalog_writer:
+		item_writer.write(output_dict)
+		catalog_writer.write(catalog_dict)
+	timings["serialization"] = time.perf_counter() - start
+	return timings, len(output_dict), len(catalog_dict)
+
+
+def run_workload(files, factor=1, repeat=3):
+	"""
+	load a workload and run the pipeline `repeat` times on it, keeping the best time of each
+	stage. this function is meant to be run in its own process (see measure()), so that the
+	peak RSS of the process is the one of this workload.
+	:param files: list of paths to XML catalogues
+	:param factor: if it is more than 1, the workload is the first file scaled by this factor
+	:param repeat: number of runs
+	:return: dict with the results on the workload
+	"""
+	documents = load_corpus(files)
+	if factor > 1:
+		documents = [scale_catalogue(documents[0], factor)]
+	tmpdir = tempfile.mkdtemp()
+	try:
+		# the messages of the extractors ("No sell date for ...") would be printed on every run
+		with open(os.devnull, mode="w") as devnull, redirect_stdout(devnull):
+			runs = [time_stages(documents, tmpdir) for _ in range(repeat)]
+	finally:
+		shutil.rmtree(tmpdir)
+	stages = {stage: min(timings[stage] for timings, _, _ in runs) for stage in STAGES}
+	total = sum(stages.values())
+	_, descs, catalogues = runs[0]
+	return {
+		"catalogues": catalogues,
+		"descs": descs,
+		"stages": stages,
+		"total": total,
+		"descs_per_sec": descs / total if total else None,
+		"peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # in kilobytes on Linux
+	}
+
+
+def measure(workloads, repeat=3):
+	"""
+	run each workload in a new worker process, spawned so that its peak RSS doesn't include
+	the memory of this process
+	:param workloads: dict mapping the name of a workload to a (files, factor) tuple (see run_workload())
+	:param repeat: number of runs of each workload
+	:return: dict mapping the name of each workload to its results (see run_workload())
+	"""
+	results = {}
+	for name, (files, factor) in workloads.items():
+		with get_context("spawn").Pool(processes=1) as pool:
+			results[name] = pool.apply(run_workload, (files, factor, repeat))
+	return results
+
+
+def compare(baseline, results, threshold=THRESHOLD, min_time=MIN_TIME):
+	"""
+	compare results to a baseline. a stage is a regression if it takes more than
+	(1 + threshold) times its time in the baseline ; stages that take less than
+	min_time in the baseline are ignored. the same goes for the peak RSS. the workloads
+	that are not in the baseline, or with another number of descs, are not compared.
+	:param baseline: results saved by a previous run (see measure())
+	:param results: the current results
+	:param threshold: the tolerated slowdown, as a fraction of the baseline
+	:param min_time: minimum time of a stage in the baseline, in seconds, for it to be compared
+	:return: list of messages describing the regressions ; empty if there is none
+	"""
+	regressions = []
+	for name, result in results.items():
+		reference = baseline.get(name)
+		if reference is None or reference["descs"] != result["descs"]:
+			continue
+		for stage, seconds in result["stages"].items():
+			before = reference["stages"].get(stage)
+			if before is not None and before >= min_time and seconds > before * (1 + threshold):
+				regressions.append(f"{name}: {stage} took {seconds:.3f} s instead of {before:.3f} s "
+								   f"(+{(seconds / before - 1) * 100:.0f}%)")
+		before = reference.get("peak_rss_kb")
+		if before and result["peak_rss_kb"] > before * (1 + threshold):
+			regressions.append(f"{name}: peak RSS is {result['peak_rss_kb']} kB instead of {before} kB "
+							   f"(+{(result['peak_rss_kb'] / before - 1) * 100:.0f}%)")
+	return regressions
+
+
+def report(results):
+	"""
+	print the results of measure()
+	:param results: dict mapping the name of each workload to its results
+	:return: None
+	"""
+	for name, result in results.items():
+		print(f"{name}: {result['catalogues']} catalogue(s), {result['descs']} descs, "
+			  f"{result['descs_per_sec']:.0f} descs/s, peak RSS {result['peak_rss_kb'] / 1024:.1f} MB")
+		for stage, seconds in result["stages"].items():
+			print(f"    {stage:<20} {seconds * 1000:10.1f} ms")
+	return None
+
+
+# ============== COMMAND LINE INTERFACE ============== #
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="benchmark the extraction pipeline of extractor_json.py")
+	parser.add_argument("-l", "--limit", type=int, default=None,
+						help="only use the first LIMIT files of the corpus ; default: every file")
+	parser.add_argument("--scales", type=int, nargs="*", default=[10, 100],
+						help="factors by which the synthetic catalogue is scaled ; default: 10 100")
+	parser.add_argument("--sample", default=None,
+						help="catalogue used to build the synthetic workloads ; default: the biggest catalogue with prices")
+	parser.add_argument("-r", "--repeat", type=int, default=3, help="number of runs ; the best one is kept")
+	parser.add_argument("--baseline", default=BASELINE, help="path of the JSON baseline ; default: bench_baseline.json")
+	parser.add_argument("--save", action="store_true", help="save the results as the new baseline")
+	parser.add_argument("--check", action="store_true",
+						help="exit with an error if the results regress beyond the threshold")
+	parser.add_argument("-t", "--threshold", type=float, default=THRESHOLD,
+						help="tolerated slowdown, as a fraction of the baseline ; default: 0.25")
+	args = parser.parse_args()
+
+	files = sorted(glob.glob(f"{curdir}/../Catalogues/**/*.xml", recursive=True))
+	sample = args.sample or max(priced_catalogues(files), key=os.path.getsize)
+	workloads = {"corpus": (files[:args.limit], 1)}
+	for factor in args.scales:
+		workloads[f"synthetic_x{factor}"] = ([sample], factor)
+
+	results = measure(workloads, args.repeat)
+	report(results)
+
+	if args.check:
+		with open(args.baseline, mode="r") as f:
+			regressions = compare(json.load(f), results, args.threshold)
+		if regressions:
+			print("\n".join(["REGRESSIONS:"] + regressions))
+			sys.exit(1)
+		print(f"no regression beyond {args.threshold * 100:.0f}% of the baseline")
+	if args.save:
+		with open(args.baseline, mode="w") as f:
+			json.dump(results, f, indent=4)
+		print(f"baseline saved to {args.baseline}")
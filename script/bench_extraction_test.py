@@ -0,0 +1,44 @@
+import unittest
+from lxml import etree
+
+from bench_extraction import *
+
+
+class Bench_extraction(unittest.TestCase):
+
+    catalogue = b"""<TEI xmlns="http://www.tei-c.org/ns/1.0" xml:id="CAT_000112">
+ <teiHeader><fileDesc><sourceDesc><bibl><date when="1887-11">Novembre 1887</date></bibl></sourceDesc></fileDesc></teiHeader>
+ <text><body><list>
+  <item n="18" xml:id="CAT_000112_e18">
+   <name type="author">Barry (Ch.)</name>
+   <desc xml:id="CAT_000112_e18_d1"><term ana="#document_type_7">L. a. s.</term> au colonel Fox</desc>
+   <measure commodity="currency" unit="FRF" quantity="15">15</measure>
+  </item>
+ </list></body></text>
+</TEI>"""
+
+    baseline = {"corpus": {"descs": 10, "stages": {"parse": 1.0, "serialization": 0.01}, "peak_rss_kb": 1000}}
+
+    def test_scale_catalogue(self):
+        scaled = scale_catalogue(self.catalogue, 3)
+        output_dict, catalog_dict = {}, {}
+        tree = etree.fromstring(scaled)
+        item_extractor(tree, output_dict)
+        catalog_extractor(tree, catalog_dict)
+        self.assertEqual(list(output_dict), ["CAT_000112_e18_d1", "CAT_000112_e18_d1_2", "CAT_000112_e18_d1_3"])
+        self.assertEqual(catalog_dict["CAT_000112"]["item_count"], 3)
+        self.assertEqual(len(catalog_dict["CAT_000112"]["high_price_items_c"]), 3)
+
+    def test_compare(self):
+        results = {"corpus": {"descs": 10, "stages": {"parse": 1.2, "serialization": 0.05}, "peak_rss_kb": 1100}}
+        self.assertEqual(compare(self.baseline, results), [])
+        results["corpus"]["stages"]["parse"] = 1.3
+        results["corpus"]["peak_rss_kb"] = 2000
+        self.assertEqual(len(compare(self.baseline, results)), 2)
+        # another corpus is not compared
+        results["corpus"]["descs"] = 20
+        self.assertEqual(compare(self.baseline, results), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
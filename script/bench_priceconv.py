@@ -0,0 +1,89 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# --------------------------------------------------------------------------------------------------
+# Katabase project: github.com/katabase/
+# Micro-benchmark comparing the price conversion functions of priceconv.py
+#
+# * PROCESS BREAKDOWN *
+# - a sample of (year, currency, price) tuples is built from the conversion tables ;
+# - the sample is converted with pconverter_franc() / pconverter_foreign() (which re-read
+#   the json tables on every call), with PriceConverter.convert(), with
+#   PriceConverter.convert_batch() and with PriceConverter.convert_array() (on numpy arrays,
+#   in 1900 francs and in 1914 francs) ;
+# - the results are checked for equality and the timings are printed.
+# usage: python3 bench_priceconv.py [-n NUMBER_OF_CONVERSIONS] [-r REPEAT]
+# --------------------------------------------------------------------------------------------------
+
+
+import argparse
+import random
+import timeit
+import numpy as np
+
+from priceconv import PriceConverter, pconverter_franc, pconverter_foreign
+
+
+def build_sample(converter, n):
+	"""
+	build a sample of n conversions to run: mostly prices in francs, with
+	some prices in foreign currencies, as in the catalogues.
+	:param converter: a PriceConverter
+	:param n: the number of (year, currency, price) tuples to build
+	:return: list of (year, currency, price) tuples ; years are strings, as in extractor_json.py
+	"""
+	rng = random.Random(1900)
+	choices = []  # every (year, currency) for which there is a price index
+	for currency, (base_year, rates) in converter.arrays.items():
+		choices += [(str(base_year + i), currency) for i, idx in enumerate(rates.tolist()) if idx == idx]  # NaN != NaN
+	francs = [c for c in choices if c[1] == "FRF"]
+	foreign = [c for c in choices if c[1] != "FRF"]
+	sample = []
+	for i in range(n):
+		year, currency = rng.choice(foreign) if i % 20 == 0 else rng.choice(francs)
+		sample.append((year, currency, float(rng.randint(1, 2000))))
+	return sample
+
+
+def per_call(sample):
+	"""
+	convert the sample the way extractor_json.py used to: one json read per price.
+	:param sample: list of (year, currency, price) tuples
+	:return: list of converted prices
+	"""
+	out = []
+	for year, currency, price in sample:
+		if currency == "FRF":
+			out.append(pconverter_franc(date=year, price=price))
+		else:
+			out.append(pconverter_foreign(currency=currency, date=year, price=price))
+	return out
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="compare the price conversion functions of priceconv.py")
+	parser.add_argument("-n", "--number", type=int, default=10000, help="number of conversions per run")
+	parser.add_argument("-r", "--repeat", type=int, default=3, help="number of runs ; the best one is kept")
+	args = parser.parse_args()
+
+	converter = PriceConverter()
+	sample = build_sample(converter, args.number)
+	assert per_call(sample) == converter.convert_batch(sample), "the conversion functions disagree"
+	years = np.array([int(year) for year, _, _ in sample])
+	currencies = np.array([currency for _, currency, _ in sample], dtype=object)
+	prices = np.array([price for _, _, price in sample])
+	assert converter.convert_array(years, currencies, prices).tolist() == converter.convert_batch(sample), \
+		"the conversion functions disagree"
+
+	timings = {
+		"pconverter_* (per call)": lambda: per_call(sample),
+		"PriceConverter.convert": lambda: [converter.convert(*row) for row in sample],
+		"PriceConverter.convert_batch": lambda: converter.convert_batch(sample),
+		"PriceConverter.convert_array": lambda: converter.convert_array(years, currencies, prices),
+		"convert_array (1914 francs)": lambda: converter.convert_array(years, currencies, prices, base=1914),
+	}
+	reference = None
+	for name, func in timings.items():
+		best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+		reference = reference or best
+		print(f"{name:<30} {best * 1000:10.2f} ms  {args.number / best:14.0f} conv/s  x{reference / best:.1f}")
@@ -0,0 +1,333 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# --------------------------------------------------------------------------------------------------
+# Katabase project: github.com/katabase/
+# Blocking index of the descs, to find the candidate pairs of the reconciliation (option --blocking)
+#
+# * PROCESS BREAKDOWN *
+# - the same document is often sold again in other catalogues ; instead of comparing every pair of
+#   descs, the descs are put in blocks and only the descs of a same block are compared. block_keys()
+#   gives the blocks of the descs of a file: the author of each desc (its wikidata id, or its
+#   normalised surname) with its term and format, its author with its date, and the bands of the
+#   MinHash signature of its text (LSH): two descs whose texts share many shingles (substrings of
+#   SHINGLE_SIZE characters) are likely to have the same values in at least one band ;
+# - minhash_signatures() computes the signatures of all the descs of a file at once, with NumPy ;
+# - BlockingStore keeps, for each desc, its blocks (as an array of 64-bit integers) and its signature
+#   in a SQLite database ; extractor_json.py calls BlockingStore.update() with the results of each file,
+#   and the rows of a file are only replaced if the file changed ; candidate_pairs() reads the blocks of
+#   every desc, sorts them to group the descs by block and yields each pair of descs of two different
+#   catalogues that share a block, the blocks bigger than max_block being skipped ;
+# - if __name__ == "__main__", the candidate pairs are printed as JSON Lines, with the similarity of
+#   the texts estimated from their signatures.
+# usage: python3 blocking.py [--db ../output/blocking.sqlite] [--max-block 100] [--min-similarity 0.5]
+# --------------------------------------------------------------------------------------------------
+
+
+import os
+import re
+import sys
+import json
+import sqlite3
+import hashlib
+import argparse
+import unicodedata
+from itertools import islice
+import numpy as np
+
+
+curdir = os.path.abspath(os.path.dirname(os.path.abspath(__file__)))
+
+SHINGLE_SIZE = 4  # number of characters of the shingles
+BANDS, ROWS = 16, 4  # the signatures have BANDS * ROWS values, cut in BANDS bands of ROWS values
+MAX_BLOCK = 100  # default maximum size of the blocks whose pairs are compared
+BATCH_SIZE = 128  # number of texts whose signatures are computed together (see minhash_signatures())
+EMPTY = np.uint32(0xFFFFFFFF)  # value of the signatures of the texts without shingles
+# coefficients of the BANDS * ROWS hash functions of the shingles, (a * x + b) >> 32 modulo 2 ** 64 with an
+# odd a (multiply-shift hashing), and of the hash of the bands ; the seed is fixed, so that the signatures
+# and the blocks of two runs can be compared
+_generator = np.random.default_rng(1887)
+HASH_A = _generator.integers(0, 1 << 63, size=BANDS * ROWS, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+HASH_B = _generator.integers(0, 1 << 63, size=BANDS * ROWS, dtype=np.uint64)
+BAND_MIX = _generator.integers(0, 1 << 63, size=(BANDS, ROWS + 1), dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+word_pattern = re.compile(r"[^\W_]+")
+# letters that are not split into a letter and an accent by the NFKD normalisation
+ligatures = str.maketrans({"œ": "oe", "æ": "ae", "ø": "o", "đ": "d", "ł": "l"})
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+	source TEXT PRIMARY KEY,
+	hash TEXT
+);
+CREATE TABLE IF NOT EXISTS descs (
+	desc_id TEXT PRIMARY KEY,
+	cat_id TEXT,
+	source TEXT NOT NULL,
+	signature BLOB,
+	keys BLOB
+);
+CREATE INDEX IF NOT EXISTS descs_source ON descs(source);
+"""
+
+
+# ============== SIGNATURES ============== #
+def normalise(text):
+	"""
+	normalise a text to compare it: in ASCII, without accents, in lower case, the words being
+	separated by one space
+	:param text: a string, or None
+	:return: the normalised string ("" for None)
+	"""
+	if not text:
+		return ""
+	text = unicodedata.normalize("NFKD", text.casefold().translate(ligatures))
+	return " ".join(word_pattern.findall(text.encode("ascii", "ignore").decode("ascii")))
+
+
+def shingles(text):
+	"""
+	:param text: a normalised text (see normalise())
+	:return: array of the distinct shingles of the text: each substring of SHINGLE_SIZE characters,
+			 as the integer made of its bytes ; a shorter text is its own shingle
+	"""
+	data = np.frombuffer(text.encode("ascii"), dtype=np.uint8).astype(np.uint64)
+	if len(data) < SHINGLE_SIZE:
+		return np.array([int.from_bytes(text.encode("ascii"), "big")] if text else [], dtype=np.uint64)
+	values = np.zeros(len(data) - SHINGLE_SIZE + 1, dtype=np.uint64)
+	for i in range(SHINGLE_SIZE):
+		values = (values << np.uint64(8)) | data[i:len(data) - SHINGLE_SIZE + 1 + i]
+	return np.unique(values)
+
+
+def minhash_signatures(texts, batch_size=BATCH_SIZE):
+	"""
+	compute the MinHash signatures of several texts at once: for each of the BANDS * ROWS hash
+	functions, the minimum of the hashes of the shingles of the text
+	:param texts: list of normalised texts
+	:param batch_size: number of texts whose shingles are hashed together
+	:return: array of shape (len(texts), BANDS * ROWS), of uint32 ; the signature of a text without
+			 shingles is made of EMPTY values
+	"""
+	signatures = np.full((len(texts), BANDS * ROWS), EMPTY, dtype=np.uint32)
+	for first in range(0, len(texts), batch_size):
+		sets = [shingles(text) for text in texts[first:first + batch_size]]
+		lengths = np.array([len(s) for s in sets])
+		nonempty = lengths > 0
+		if not nonempty.any():
+			continue
+		values = np.concatenate(sets)
+		# hashes of every shingle by every function, then the minimum over the shingles of each text
+		hashed = ((HASH_A[:, None] * values[None, :] + HASH_B[:, None]) >> np.uint64(32)).astype(np.uint32)
+		starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))[nonempty]
+		signatures[first:first + len(sets)][nonempty] = np.minimum.reduceat(hashed, starts, axis=1).T
+	return signatures
+
+
+def similarity(signature, other):
+	"""
+	:param signature: a MinHash signature, or an array of signatures (one per row)
+	:param other: another MinHash signature, or an array of as many signatures
+	:return: the estimated Jaccard similarity of the shingles of the two texts (an array of
+			 similarities for arrays of signatures)
+	"""
+	similarities = np.mean(signature == other, axis=-1)
+	return float(similarities) if np.ndim(similarities) == 0 else similarities
+
+
+# ============== BLOCKS ============== #
+def key_hash(key):
+	"""
+	:param key: a block key, as a string
+	:return: the key as a signed 64-bit integer
+	"""
+	return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big", signed=True)
+
+
+def block_keys(output_dict, signatures):
+	"""
+	get the blocks of the descs of a file
+	:param output_dict: the data on the descs of the file, from item_extractor()
+	:param signatures: the MinHash signatures of the texts of the descs, in the same order
+	:return: list of the blocks of each desc, in the same order, as arrays of 64-bit integers
+	"""
+	# the key of the band of a signature is a hash of its ROWS values and of the number of the band
+	bands = signatures.reshape(len(signatures), BANDS, ROWS)
+	band_keys = (bands.astype(np.uint64) * BAND_MIX[:, :ROWS]).sum(axis=2, dtype=np.uint64) + BAND_MIX[:, ROWS]
+	band_keys = band_keys.view(np.int64)
+	keys = []
+	for data, signature, desc_band_keys in zip(output_dict.values(), signatures, band_keys):
+		desc_keys = []
+		author = data["author_wikidata_id"] or normalise(data["author"])
+		if author:
+			desc_keys.append(key_hash(f"author:{author}|{data['term']}|{data['format']}"))
+			if data["date"] is not None:
+				desc_keys.append(key_hash(f"date:{author}|{data['date']}"))
+		desc_keys = np.array(desc_keys, dtype=np.int64)
+		# the texts without shingles share no band
+		if signature[0] != EMPTY:
+			desc_keys = np.concatenate((desc_keys, desc_band_keys))
+		keys.append(desc_keys)
+	return keys
+
+
+# ============== INDEX ============== #
+class BlockingStore:
+	"""
+	SQLite database holding the blocks of the descs and their signatures. used as a context manager,
+	the changes are committed if no exception is raised, else rolled back.
+	"""
+	def __init__(self, path):
+		"""
+		:param path: path to the database ; it is created if it doesn't exist
+		"""
+		self.path = path
+		self.connection = sqlite3.connect(path)
+		self.connection.executescript(SCHEMA)
+		self.updated = 0  # number of files whose rows were replaced
+		self.skipped = 0  # number of files that were unchanged
+
+	def update(self, source, output_dict, catalog_dict, source_hash=None):
+		"""
+		replace the blocks and the signatures of the descs of an XML file
+		:param source: the path of the XML file, relative to Catalogues/
+		:param output_dict: the items of the file, as returned by item_extractor()
+		:param catalog_dict: the catalogue data of the file, as returned by catalog_extractor()
+		:param source_hash: a hash of the file and of the extraction ; if it is the same as
+							the one stored, the rows of the file are left as they are
+		:return: True if the rows were replaced, False if the file was unchanged
+		"""
+		row = self.connection.execute("SELECT hash FROM sources WHERE source = ?", (source,)).fetchone()
+		if source_hash is not None and row is not None and row[0] == source_hash:
+			self.skipped += 1
+			return False
+		self.delete(source)
+		cat_id = next(iter(catalog_dict), None)
+		signatures = minhash_signatures([normalise(data["desc"]) for data in output_dict.values()])
+		# the blocks of each desc are stored with it, as one array: the descs are only grouped by
+		# block when the candidate pairs are read (see candidate_pairs())
+		self.connection.executemany(
+			"INSERT INTO descs (desc_id, cat_id, source, signature, keys) VALUES (?, ?, ?, ?, ?)",
+			((desc_id, cat_id, source, signature.tobytes(), keys.tobytes()) for desc_id, signature, keys
+			 in zip(output_dict, signatures, block_keys(output_dict, signatures)))
+		)
+		self.connection.execute("INSERT OR REPLACE INTO sources (source, hash) VALUES (?, ?)", (source, source_hash))
+		self.updated += 1
+		return True
+
+	def delete(self, source):
+		"""
+		delete the rows of an XML file
+		:param source: the path of the XML file, relative to Catalogues/
+		:return: None
+		"""
+		self.connection.execute("DELETE FROM descs WHERE source = ?", (source,))
+		self.connection.execute("DELETE FROM sources WHERE source = ?", (source,))
+		return None
+
+	def prune(self, sources):
+		"""
+		delete the rows of the XML files that are not in `sources`
+		:param sources: the paths of the current XML files, relative to Catalogues/
+		:return: the number of files whose rows were deleted
+		"""
+		sources = set(sources)
+		stored = [row[0] for row in self.connection.execute("SELECT source FROM sources")]
+		deleted = [source for source in stored if source not in sources]
+		for source in deleted:
+			self.delete(source)
+		return len(deleted)
+
+	def commit(self):
+		self.connection.commit()
+		self.connection.close()
+
+	def abort(self):
+		self.connection.rollback()
+		self.connection.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, exc_traceback):
+		if exc_type is None:
+			self.commit()
+		else:
+			self.abort()
+		return False
+
+
+# ============== CANDIDATE PAIRS ============== #
+def candidate_pairs(path, max_block=MAX_BLOCK):
+	"""
+	get the pairs of descs of two different catalogues that share at least one block ; the
+	blocks of more than max_block descs (the most common authors, the most common short texts...)
+	are skipped, so that the number of pairs grows with the number of descs, not with its square
+	:param path: path to the database
+	:param max_block: the maximum number of descs of a block
+	:return: generator of (desc_id, desc_id) tuples, each pair being yielded once
+	"""
+	connection = sqlite3.connect(path)
+	try:
+		rows = connection.execute("SELECT desc_id, cat_id, keys FROM descs ORDER BY rowid").fetchall()
+	finally:
+		connection.close()
+	if not rows:
+		return
+	desc_ids = [row[0] for row in rows]
+	cat_ids = [row[1] for row in rows]
+	keys = [np.frombuffer(row[2], dtype=np.int64) for row in rows]
+	# one (key, desc) entry per block of each desc, sorted by key: the descs of a block are contiguous
+	owners = np.repeat(np.arange(len(keys)), [len(desc_keys) for desc_keys in keys])
+	keys = np.concatenate(keys)
+	order = np.lexsort((owners, keys))
+	keys, owners = keys[order], owners[order]
+	bounds = np.flatnonzero(np.diff(keys)) + 1
+	starts = np.concatenate(([0], bounds))
+	ends = np.concatenate((bounds, [len(keys)]))
+	sizes = ends - starts
+	seen = set()
+	for start, end in zip(starts[(sizes > 1) & (sizes <= max_block)].tolist(),
+						  ends[(sizes > 1) & (sizes <= max_block)].tolist()):
+		members = owners[start:end].tolist()
+		for i, desc in enumerate(members):
+			for other in members[i + 1:]:
+				if cat_ids[desc] != cat_ids[other] and (desc, other) not in seen:
+					seen.add((desc, other))
+					yield desc_ids[desc], desc_ids[other]
+
+
+def signatures(path):
+	"""
+	:param path: path to the database
+	:return: dict mapping the @xml:id of each desc to its MinHash signature
+	"""
+	connection = sqlite3.connect(path)
+	try:
+		return {desc_id: np.frombuffer(signature, dtype=np.uint32)
+				for desc_id, signature in connection.execute("SELECT desc_id, signature FROM descs")}
+	finally:
+		connection.close()
+
+
+# ============== COMMAND LINE INTERFACE ============== #
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="print the candidate pairs of the blocking index written by "
+												 "extractor_json.py --blocking")
+	parser.add_argument("--db", default=f"{curdir}/../output/blocking.sqlite",
+						help="path to the database ; default: output/blocking.sqlite")
+	parser.add_argument("--max-block", type=int, default=MAX_BLOCK,
+						help=f"maximum number of descs of the blocks that are compared ; default: {MAX_BLOCK}")
+	parser.add_argument("--min-similarity", type=float, default=0.0,
+						help="minimum estimated similarity of the texts of the pairs ; default: 0")
+	args = parser.parse_args()
+
+	desc_signatures = signatures(args.db)
+	pairs = candidate_pairs(args.db, args.max_block)
+	# the similarities are computed for BATCH_SIZE * 64 pairs at once
+	for batch in iter(lambda: list(islice(pairs, BATCH_SIZE * 64)), []):
+		scores = similarity(np.stack([desc_signatures[desc_id] for desc_id, _ in batch]),
+							np.stack([desc_signatures[other_id] for _, other_id in batch]))
+		sys.stdout.write("".join(
+			json.dumps({"desc_id": desc_id, "other_id": other_id, "similarity": score}) + "\n"
+			for (desc_id, other_id), score in zip(batch, scores.tolist()) if score >= args.min_similarity
+		))
@@ -0,0 +1,85 @@
+import os
+import glob
+import tempfile
+import unittest
+import numpy as np
+from lxml import etree
+
+from extractor_json import item_extractor, catalog_extractor, curdir
+from blocking import *
+
+
+def desc(text, author="HUGO", wikidata=None, term=7, format=4, date="1850"):
+    # the data of a desc, with the keys read by block_keys()
+    return {"desc": text, "author": author, "author_wikidata_id": wikidata, "term": term, "format": format,
+            "date": date}
+
+
+class Blocking_index(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db = os.path.join(self.tmpdir.name, "blocking.sqlite")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_normalise(self):
+        self.assertEqual(normalise("Lettre autographe signée à M. Œuvre,  1er août"),
+                         "lettre autographe signee a m oeuvre 1er aout")
+        self.assertEqual(normalise(None), "")
+
+    def test_signatures(self):
+        texts = [normalise(text) for text in ["L. a. s. à son éditeur, 2 p. in-8", "", "ab",
+                                              "L. a. s. a son editeur ; 2 p. in-8"]]
+        # the signatures don't depend on the texts computed together
+        together = minhash_signatures(texts, batch_size=3)
+        self.assertTrue((together == np.vstack([minhash_signatures([text]) for text in texts])).all())
+        self.assertTrue((together[1] == EMPTY).all())
+        self.assertEqual(similarity(together[0], together[3]), 1.0)
+        self.assertLess(similarity(together[0], together[2]), 0.5)
+
+    def test_blocks(self):
+        text = "Lettre autographe signée à son éditeur, relative à l'impression des Contemplations, 2 p. in-8"
+        output_dict = {"a": desc(text), "b": desc(text.replace("2 p.", "3 p."), author="Hugo", date=None),
+                       "c": desc("Pièce signée sur vélin, contresignée par un secrétaire d'état", author=None)}
+        signatures = minhash_signatures([normalise(data["desc"]) for data in output_dict.values()])
+        a, b, c = block_keys(output_dict, signatures)
+        self.assertEqual((len(a), len(b), len(c)), (2 + BANDS, 1 + BANDS, BANDS))
+        # same author, term and format, and similar texts: at least two blocks in common
+        self.assertGreater(len(set(a.tolist()) & set(b.tolist())), 1)
+        self.assertFalse(set(a.tolist()) & set(c.tolist()))
+
+    def test_candidate_pairs(self):
+        text = "Lettre autographe signée à son éditeur, relative à l'impression des Contemplations"
+        with BlockingStore(self.db) as store:
+            store.update("1.xml", {"1_a": desc(text), "1_b": desc(text)}, {"CAT_1": {}})
+            store.update("2.xml", {"2_a": desc(text), "2_b": desc("Pièce signée", author="DUMAS")}, {"CAT_2": {}})
+            store.update("3.xml", {"3_a": desc("Pièce signée", author="DUMAS", date="1860")}, {"CAT_3": {}})
+        # the descs of a same catalogue are never paired
+        self.assertEqual(sorted(candidate_pairs(self.db)), [("1_a", "2_a"), ("1_b", "2_a"), ("2_b", "3_a")])
+        # the blocks of more than max_block descs are skipped
+        self.assertEqual(sorted(candidate_pairs(self.db, max_block=2)), [("2_b", "3_a")])
+
+    def test_incremental(self):
+        results = {}
+        for file in sorted(glob.glob(f"{curdir}/../Catalogues/101-200/*.xml"))[:6]:
+            tree = etree.parse(file)
+            results[os.path.basename(file)] = (item_extractor(tree, {}), catalog_extractor(tree, {}))
+        sources = list(results)
+        with BlockingStore(self.db) as store:
+            for source, (output_dict, catalog_dict) in results.items():
+                self.assertTrue(store.update(source, output_dict, catalog_dict, source_hash="1"))
+        pairs = set(map(frozenset, candidate_pairs(self.db)))
+        self.assertTrue(pairs)
+        with BlockingStore(self.db) as store:
+            self.assertFalse(store.update(sources[0], *results[sources[0]], source_hash="1"))
+            self.assertTrue(store.update(sources[1], *results[sources[1]], source_hash="2"))
+            self.assertEqual(store.prune(sources[:-1]), 1)
+        removed = set(results[sources[-1]][0])
+        self.assertEqual(set(map(frozenset, candidate_pairs(self.db))), {pair for pair in pairs if not removed & pair})
+        self.assertEqual(set(signatures(self.db)), set().union(*(results[s][0] for s in sources[:-1])))
+
+
+if __name__ == '__main__':
+    unittest.main()
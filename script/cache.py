@@ -0,0 +1,146 @@
+# coding: utf-8
+
+# --------------------------------------------------------------------------------------------------
+# Katabase project: github.com/katabase/
+# On-disk cache of the extraction results, to only re-extract the catalogues that changed
+#
+# * PROCESS BREAKDOWN *
+# - for each XML file in Catalogues/, the cache stores a JSON entry (in cache/, next to output/,
+#   with the same subfolders as in Catalogues/) holding the results of item_extractor() and
+#   catalog_extractor() for this file, the sha256 of the file's content, the version of the
+#   extractor and the fingerprint of the price tables of the currencies used in the file ;
+# - ExtractionCache.lookup() returns the cached results of a file if they are still valid:
+#   the file's content and the extractor are unchanged and, if the file has prices, the price
+#   tables of its currencies are unchanged (a file without prices is never invalidated by a
+#   change in the price tables) ;
+# - ExtractionCache.store() saves the results of a file and ExtractionCache.prune() deletes
+#   the entries of the files that no longer exist.
+# --------------------------------------------------------------------------------------------------
+
+
+import os
+import json
+import hashlib
+
+from records import json_default
+
+
+# subfolders of the cache directory used by the other modules: the skeletons of the catalogues
+# (skeleton.py) and the indexes of reader.py
+OTHER_CACHES = {"skeletons", "reader"}
+
+
+class ExtractionCache:
+	"""
+	per-file cache of the extraction results, keyed by the content hash of each XML file.
+	"""
+	def __init__(self, cache_dir, source_dir, extractor_version, converter):
+		"""
+		:param cache_dir: the directory in which the cache entries are stored
+		:param source_dir: the directory containing the XML catalogues (Catalogues/)
+		:param extractor_version: the version of the extractor ; when it changes, all the entries are outdated
+		:param converter: the priceconv.PriceConverter used to convert the prices
+		"""
+		self.cache_dir = os.path.abspath(cache_dir)
+		self.source_dir = os.path.abspath(source_dir)
+		self.extractor_version = extractor_version
+		self.converter = converter
+		self.hits = 0  # number of files whose results were found in the cache
+		self.misses = 0  # number of files that must be (re)extracted
+
+	def entry_path(self, file):
+		"""
+		get the path of the cache entry of an XML file
+		:param file: path to an XML catalogue
+		:return: path to the JSON cache entry
+		"""
+		relpath = os.path.relpath(os.path.abspath(file), self.source_dir)
+		return os.path.join(self.cache_dir, os.path.splitext(relpath)[0] + ".json")
+
+	@staticmethod
+	def file_hash(file):
+		"""
+		:param file: path to a file
+		:return: the sha256 of the file's content
+		"""
+		with open(file, mode="rb") as f:
+			return hashlib.sha256(f.read()).hexdigest()
+
+	@staticmethod
+	def currencies(output_dict, catalog_dict):
+		"""
+		get the currencies whose price table was used to extract a file
+		:param output_dict: the items of a file, as returned by item_extractor()
+		:param catalog_dict: the catalogue data of a file, as returned by catalog_extractor()
+		:return: sorted list of currency codes
+		"""
+		currencies = {data["currency"] for data in output_dict.values() if "currency" in data}
+		currencies |= {data["currency"] for data in catalog_dict.values() if "currency" in data}
+		return sorted(currencies)
+
+	def lookup(self, file, digest=None):
+		"""
+		get the cached results of an XML file, if they are still valid
+		:param file: path to an XML catalogue
+		:param digest: the sha256 of the file, if it has already been calculated
+		:return: tuple of (output_dict, catalog_dict), or None if the file must be extracted
+		"""
+		digest = digest or self.file_hash(file)
+		try:
+			with open(self.entry_path(file), mode="r") as f:
+				entry = json.load(f)
+		except (OSError, ValueError):
+			entry = None
+		if entry is None \
+				or entry["hash"] != digest \
+				or entry["extractor_version"] != self.extractor_version \
+				or any(self.converter.hashes.get(c) != h for c, h in entry["tables"].items()):
+			self.misses += 1
+			return None
+		self.hits += 1
+		return entry["items"], entry["catalog"]
+
+	def store(self, file, output_dict, catalog_dict, digest=None):
+		"""
+		save the results of an XML file in the cache ; the entry is written to a temporary
+		file first, so that an interrupted run never leaves a corrupted entry.
+		:param file: path to an XML catalogue
+		:param output_dict: the items of the file, as returned by item_extractor()
+		:param catalog_dict: the catalogue data of the file, as returned by catalog_extractor()
+		:param digest: the sha256 of the file, if it has already been calculated
+		:return: None
+		"""
+		entry = {
+			"source": os.path.relpath(os.path.abspath(file), self.source_dir),
+			"hash": digest or self.file_hash(file),
+			"extractor_version": self.extractor_version,
+			"tables": {c: self.converter.hashes.get(c)
+					   for c in self.currencies(output_dict, catalog_dict)},
+			"items": output_dict,
+			"catalog": catalog_dict
+		}
+		path = self.entry_path(file)
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		with open(f"{path}.tmp", mode="w") as f:
+			json.dump(entry, f, default=json_default)
+		os.replace(f"{path}.tmp", path)
+		return None
+
+	def prune(self, files):
+		"""
+		delete the cache entries of the XML files that are not in `files` anymore
+		:param files: list of paths to the current XML catalogues
+		:return: the number of deleted entries
+		"""
+		keep = {self.entry_path(file) for file in files}
+		deleted = 0
+		for dirpath, dirnames, filenames in os.walk(self.cache_dir):
+			if dirpath == self.cache_dir:
+				# the other caches kept in the cache directory are pruned by their own modules
+				dirnames[:] = [d for d in dirnames if d not in OTHER_CACHES]
+			for filename in filenames:
+				path = os.path.join(dirpath, filename)
+				if path not in keep:
+					os.remove(path)
+					deleted += 1
+		return deleted
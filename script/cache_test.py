@@ -0,0 +1,77 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from priceconv import PriceConverter, curdir
+from cache import ExtractionCache
+
+
+class Extraction_cache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmpdir, "Catalogues")
+        os.makedirs(os.path.join(self.source, "1-100"))
+        self.franc = os.path.join(self.tmpdir, "franc.json")
+        self.foreign = os.path.join(self.tmpdir, "foreign.json")
+        shutil.copy(f"{curdir}/tables/price_index_franc.json", self.franc)
+        shutil.copy(f"{curdir}/tables/price_index_foreign.json", self.foreign)
+        self.converter = PriceConverter(franc_path=self.franc, foreign_path=self.foreign)
+        self.cache = self.new_cache()
+        self.priced = self.write("CAT_000001.xml", "<TEI/>")
+        self.unpriced = self.write("CAT_000002.xml", "<TEI></TEI>")
+        self.priced_items = {"CAT_000001_e1_d1": {"currency": "GBP", "price": 2.0, "price_c": 50.42}}
+        self.unpriced_items = {"CAT_000002_e1_d1": {"price": None}}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def new_cache(self, version="1"):
+        return ExtractionCache(cache_dir=os.path.join(self.tmpdir, "cache"), source_dir=self.source,
+                               extractor_version=version, converter=self.converter)
+
+    def write(self, name, content):
+        path = os.path.join(self.source, "1-100", name)
+        with open(path, mode="w") as f:
+            f.write(content)
+        return path
+
+    def test_lookup(self):
+        self.assertIsNone(self.cache.lookup(self.priced))
+        self.cache.store(self.priced, self.priced_items, {"CAT_000001": {}})
+        self.assertEqual(self.cache.lookup(self.priced), (self.priced_items, {"CAT_000001": {}}))
+        self.write("CAT_000001.xml", "<TEI xml:id='CAT_000001'/>")
+        self.assertIsNone(self.cache.lookup(self.priced))
+
+    def test_extractor_version(self):
+        self.cache.store(self.unpriced, self.unpriced_items, {})
+        self.assertIsNone(self.new_cache(version="2").lookup(self.unpriced))
+
+    def test_only_priced_entries_invalidated(self):
+        self.cache.store(self.priced, self.priced_items, {})
+        self.cache.store(self.unpriced, self.unpriced_items, {})
+        with open(self.foreign, mode="w") as f:
+            json.dump({"GBP": {"1904": 25}, "USD": {"1926": 2.5}}, f)
+        os.utime(self.foreign, ns=(0, 0))
+        self.converter.refresh()
+        self.assertIsNone(self.cache.lookup(self.priced))
+        self.assertEqual(self.cache.lookup(self.unpriced), (self.unpriced_items, {}))
+
+    def test_prune(self):
+        self.cache.store(self.priced, self.priced_items, {})
+        self.cache.store(self.unpriced, self.unpriced_items, {})
+        self.assertEqual(self.cache.prune([self.unpriced]), 1)
+        self.assertFalse(os.path.isfile(self.cache.entry_path(self.priced)))
+        self.assertTrue(os.path.isfile(self.cache.entry_path(self.unpriced)))
+        # the skeletons and the reader indexes in the same directory are left alone
+        skeleton = os.path.join(self.tmpdir, "cache", "skeletons", "1-100", "CAT_000003.skel")
+        os.makedirs(os.path.dirname(skeleton))
+        open(skeleton, mode="w").close()
+        self.assertEqual(self.cache.prune([self.unpriced]), 0)
+        self.assertTrue(os.path.isfile(skeleton))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,263 @@
+import re
+import glob
+import unittest
+from statistics import mean, median, mode, pvariance
+from lxml import etree
+
+from extractor_json import *
+from priceconv import pconverter_foreign, pconverter_franc
+
+
+# ============== REFERENCE IMPLEMENTATION ============== #
+# item_extractor() and catalog_extractor() as they were before the XPath expressions
+# were compiled and the fields extracted in a single pass: the current extractors
+# must give exactly the same results on every catalogue. legacy_item_extractor() strips the
+# tags of the descs, which hides the tei:measures inside the descs from legacy_catalog_extractor():
+# the current extractors don't modify the tree, which gives the same catalogues on this corpus,
+# where no price is inside a desc.
+# the only intended differences with the reference are the prices of the items in the statistics of
+# the catalogues, since version 4 of the extractor (see item_price_extractor()): the prices of an item
+# with several prices are added up (the reference only kept the last one) and a @quantity such as ".3"
+# is read as a float (the reference counted it as 0). CATALOGUE_PRICE_DELTAS holds every item of the
+# corpus whose price changed, with its new price (and the price of the reference as a comment).
+CATALOGUE_PRICE_DELTAS = {
+    "CAT_000047_e9": 0.3,  # 0
+    "CAT_000047_e10": 0.1,  # 0
+    "CAT_000047_e141": 0.4,  # 0
+    "CAT_000047_e217": 0.1,  # 0
+    "CAT_000047_e219": 0.3,  # 0
+    "CAT_000047_e227": 0.4,  # 0
+    "CAT_000047_e230": 0.5,  # 0
+    "CAT_000047_e240": 0.5,  # 0
+    "CAT_000047_e243": 0.3,  # 0
+    "CAT_000156_e9": 0.15,  # 0
+    "CAT_000169_e291": 16.0,  # 8
+    "CAT_000175_e12": 9.0,  # 5
+    "CAT_000175_e34": 16.0,  # 12
+    "CAT_000175_e58": 120.0,  # 30
+    "CAT_000175_e126": 18.0,  # 10
+    "CAT_000175_e148": 50.0,  # 20
+    "CAT_000175_e192": 60.0,  # 50
+    "CAT_000175_e268": 50.0,  # 40
+    "CAT_000175_e270": 70.0,  # 60
+    "CAT_000393_e4062": 33.0,  # 2.5
+}
+
+
+def legacy_item_extractor(tree, output_dict):
+    """
+    This function extracts all the data from each item's desc and adds it to a dictionnary (desc) ;
+    in the end, it appends desc to the dictionnary.
+    prices are expressed:
+    - in their original form (without inflation into account and in their original
+      currency): data["price"]
+    - in constant francs (at 1900 rate): data["price_c"]
+    :param tree: an XML tree
+    :param output_dict: the dictionnary on which every XML file's desc is stored
+    :return: updated dictionnary
+    """
+    # get the sale date to convert prices
+    if tree.xpath('./tei:teiHeader//tei:sourceDesc//tei:date[@when]',
+                  namespaces=ns):
+        sell_date = tree.xpath('.//tei:teiHeader//tei:sourceDesc//tei:date[@when]',
+                               namespaces=ns)[0].text
+    elif tree.xpath('tei:TEI/tei:teiHeader//tei:sourceDesc//tei:date[@to]', namespaces=ns):
+        sell_date = tree.xpath('tei:TEI/tei:teiHeader//tei:sourceDesc//tei:date/@to',
+                               namespaces=ns)[0].text
+    else:
+        print("No sell date for " + tree.xpath("@xml:id", namespaces=ns)[0])
+        sell_date = None
+    if sell_date is not None:
+        sell_year = re.findall(r"\d{4}", sell_date)[0]
+    else:
+        sell_year = None
+    # For each desc, a dict retrieve all the data.
+    for desc in tree.xpath('.//tei:text//tei:item//tei:desc', namespaces=ns):
+        data = {}
+        desc_id = desc.xpath('./@xml:id', namespaces=ns)[0]  # get the item's ID
+        if desc.xpath('parent::tei:item/tei:measure[@quantity]', namespaces=ns):  # si il y a un prix, le récupérer
+            price = to_float(desc.xpath('parent::tei:item//tei:measure[@commodity="currency"]/@quantity', namespaces=ns)[0])
+            currency = desc.xpath('parent::tei:item//tei:measure[@commodity="currency"]/@unit', namespaces=ns)[0]
+            data["currency"] = currency
+            data["price"] = price
+            # convert the prices to express them in constant francs (at the 1900 rate)
+            if sell_year is not None and price is not None:
+                if currency == "FRF":
+                    price_c = pconverter_franc(date=sell_year, price=price)
+                else:
+                    price_c = pconverter_foreign(currency=currency, date=sell_year, price=price)
+                data["price_c"] = price_c
+        else:
+            data["price"] = None
+        if desc.xpath('parent::tei:item/tei:name[@type="author"]/text()', namespaces=ns):  # get the author's surname
+            author = desc.xpath('parent::tei:item/tei:name[@type="author"]/text()', namespaces=ns)[0]
+            try:
+                # We only keep the surname of the author : we stop the match at the first
+                # parenthesis or dot and we keep the first match.
+                author = re.match(r'^([^\(|.|,|;|-]+)', author)[1]
+                # We remove blankspaces.
+                author = author.strip()
+            except:
+                author = None
+            data["author"] = author
+        else:
+            data["author"] = None
+        try:
+            author_wikidata_id = desc.xpath("parent::tei:item/tei:name/@ref", namespaces=ns)[0]
+        except IndexError:
+            author_wikidata_id = None
+        data["author_wikidata_id"] = author_wikidata_id
+        if desc.xpath('./tei:date[@when]', namespaces=ns):  # récupérer la date si elle existe
+            data["date"] = desc.xpath('./tei:date/@when', namespaces=ns)[0]
+        else:
+            data["date"] = None
+        if desc.xpath('./tei:measure[@type="length"]', namespaces=ns):
+            data["number_of_pages"] = to_float(desc.xpath('./tei:measure[@type="length"]/@n', namespaces=ns)[0])
+        else:
+            data["number_of_pages"] = None
+        if desc.xpath('./tei:measure[@type="format"]', namespaces=ns):  # récupérer le format XML normalisé si il existe
+            desc_format = desc.xpath('./tei:measure[@type="format"]/@ana', namespaces=ns)[0]
+            data["format"] = get_numbers(str(desc_format))
+        else:
+            data["format"] = None
+        if desc.xpath('./tei:term', namespaces=ns):  # récupérer les termes normalisés
+            desc_term = desc.xpath('./tei:term/@ana', namespaces=ns)[0]
+            data["term"] = get_numbers(str(desc_term))
+        else:
+            data["term"] = None
+        if sell_date is not None:
+            data["sell_date"] = sell_date
+        # In order to check the data, we add its text (and only its text with .strip_tags) in the dict.
+        etree.strip_tags(desc, '{http://www.tei-c.org/ns/1.0}*')
+        data["desc"] = desc.text
+
+        # update the main dictionnary with the data of this file and return
+        output_dict[desc_id] = data
+    return output_dict
+
+
+def legacy_catalog_extractor(tree, catalog_dict):
+    """
+    function to extract data on each catalogue and store it in a json file : year, number of items sold,
+    stats about the item's price...
+    all prices are expressed in francs at the 1900 rate, EVEN the prices in foreign currencies,
+    EVEN if "currency" is not in francs. the "_c" suffix signals that the prices are expressed
+    in constant francs.
+    :param tree: a catalog in XML format parsed with lxml
+    :param catalog_dict: a dictionnary to store all the data
+    :return: updated version of catalog_dict ; type dict, obviously
+    """
+    data = {}  # dictionary to store all the data on a catalog
+    # retrieve the title, sale date and number of entries in the catalog
+    if tree.xpath(".//tei:titleStmt//tei:title", namespaces=ns):
+        data["title"] = tree.xpath(".//tei:titleStmt//tei:title", namespaces=ns)[0].text
+    if tree.xpath(".//tei:sourceDesc/tei:bibl/@ana", namespaces=ns):
+        data["cat_type"] = tree.xpath(".//tei:sourceDesc/tei:bibl/@ana", namespaces=ns)[0]
+    if tree.xpath('.//tei:bibl/tei:date[@when]', namespaces=ns):
+        date = tree.xpath('.//tei:bibl/tei:date/@when', namespaces=ns)[0]
+        data["sell_date"] = date
+    elif tree.xpath(".//.//tei:bibl/tei:date/text()", namespaces=ns):
+        date = tree.xpath('.//tei:bibl//tei:date/text()', namespaces=ns)[0]
+        data["sell_date"] = date
+    if tree.xpath(".//tei:body//tei:item", namespaces=ns):
+        data["item_count"] = int(tree.xpath("count(.//tei:body//tei:item)", namespaces=ns))
+
+    # if the catalog is a fixed-price catalog (has "tei//item//tei:measure[@commodity='currency']",
+    # extract data about the prices
+    if tree.xpath(".//tei:body//tei:item[.//tei:measure/@commodity='currency']", namespaces=ns):
+        date = re.findall(r"\d{4}", date)[0]  # year of the sell date to convert the price to fixed price
+        # get the currency in which the catalog items are sold
+        if tree.xpath(".//tei:body//tei:item//tei:measure[@commodity]/@unit", namespaces=ns):
+            currency = tree.xpath(".//tei:body//tei:item//tei:measure[@commodity]/@unit", namespaces=ns)[0]
+            data["currency"] = currency
+        ipdict = {}  # dictionnary linking a tei:item's @xml:id to its price
+        plist = []  # list of the prices in one catalog
+        big = {}  # dictionnary to host all the most expensive items in a catalog
+        for item in tree.xpath(".//tei:body//tei:item[.//tei:measure/@commodity='currency']", namespaces=ns):
+            # if an item only has one price, extract it ; we try to get the price from the @quantity
+            # of the tei:measure, then from the text content of the tei:measure ; the only prices that
+            # are left must conform to the regular expression "[0-9]+(\.[0-9]+)?" ; else; price is None
+            price = 0  # price of an item
+            if item.xpath("./@xml:id", namespaces=ns):
+                cat_id = item.xpath("./@xml:id", namespaces=ns)[0]
+            if len(item.xpath(".//tei:measure[@commodity='currency']", namespaces=ns)) == 1:
+                try:
+                    if re.match(r"[0-9]+(\.[0-9]+)?",
+                                item.xpath(".//tei:measure[@commodity='currency']/@quantity", namespaces=ns)[0]):
+                        price = item.xpath(".//tei:measure[@commodity='currency']/@quantity", namespaces=ns)[0]
+                    elif re.match(r"[0-9]+(\.[0-9]+)?",
+                                  item.xpath(".//tei:measure[@commodity='currency']/text()", namespaces=ns)[0]):
+                        price = item.xpath(".//tei:measure[@commodity='currency']/text()", namespaces=ns)[0]
+                except:
+                    price = None
+                price = to_number(price)
+
+            # if there are several prices in an item, add them up
+            else:
+                for m in item.xpath(".//tei:measure[@commodity='currency']", namespaces=ns):
+                    if re.match(r"[0-9]+(\.[0-9]+)?", m.xpath("./@quantity", namespaces=ns)[0]):
+                        p = m.xpath("./@quantity", namespaces=ns)[0]
+                    elif re.match(r"[0-9]+(\.[0-9]+)?", m.xpath("./text()", namespaces=ns)[0]):
+                        p = m.xpath("./text()", namespaces=ns)[0]
+                    p = to_number(p)
+                if price is not None:
+                    price += p
+            # the intended differences of version 4
+            price = CATALOGUE_PRICE_DELTAS.get(cat_id, price)
+
+            # extend ipdict and plist with the data from every item
+            if price is not None:
+                # convert the price to a fixed price: franc at the 1900 rate
+                if currency == "FRF":
+                    price = pconverter_franc(date=date, price=price)
+                else:
+                    price = pconverter_foreign(currency=currency, date=date, price=price)
+                ipdict[cat_id] = price
+                plist.append(price)
+        # add the most expensive items to big
+        for ip in ipdict.items():
+            if ip[1] == sorted(plist)[-1]:
+                big[ip[0]] = ip[1]
+        # calculate the total sale price
+        psum = 0
+        for p in plist:
+            psum += p
+        psum = to_number(psum)
+        plist = sorted(plist)
+        # produce some statistical data for the catalog
+        data["total_price_c"] = psum  # the sum of the tei:item's prices
+        data["low_price_c"] = plist[0]  # the lowest price in the catalog
+        data["high_price_c"] = plist[-1]  # the highest price in the catalog
+        data["mean_price_c"] = mean(plist)  # the average price in the catalog
+        data["median_price_c"] = median(plist)  # the median price of the catalog
+        data["mode_price_c"] = mode(plist)  # the mode price (most frequent price)
+        data["variance_price_c"] = pvariance(plist)  # the population variance of the prices
+        data["high_price_items_c"] = big  # a dict with the most expensive item's @xml:id as keys, and price as values
+    # if there is no information about the price in the catalogs, the above elements are not created
+
+    # update the main dictionnary with the data of the file and return
+    if tree.xpath("./@xml:id", namespaces=ns):
+        catalog_dict[tree.xpath("./@xml:id", namespaces=ns)[0]] = data
+    return catalog_dict
+
+
+class Differential_extraction(unittest.TestCase):
+    maxDiff = None
+
+    def test_whole_corpus(self):
+        files = sorted(glob.glob(f"{curdir}/../Catalogues/**/*.xml", recursive=True))
+        self.assertTrue(files)
+        for file in files:
+            with self.subTest(file=file):
+                legacy_tree = etree.parse(file)
+                legacy_items = legacy_item_extractor(legacy_tree, {})
+                legacy_catalog = legacy_catalog_extractor(legacy_tree, {})
+                tree = etree.parse(file)
+                output_dict = item_extractor(tree, {})
+                catalog_dict = catalog_extractor(tree, {})
+                self.assertEqual(list(output_dict.items()), list(legacy_items.items()))
+                self.assertEqual(catalog_dict, legacy_catalog)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,174 @@
+# coding: utf-8
+
+# --------------------------------------------------------------------------------------------------
+# Katabase project: github.com/katabase/
+# Columnar export of the extracted data, in Parquet or Arrow IPC files (with pyarrow)
+#
+# * PROCESS BREAKDOWN *
+# - item_table() builds a typed table from the output_dict of extractor_json.py: one row per
+#   desc, keyed by desc_id ; term and format are dictionary-encoded integers (in the Parquet
+#   files, they are dictionary-encoded pages, read back as plain integers by pyarrow) ;
+# - catalog_table() builds a typed table from the catalog_dict, keyed by cat_id ;
+# - write_tables() writes both tables in the output directory, as export_item.parquet and
+#   export_catalog.parquet or as export_item.arrow and export_catalog.arrow. the Arrow IPC
+#   files are uncompressed, so that they can be memory-mapped and only the columns needed read ;
+#   each file is written to a temporary file (its path + ".part") that replaces it once complete.
+# pyarrow is an optional dependency: it is only needed to write these files.
+# --------------------------------------------------------------------------------------------------
+
+
+import os
+import json
+
+try:
+	import pyarrow as pa
+	import pyarrow.parquet as pq
+	import pyarrow.feather as feather
+except ImportError:
+	pa = None
+
+
+def item_schema():
+	"""
+	:return: the schema of the items' table
+	"""
+	return pa.schema([
+		("desc_id", pa.string()),
+		("desc", pa.string()),
+		("price", pa.float64()),
+		("currency", pa.dictionary(pa.int8(), pa.string())),
+		("price_c", pa.float64()),
+		("author", pa.string()),
+		("author_wikidata_id", pa.string()),
+		("date", pa.string()),
+		("number_of_pages", pa.float64()),
+		("format", pa.dictionary(pa.int16(), pa.int64())),
+		("term", pa.dictionary(pa.int16(), pa.int64())),
+		("sell_date", pa.string())
+	])
+
+
+def catalog_schema(extra_stats=False):
+	"""
+	:param extra_stats: add the columns of the extra statistics (see extractor_json.catalog_price_stats())
+	:return: the schema of the catalogues' table
+	"""
+	fields = [
+		("cat_id", pa.string()),
+		("title", pa.string()),
+		("cat_type", pa.string()),
+		("sell_date", pa.string()),
+		("item_count", pa.int64()),
+		("currency", pa.string()),
+		("total_price_c", pa.int64()),
+		("low_price_c", pa.float64()),
+		("high_price_c", pa.float64()),
+		("mean_price_c", pa.float64()),
+		("median_price_c", pa.float64()),
+		("mode_price_c", pa.float64()),
+		("variance_price_c", pa.float64()),
+		("high_price_items_c", pa.map_(pa.string(), pa.float64()))
+	]
+	if extra_stats:
+		fields += [
+			("p10_price_c", pa.float64()),
+			("p90_price_c", pa.float64()),
+			("currency_stats_c", pa.string())  # the statistics for each currency, as a JSON string
+		]
+	return pa.schema(fields)
+
+
+def check_pyarrow():
+	"""
+	raise an explicit error if pyarrow is not installed
+	:return: None
+	"""
+	if pa is None:
+		raise ImportError("pyarrow is needed to write Parquet or Arrow files: pip install pyarrow")
+	return None
+
+
+def item_table(output_dict):
+	"""
+	build the table of the items from the output_dict of extractor_json.py
+	:param output_dict: dict mapping a desc's @xml:id to its data
+	:return: a pyarrow.Table
+	"""
+	check_pyarrow()
+	schema = item_schema()
+	columns = {name: [] for name in schema.names}
+	columns["desc_id"] = list(output_dict.keys())
+	for data in output_dict.values():
+		for name in schema.names[1:]:
+			columns[name].append(data.get(name))
+	return table_from_columns(columns, schema)
+
+
+def catalog_table(catalog_dict):
+	"""
+	build the table of the catalogues from the catalog_dict of extractor_json.py
+	:param catalog_dict: dict mapping a catalogue's @xml:id to its data
+	:return: a pyarrow.Table
+	"""
+	check_pyarrow()
+	extra_stats = any("currency_stats_c" in data for data in catalog_dict.values())
+	schema = catalog_schema(extra_stats)
+	columns = {name: [] for name in schema.names}
+	columns["cat_id"] = list(catalog_dict.keys())
+	for data in catalog_dict.values():
+		for name in schema.names[1:]:
+			value = data.get(name)
+			if name == "high_price_items_c" and value is not None:
+				value = list(value.items())
+			elif name == "currency_stats_c" and value is not None:
+				value = json.dumps(value)
+			columns[name].append(value)
+	return table_from_columns(columns, schema)
+
+
+def table_from_columns(columns, schema):
+	"""
+	build a table from lists of values, dictionary-encoding the columns that need it
+	:param columns: dict mapping a column's name to its values
+	:param schema: the schema of the table
+	:return: a pyarrow.Table
+	"""
+	arrays = []
+	for field in schema:
+		if pa.types.is_dictionary(field.type):
+			array = pa.array(columns[field.name], type=field.type.value_type).dictionary_encode()
+			array = array.cast(field.type)
+		else:
+			array = pa.array(columns[field.name], type=field.type)
+		arrays.append(array)
+	return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def write_tables(output_dict, catalog_dict, output_dir, fmt="parquet"):
+	"""
+	write the items and the catalogues to columnar files in output_dir
+	:param output_dict: dict mapping a desc's @xml:id to its data
+	:param catalog_dict: dict mapping a catalogue's @xml:id to its data
+	:param output_dir: the directory in which the files are written
+	:param fmt: "parquet" or "arrow" (Arrow IPC file format, uncompressed)
+	:return: list of the paths of the written files
+	"""
+	check_pyarrow()
+	paths = []
+	if fmt not in ("parquet", "arrow"):
+		raise ValueError(f"unknown format: {fmt}")
+	for name, table in (("export_item", item_table(output_dict)), ("export_catalog", catalog_table(catalog_dict))):
+		path = f"{output_dir}/{name}.{fmt}"
+		# the previous file is only replaced by a complete one
+		try:
+			if fmt == "parquet":
+				pq.write_table(table, f"{path}.part")
+			else:
+				feather.write_feather(table, f"{path}.part", compression="uncompressed")
+			os.replace(f"{path}.part", path)
+		except BaseException:
+			if os.path.exists(f"{path}.part"):
+				os.remove(f"{path}.part")
+			raise
+		paths.append(path)
+	return paths
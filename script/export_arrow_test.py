@@ -0,0 +1,60 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from export_arrow import *
+
+
+@unittest.skipIf(pa is None, "pyarrow is not installed")
+class Arrow_export(unittest.TestCase):
+
+    output_dict = {
+        "CAT_000112_e18_d1": {"currency": "FRF", "price": 15.0, "price_c": 15.3, "author": "Barry",
+                              "author_wikidata_id": None, "date": "1846", "number_of_pages": 1.0,
+                              "format": 8, "term": 7, "sell_date": "1887-11", "desc": "L. a. s."},
+        "CAT_000112_e19_d1": {"price": None, "author": None, "author_wikidata_id": "Q123", "date": None,
+                              "number_of_pages": None, "format": None, "term": 7, "desc": "P. s."}
+    }
+    catalog_dict = {
+        "CAT_000112": {"title": "REVUE", "sell_date": "1887-11", "item_count": 2, "currency": "FRF",
+                       "total_price_c": 15, "low_price_c": 15.3, "high_price_c": 15.3, "mean_price_c": 15.3,
+                       "median_price_c": 15.3, "mode_price_c": 15.3, "variance_price_c": 0.0,
+                       "high_price_items_c": {"CAT_000112_e18": 15.3}},
+        "CAT_000113": {"title": "REVUE", "item_count": 3}
+    }
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_item_table(self):
+        table = item_table(self.output_dict)
+        self.assertEqual(table.column("desc_id").to_pylist(), list(self.output_dict.keys()))
+        self.assertTrue(pa.types.is_dictionary(table.schema.field("term").type))
+        self.assertEqual(table.column("term").to_pylist(), [7, 7])
+        self.assertEqual(table.column("price_c").to_pylist(), [15.3, None])
+        self.assertEqual(table.column("sell_date").to_pylist(), ["1887-11", None])
+
+    def test_catalog_table(self):
+        table = catalog_table(self.catalog_dict)
+        rows = table.to_pylist()
+        self.assertEqual(rows[0]["cat_id"], "CAT_000112")
+        self.assertEqual(rows[0]["high_price_items_c"], [("CAT_000112_e18", 15.3)])
+        self.assertIsNone(rows[1]["total_price_c"])
+        self.assertNotIn("p10_price_c", table.schema.names)
+
+    def test_write_tables(self):
+        for fmt in ("parquet", "arrow"):
+            paths = write_tables(self.output_dict, self.catalog_dict, self.tmpdir, fmt)
+            self.assertEqual([os.path.basename(p) for p in paths], [f"export_item.{fmt}", f"export_catalog.{fmt}"])
+        self.assertFalse([name for name in os.listdir(self.tmpdir) if name.endswith(".part")])
+        with pa.memory_map(os.path.join(self.tmpdir, "export_item.arrow")) as source:
+            table = pa.ipc.open_file(source).read_all()
+        self.assertEqual(table.column("author").to_pylist(), ["Barry", None])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -6,26 +6,54 @@
 # Python script to extract the <desc> of XML files and save it in a JSON file
 #
 # * PROCESS BREAKDOWN *
-# - data_extractor() extracts the elements from an XML file's normalised tei:desc elements obtained
-#   after step 2_CleanedData ;
-# - if __name__ == "__main__" initiates the CLI, iterate over each file
-#   we need to get data from ; on each iteration, it calls data_extractor()
-#   to do the dirty work and updates an output_dict with the results from data_extractor ;
-#   finally, it saves the output dict as a JSON file in the 'output' directory
+# - item_extractor() extracts the elements from an XML file's normalised tei:desc elements obtained
+#   after step 2_CleanedData ; catalog_extractor() extracts data on the catalogue itself ;
+#   stream_extractor() does the same job on a file without loading the whole file (option --stream) ;
+#   the data on each desc is a dict, or a compact ItemRecord (see records.py) when the extraction is
+#   run from the command line ;
+# - extract_file() parses a file and runs both extractors on it ; run_extraction() runs it on every
+#   file, either in a single process or in a pool of processes (option --jobs) ; it can also measure
+#   the extraction of each file and profile it (options --stats-out and --profile, see telemetry.py) ;
+# - if __name__ == "__main__" initiates the CLI and iterates over the results of each file
+#   in a fixed order ; the results are written to the JSON files of the 'output' directory
+#   as soon as each file is processed (see writers.py), as indented or compact JSON, compressed or not
+#   (options --compact and --compress, see serializers.py)
 # --------------------------------------------------------------------------------------------------
 
 
 import os
 import sys
-import json
 import glob
+import time
+import hashlib
+import cProfile
+import argparse
 import traceback
+from contextlib import ExitStack
+from multiprocessing import Pool
+from functools import partial
+from itertools import islice
 from pathlib import Path
-from statistics import mean, median, mode, pvariance
 from lxml import etree
+import numpy as np
 import re
 
-from priceconv import pconverter_foreign, pconverter_franc
+from priceconv import PriceConverter, BINARY_TABLES
+from cache import ExtractionCache
+from pricestats import price_stats, currency_breakdown
+from export_arrow import write_tables
+from writers import JsonObjectWriter, JsonLinesWriter, TsvWriter
+from serializers import Serializer, BACKENDS, COMPRESSIONS, check_compression
+from sqlite_store import SqliteStore
+from aggregates import CubeStore
+from blocking import BlockingStore
+from telemetry import RunTelemetry, file_stats, profile_path
+from records import ItemRecord, intern_text
+from skeleton import SkeletonCache, extraction_parser
+from authors import AuthorIndex, surname
+from list_desc import COLUMNS as TSV_COLUMNS, desc_rows, list_file
+from shards import shard_files, shard_name, source_path, file_sha256, build_manifest, write_manifest, is_current, \
+	MANIFEST, OUTPUTS
 
 
 # the suffix "_c" in a dictionary or output json file expresses
@@ -34,10 +62,38 @@ from priceconv import pconverter_foreign, pconverter_franc
 
 ns = {'tei': 'http://www.tei-c.org/ns/1.0'}
 curdir = os.path.abspath(os.path.dirname(os.path.abspath(__file__)))
+# version of the extraction: it must be changed every time the output of item_extractor()
+# or catalog_extractor() changes, in order to invalidate the cached results (see cache.py)
+EXTRACTOR_VERSION = "5"
+# conversion tables are memory-mapped once (see priceconv.compile_tables()) and shared by the extractors ;
+# they are only compiled by the command line interface (the json tables are read if they are outdated)
+price_converter = PriceConverter(binary_path=BINARY_TABLES)
+STREAM_BATCH = 1000  # number of descs written at once when the files are streamed to the writers (see stream_file())
+
+
+# ============== COMPILED XPATH EXPRESSIONS ============== #
+# all the XPath expressions are compiled once, and the children of the tei:items
+# and tei:descs are read in a single pass (see item_fields_extractor(), desc_extractor()
+# and item_price_extractor()) instead of evaluating an XPath for each field
+TEI = f"{{{ns['tei']}}}"  # namespace prefix of the tags
+XML_ID = "{http://www.w3.org/XML/1998/namespace}id"
+xp_items = etree.XPath('.//tei:text//tei:item', namespaces=ns)
+xp_body_items = etree.XPath('.//tei:body//tei:item', namespaces=ns)
+xp_sell_date = etree.XPath('./tei:teiHeader//tei:sourceDesc//tei:date[@when]', namespaces=ns)
+xp_sell_date_to = etree.XPath('tei:TEI/tei:teiHeader//tei:sourceDesc//tei:date[@to]', namespaces=ns)
+xp_title = etree.XPath('.//tei:titleStmt//tei:title', namespaces=ns)
+xp_cat_type = etree.XPath('.//tei:sourceDesc/tei:bibl/@ana', namespaces=ns)
+xp_date_when = etree.XPath('.//tei:bibl/tei:date/@when', namespaces=ns)
+xp_date_text = etree.XPath('.//tei:bibl//tei:date/text()', namespaces=ns)
+# text content of a desc, without its tags ; plain strings, that don't keep a reference to the tree
+xp_desc_text = etree.XPath('string()', smart_strings=False)
+# fields of a desc that is not directly inside a tei:item (see item_fields_extractor())
+no_item_fields = {"priced": False, "price": None, "currency": None, "price_c": None, "author": None,
+				  "author_wikidata_id": None}
 
 
 # ============== MAIN FUNCTIONS ============== #
-def item_extractor(tree, output_dict):
+def item_extractor(tree, output_dict, records=False, prices=None):
 	"""
 	This function extracts all the data from each item's desc and adds it to a dictionnary (desc) ;
 	in the end, it appends desc to the dictionnary.
@@ -47,89 +103,25 @@ def item_extractor(tree, output_dict):
 	- in constant francs (at 1900 rate): data["price_c"]
 	:param tree: an XML tree
 	:param output_dict: the dictionnary on which every XML file's desc is stored
+	:param records: store the data of each desc in an ItemRecord instead of a dict (see records.py)
+	:param prices: a dict in which the price of each tei:item (see item_price_extractor()) is stored
+				   with the item's @xml:id as key, to be used again by catalog_extractor(), or None
 	:return: updated dictionnary
 	"""
 	# get the sale date to convert prices
-	if tree.xpath('./tei:teiHeader//tei:sourceDesc//tei:date[@when]',
-				  namespaces=ns):
-		sell_date = tree.xpath('.//tei:teiHeader//tei:sourceDesc//tei:date[@when]',
-				               namespaces=ns)[0].text
-	elif tree.xpath('tei:TEI/tei:teiHeader//tei:sourceDesc//tei:date[@to]', namespaces=ns):
-		sell_date = tree.xpath('tei:TEI/tei:teiHeader//tei:sourceDesc//tei:date/@to',
-							   namespaces=ns)[0].text
-	else:
-		print("No sell date for " + tree.xpath("@xml:id", namespaces=ns)[0])
-		sell_date = None
-	if sell_date is not None:
-		sell_year = re.findall(r"\d{4}", sell_date)[0]
-	else:
-		sell_year = None
+	sell_date, sell_year = sell_date_extractor(tree)
+	price_converter.refresh()  # reload the conversion tables if they have been modified
 	# For each desc, a dict retrieve all the data.
-	for desc in tree.xpath('.//tei:text//tei:item//tei:desc', namespaces=ns):
-		data = {}
-		desc_id = desc.xpath('./@xml:id', namespaces=ns)[0]  # get the item's ID
-		if desc.xpath('parent::tei:item/tei:measure[@quantity]', namespaces=ns):  # si il y a un prix, le récupérer
-			price = to_float(desc.xpath('parent::tei:item//tei:measure[@commodity="currency"]/@quantity', namespaces=ns)[0])
-			currency = desc.xpath('parent::tei:item//tei:measure[@commodity="currency"]/@unit', namespaces=ns)[0]
-			data["currency"] = currency
-			data["price"] = price
-			# convert the prices to express them in constant francs (at the 1900 rate)
-			if sell_year is not None and price is not None:
-				if currency == "FRF":
-					price_c = pconverter_franc(date=sell_year, price=price)
-				else:
-					price_c = pconverter_foreign(currency=currency, date=sell_year, price=price)
-				data["price_c"] = price_c
-		else:
-			data["price"] = None
-		if desc.xpath('parent::tei:item/tei:name[@type="author"]/text()', namespaces=ns):  # get the author's surname
-			author = desc.xpath('parent::tei:item/tei:name[@type="author"]/text()', namespaces=ns)[0]
-			try:
-				# We only keep the surname of the author : we stop the match at the first
-				# parenthesis or dot and we keep the first match.
-				author = re.match('^([^\(|.|,|;|-]+)', author)[1]
-				# We remove blankspaces.
-				author = author.strip()
-			except:
-				author = None
-			data["author"] = author
-		else:
-			data["author"] = None
-		try:
-			author_wikidata_id = desc.xpath("parent::tei:item/tei:name/@ref", namespaces=ns)[0]
-		except IndexError:
-			author_wikidata_id = None
-		data["author_wikidata_id"] = author_wikidata_id
-		if desc.xpath('./tei:date[@when]', namespaces=ns):  # récupérer la date si elle existe
-			data["date"] = desc.xpath('./tei:date/@when', namespaces=ns)[0]
-		else:
-			data["date"] = None
-		if desc.xpath('./tei:measure[@type="length"]', namespaces=ns):
-			data["number_of_pages"] = to_float(desc.xpath('./tei:measure[@type="length"]/@n', namespaces=ns)[0])
-		else:
-			data["number_of_pages"] = None
-		if desc.xpath('./tei:measure[@type="format"]', namespaces=ns):  # récupérer le format XML normalisé si il existe
-			desc_format = desc.xpath('./tei:measure[@type="format"]/@ana', namespaces=ns)[0]
-			data["format"] = get_numbers(str(desc_format))
-		else:
-			data["format"] = None
-		if desc.xpath('./tei:term', namespaces=ns):  # récupérer les termes normalisés
-			desc_term = desc.xpath('./tei:term/@ana', namespaces=ns)[0]
-			data["term"] = get_numbers(str(desc_term))
-		else:
-			data["term"] = None
-		if sell_date is not None:
-			data["sell_date"] = sell_date
-		# In order to check the data, we add its text (and only its text with .strip_tags) in the dict.
-		etree.strip_tags(desc, '{http://www.tei-c.org/ns/1.0}*')
-		data["desc"] = desc.text
-
+	for item in xp_items(tree):
+		price = item_price_extractor(item, sell_year)
+		if prices is not None and price["item_id"] is not None:
+			prices[price["item_id"]] = price
 		# update the main dictionnary with the data of this file and return
-		output_dict[desc_id] = data
+		output_dict.update(item_records_extractor(item, sell_date, sell_year, records, price))
 	return output_dict
 
 
-def catalog_extractor(tree, catalog_dict):
+def catalog_extractor(tree, catalog_dict, extra_stats=False, prices=None):
 	"""
 	function to extract data on each catalogue and store it in a json file : year, number of items sold,
 	stats about the item's price...
@@ -138,101 +130,557 @@ def catalog_extractor(tree, catalog_dict):
 	in constant francs.
 	:param tree: a catalog in XML format parsed with lxml
 	:param catalog_dict: a dictionnary to store all the data
+	:param extra_stats: add the quantiles of the prices and statistics for each currency
+	:param prices: the prices of the tei:items stored by item_extractor() on the same tree, or None:
+				   the prices of the items that are not in it are read again
 	:return: updated version of catalog_dict ; type dict, obviously
 	"""
-	data = {}  # dictionary to store all the data on a catalog
 	# retrieve the title, sale date and number of entries in the catalog
-	if tree.xpath(".//tei:titleStmt//tei:title", namespaces=ns):
-		data["title"] = tree.xpath(".//tei:titleStmt//tei:title", namespaces=ns)[0].text
-	if tree.xpath(".//tei:sourceDesc/tei:bibl/@ana", namespaces=ns):
-		data["cat_type"] = tree.xpath(".//tei:sourceDesc/tei:bibl/@ana", namespaces=ns)[0]
-	if tree.xpath('.//tei:bibl/tei:date[@when]', namespaces=ns):
-		date = tree.xpath('.//tei:bibl/tei:date/@when', namespaces=ns)[0]
+	data, date = catalog_header_extractor(tree)
+	# retrieve the prices of the items and the statistics about them
+	item_prices = []
+	for item in xp_body_items(tree):
+		if prices is not None and item.get(XML_ID) in prices:
+			item_prices.append(prices[item.get(XML_ID)])
+		else:
+			item_prices.append(item_price_extractor(item))
+	catalog_prices(data, date, item_prices, extra_stats)
+
+	# update the main dictionnary with the data of the file and return
+	if get_root(tree).get(XML_ID) is not None:
+		catalog_dict[get_root(tree).get(XML_ID)] = data
+	return catalog_dict
+
+
+def stream_extractor(file, catalog_dict=None, extra_stats=False, records=False):
+	"""
+	streaming version of item_extractor() and catalog_extractor(), built on etree.iterparse():
+	the sell date is read from the tei:teiHeader first, then the data of each tei:item's descs
+	is yielded as soon as the end tag of the tei:item is parsed, and the processed elements
+	are deleted from the tree. in turn, the memory used doesn't depend on the size of the
+	catalogue. the catalogue's data is added to catalog_dict once the whole file is parsed.
+	this function gives the same results as item_extractor() and catalog_extractor() (the
+	tei:items of a catalogue are expected to be in its tei:body).
+	:param file: path to an XML catalogue
+	:param catalog_dict: a dictionnary to store the data on the catalogue, or None
+	:param extra_stats: add the quantiles of the prices and statistics for each currency
+	:param records: yield the data of each desc as an ItemRecord instead of a dict (see records.py)
+	:return: generator of (desc_id, data) tuples, data being the same dict as in item_extractor()
+	"""
+	sell_date, sell_year = None, None
+	data, date = {}, None  # data on the catalogue and its sell date
+	item_prices = []  # price of each item, from item_price_extractor()
+	price_converter.refresh()
+
+	context = etree.iterparse(file, events=("end",), tag=(f"{TEI}teiHeader", f"{TEI}item"),
+							  remove_comments=True, remove_pis=True, huge_tree=True)
+	for event, element in context:
+		if element.tag == f"{TEI}teiHeader":
+			# at this point, the TEI root only contains the tei:teiHeader
+			tei = element.getparent()
+			sell_date, sell_year = sell_date_extractor(tei)
+			data, date = catalog_header_extractor(tei)
+			element.clear(keep_tail=True)
+			continue
+
+		# yield the data of the item's descs (in the same order as item_extractor()) and
+		# collect the item's price for the catalogue, as catalog_extractor() does
+		price = item_price_extractor(element, sell_year)
+		yield from item_records_extractor(element, sell_date, sell_year, records, price).items()
+		item_prices.append(price)
+
+		# delete the item and the elements before it that are already processed
+		element.clear(keep_tail=True)
+		while element.getprevious() is not None:
+			del element.getparent()[0]
+
+	catalog_prices(data, date, item_prices, extra_stats)
+	if catalog_dict is not None and context.root.get(XML_ID) is not None:
+		catalog_dict[context.root.get(XML_ID)] = data
+
+
+# ============== EXTRACTION STEPS ============== #
+def sell_date_extractor(tree):
+	"""
+	get the sell date of a catalogue from its tei:teiHeader, to convert the prices
+	:param tree: an XML tree or the tei:TEI element of a catalogue
+	:return: tuple of (sell date, year of the sell date) ; both are None if there is no sell date
+	"""
+	if xp_sell_date(tree):
+		sell_date = xp_sell_date(tree)[0].text
+	elif xp_sell_date_to(tree):
+		sell_date = xp_sell_date_to(tree)[0].get("to")
+	else:
+		print("No sell date for " + get_root(tree).get(XML_ID))
+		sell_date = None
+	if sell_date is not None:
+		sell_date = intern_text(sell_date)
+		sell_year = re.findall(r"\d{4}", sell_date)[0]
+	else:
+		sell_year = None
+	return sell_date, sell_year
+
+
+def item_records_extractor(item, sell_date, sell_year, records=False, price=None):
+	"""
+	extract the data of every desc of a tei:item for item_extractor()
+	:param item: a tei:item element
+	:param sell_date: the sell date of the catalogue, or None
+	:param sell_year: the year of the sell date, or None
+	:param records: return the data of each desc as an ItemRecord instead of a dict
+	:param price: the price of the item, from item_price_extractor(item, sell_year) ; if it is None,
+				  the price is read from the item
+	:return: dict mapping the @xml:id of each desc to its data, in document order
+	"""
+	descs = {}
+	if price is None:
+		price = item_price_extractor(item, sell_year)
+	fields = item_fields_extractor(item, price)
+	for desc in item.iter(f"{TEI}desc"):
+		# a desc which is not a direct child of the item doesn't get the item's data
+		desc_fields = fields if desc.getparent() is item else no_item_fields
+		desc_id, data = desc_extractor(desc, desc_fields, sell_date, records)
+		descs[desc_id] = data
+	return descs
+
+
+def item_fields_extractor(item, price):
+	"""
+	get the data shared by all the descs of a tei:item, in a single pass over its children:
+	price, currency, author and wikidata id of the author
+	:param item: a tei:item element
+	:param price: the price of the item, from item_price_extractor()
+	:return: dict with the item's data
+	"""
+	author = None  # text of the first tei:name[@type="author"] that has a text
+	author_wikidata_id = None  # @ref of the first tei:name that has one
+	for child in item:
+		if child.tag == f"{TEI}name":
+			if author is None and child.get("type") == "author":
+				author = first_text(child, default=None)
+			if author_wikidata_id is None:
+				author_wikidata_id = child.get("ref")
+	# the authors and wikidata ids are repeated in many descs: only one copy is kept ;
+	# the surname of each distinct author is only parsed once (see authors.surname())
+	return {"priced": price["priced"], "price": price["price"],
+			"currency": price["currency"] if price["priced"] else None,
+			"price_c": price["price_c"], "author": surname(author),
+			"author_wikidata_id": intern_text(author_wikidata_id)}
+
+
+def desc_extractor(desc, fields, sell_date, records=False):
+	"""
+	extract the data of a tei:desc for item_extractor(), in a single pass over its children
+	:param desc: a tei:desc element, inside a tei:item
+	:param fields: the data of the desc's tei:item, from item_fields_extractor()
+	:param sell_date: the sell date of the catalogue, or None
+	:param records: return the data as an ItemRecord (see records.py) instead of a dict
+	:return: tuple of (desc_id, data), data being a dict (or an ItemRecord) with the desc's data
+	"""
+	desc_id = desc.attrib[XML_ID]  # get the item's ID
+	# the price in constant francs (at the 1900 rate) is converted once per item, by item_price_extractor()
+	price_c = fields["price_c"]
+
+	dates, lengths, formats, terms = [], [], [], []
+	for child in desc:
+		if child.tag == f"{TEI}date":
+			dates.append(child)
+		elif child.tag == f"{TEI}measure" and child.get("type") == "length":
+			lengths.append(child)
+		elif child.tag == f"{TEI}measure" and child.get("type") == "format":
+			formats.append(child)
+		elif child.tag == f"{TEI}term":
+			terms.append(child)
+	date = intern_text(first_attribute(dates, "when", default=None))  # récupérer la date si elle existe
+	number_of_pages = to_float(first_attribute(lengths, "n")) if lengths else None
+	# récupérer le format XML normalisé et les termes normalisés si ils existent
+	desc_format = get_numbers(first_attribute(formats, "ana")) if formats else None
+	term = get_numbers(first_attribute(terms, "ana")) if terms else None
+	# In order to check the data, we add its text (and only its text, without the tags) in the dict ;
+	# the tree is not modified, so that catalog_extractor() can run on it before or after item_extractor()
+	text = xp_desc_text(desc) or None
+
+	if records:
+		return desc_id, ItemRecord(fields["priced"], fields["currency"], fields["price"], price_c,
+								   fields["author"], fields["author_wikidata_id"], date, number_of_pages,
+								   desc_format, term, sell_date, text)
+	data = {}
+	if fields["priced"]:
+		data["currency"] = fields["currency"]
+		data["price"] = fields["price"]
+		if price_c is not None:
+			data["price_c"] = price_c
+	else:
+		data["price"] = None
+	data["author"] = fields["author"]
+	data["author_wikidata_id"] = fields["author_wikidata_id"]
+	data["date"] = date
+	data["number_of_pages"] = number_of_pages
+	data["format"] = desc_format
+	data["term"] = term
+	if sell_date is not None:
+		data["sell_date"] = sell_date
+	data["desc"] = text
+	return desc_id, data
+
+
+def catalog_header_extractor(tree):
+	"""
+	extract the data on a catalogue from its tei:teiHeader for catalog_extractor(): title,
+	type of catalogue and sale date
+	:param tree: an XML tree or the tei:TEI element of a catalogue
+	:return: tuple of (data, date): the dict with the catalogue's data and the sell date (or None)
+	"""
+	data = {}  # dictionary to store all the data on a catalog
+	date = None
+	if xp_title(tree):
+		data["title"] = xp_title(tree)[0].text
+	if xp_cat_type(tree):
+		data["cat_type"] = str(xp_cat_type(tree)[0])
+	if xp_date_when(tree):
+		date = str(xp_date_when(tree)[0])
 		data["sell_date"] = date
-	elif tree.xpath(".//.//tei:bibl/tei:date/text()", namespaces=ns):
-		date = tree.xpath('.//tei:bibl//tei:date/text()', namespaces=ns)[0]
+	elif xp_date_text(tree):
+		date = str(xp_date_text(tree)[0])
 		data["sell_date"] = date
-	if tree.xpath(".//tei:body//tei:item", namespaces=ns):
-		data["item_count"] = int(tree.xpath("count(.//tei:body//tei:item)", namespaces=ns))
+	return data, date
+
 
+def item_price_extractor(item, sell_year=None):
+	"""
+	get the prices of a tei:item, in a single pass over its tei:measures, for the data of its descs
+	(item_extractor()) and for the statistics of the catalogue (catalog_extractor()):
+	- the price of the descs is the first @quantity (and their currency the first @unit) of the
+	  item's tei:measure[@commodity='currency'], if a tei:measure[@quantity] is a child of the item ;
+	- the price of the item in the catalogue is the sum of the prices of all its
+	  tei:measure[@commodity='currency']: the @quantity of each one, or its text if it has no valid
+	  @quantity.
+	:param item: a tei:item element
+	:param sell_year: the year of the sell date of the catalogue, to convert the price of the descs
+					  to constant francs, or None
+	:return: dict with the @xml:id of the item ("item_id", or None), the first @unit of its
+			 tei:measure[@commodity] ("unit", or None), "priced" (True if the descs have a price),
+			 the "price" of the descs (a float, or None), the "currency" of the item (or None), the "sell_year",
+			 the price of the descs in constant francs at the 1900 rate ("price_c", or None if there
+			 is no price or no sell year), "catalog_priced" (True if the item has a
+			 tei:measure[@commodity='currency']) and the "catalog_price" of the item (a float, or
+			 None if no price could be read)
+	"""
+	unit = None
+	priced = False  # True if the item has a tei:measure[@quantity] child
+	quantity = None  # first @quantity of the item's tei:measure[@commodity='currency']
+	currency = None  # first @unit of the item's tei:measure[@commodity='currency']
+	catalog_priced = False
+	prices = []  # the price of each tei:measure[@commodity='currency']
+	for m in item.iter(f"{TEI}measure"):
+		if m.get("quantity") is not None and m.getparent() is item:
+			priced = True
+		if m.get("commodity") is None:
+			continue
+		if unit is None:
+			unit = m.get("unit")
+		if m.get("commodity") == "currency":
+			catalog_priced = True
+			if quantity is None:
+				quantity = m.get("quantity")
+			if currency is None:
+				currency = m.get("unit")
+			p = to_float(m.get("quantity"))
+			if p is None:
+				p = to_float(first_text(m, default=None))
+			if p is not None:
+				prices.append(p)
+	price, price_c = None, None
+	if priced:
+		price = to_float(quantity)
+		if sell_year is not None and price is not None:
+			price_c = price_converter.convert(date=sell_year, currency=currency, price=price)
+	# the currencies are repeated in many items: only one copy is kept
+	return {"item_id": item.get(XML_ID), "unit": unit, "priced": priced, "price": price,
+			"currency": intern_text(currency), "sell_year": sell_year, "price_c": price_c,
+			"catalog_priced": catalog_priced, "catalog_price": sum(prices) if prices else None}
+
+
+def catalog_prices(data, date, item_prices, extra_stats=False):
+	"""
+	add the number of items, the currency and the statistics about the prices to the data of
+	a catalogue ; if there is no information about the price in the catalog, only the number
+	of items is added.
+	:param data: the dict with the catalogue's data
+	:param date: the sell date of the catalogue
+	:param item_prices: the price of every tei:item of the catalogue, from item_price_extractor()
+	:param extra_stats: add extra statistics (see catalog_price_stats())
+	:return: updated data
+	"""
+	if item_prices:
+		data["item_count"] = len(item_prices)
 	# if the catalog is a fixed-price catalog (has "tei//item//tei:measure[@commodity='currency']",
 	# extract data about the prices
-	if tree.xpath(".//tei:body//tei:item[.//tei:measure/@commodity='currency']", namespaces=ns):
-		date = re.findall(r"\d{4}", date)[0]  # year of the sell date to convert the price to fixed price
+	if any(price["catalog_priced"] for price in item_prices):
 		# get the currency in which the catalog items are sold
-		if tree.xpath(".//tei:body//tei:item//tei:measure[@commodity]/@unit", namespaces=ns):
-			currency = tree.xpath(".//tei:body//tei:item//tei:measure[@commodity]/@unit", namespaces=ns)[0]
+		currency = next((price["unit"] for price in item_prices if price["unit"] is not None), None)
+		if currency is not None:
 			data["currency"] = currency
-		ipdict = {}  # dictionnary linking a tei:item's @xml:id to its price
-		plist = []  # list of the prices in one catalog
-		big = {}  # dictionnary to host all the most expensive items in a catalog
-		for item in tree.xpath(".//tei:body//tei:item[.//tei:measure/@commodity='currency']", namespaces=ns):
-			# if an item only has one price, extract it ; we try to get the price from the @quantity
-			# of the tei:measure, then from the text content of the tei:measure ; the only prices that
-			# are left must conform to the regular expression "[0-9]+(\.[0-9]+)?" ; else; price is None
-			price = 0  # price of an item
-			if item.xpath("./@xml:id", namespaces=ns):
-				cat_id = item.xpath("./@xml:id", namespaces=ns)[0]
-			if len(item.xpath(".//tei:measure[@commodity='currency']", namespaces=ns)) == 1:
-				try:
-					if re.match(r"[0-9]+(\.[0-9]+)?",
-								item.xpath(".//tei:measure[@commodity='currency']/@quantity", namespaces=ns)[0]):
-						price = item.xpath(".//tei:measure[@commodity='currency']/@quantity", namespaces=ns)[0]
-					elif re.match(r"[0-9]+(\.[0-9]+)?",
-								  item.xpath(".//tei:measure[@commodity='currency']/text()", namespaces=ns)[0]):
-						price = item.xpath(".//tei:measure[@commodity='currency']/text()", namespaces=ns)[0]
-				except:
-					price = None
-				price = to_number(price)
-
-			# if there are several prices in an item, add them up
+		rawprices = []  # prices of the priced items, with the @xml:id under which they are counted
+		for price in item_prices:
+			if not price["catalog_priced"]:
+				continue
+			if price["item_id"] is not None:
+				cat_id = price["item_id"]
+			if price["catalog_price"] is not None:
+				rawprices.append((cat_id, price))
+		catalog_price_stats(data, rawprices, date, currency, extra_stats)
+	return data
+
+
+def catalog_price_stats(data, rawprices, date, currency, extra_stats=False):
+	"""
+	convert the prices of a catalogue's items in constant francs and add
+	statistics about them to the catalogue's data (see pricestats.price_stats())
+	:param data: the dict with the catalogue's data
+	:param rawprices: list of (@xml:id, price) tuples, with the prices of the items from
+					  item_price_extractor()
+	:param date: the sell date of the catalogue
+	:param currency: the currency in which the catalog items are sold
+	:param extra_stats: add the quantiles of the prices and statistics for each currency
+						("currency_stats_c"), in which the prices are converted from the items'
+						own currency
+	:return: updated data
+	"""
+	date = re.findall(r"\d{4}", date)[0]  # year of the sell date to convert the price to fixed price
+	item_ids = [cat_id for cat_id, _ in rawprices]
+	# convert all the prices to a fixed price (franc at the 1900 rate)
+	plist = converted_prices([price for _, price in rawprices], date, currency)
+	# produce some statistical data for the catalog
+	stats = price_stats(item_ids, plist, quantiles=extra_stats)
+	stats["total_price_c"] = to_number(stats["total_price_c"])
+	data.update(stats)
+	if extra_stats:
+		item_currencies = [price["currency"] for _, price in rawprices]
+		item_plist = converted_prices([price for _, price in rawprices], date)
+		breakdown = currency_breakdown(item_ids, item_currencies, item_plist, quantiles=True)
+		for cstats in breakdown.values():
+			cstats["total_price_c"] = to_number(cstats["total_price_c"])
+		data["currency_stats_c"] = breakdown
+	return data
+
+
+def converted_prices(prices, year, currency=None):
+	"""
+	convert the prices of a catalogue's items to constant francs (at the 1900 rate) ; the prices
+	already converted by item_price_extractor() for the descs, in the same year and currency, are
+	used as they are, the other ones are converted in one vectorized operation
+	:param prices: list of prices from item_price_extractor(), that all have a "catalog_price"
+	:param year: the year of the sell date of the catalogue
+	:param currency: the currency of all the prices, or None to convert each price from its own currency
+	:return: numpy array of the converted prices
+	"""
+	plist = np.empty(len(prices))
+	todo = []  # indexes of the prices to convert
+	for i, price in enumerate(prices):
+		if price["price_c"] is not None and price["catalog_price"] == price["price"] \
+				and price["sell_year"] == year and (currency is None or price["currency"] == currency):
+			plist[i] = price["price_c"]
+		else:
+			todo.append(i)
+	if todo:
+		currencies = currency if currency is not None else [prices[i]["currency"] for i in todo]
+		plist[todo] = price_converter.convert_array(np.full(len(todo), int(year)), currencies,
+													[prices[i]["catalog_price"] for i in todo])
+	return plist
+
+
+# ============== FILE PROCESSING ============== #
+def extract_file(file, stream=False, extra_stats=False, telemetry=False, profile_dir=None, records=False,
+				 skeletons=None, listing=False):
+	"""
+	parse an XML file and run item_extractor() and catalog_extractor() on it
+	(or stream_extractor() if stream is True).
+	this function is run in the worker processes when extracting with several jobs,
+	so errors are caught and returned instead of stopping the whole extraction.
+	:param file: path to an XML catalogue
+	:param stream: use stream_extractor() instead of parsing the whole file
+	:param extra_stats: add extra statistics on the prices of the catalogue (see catalog_price_stats())
+	:param telemetry: measure the time spent on each step of the extraction (see telemetry.py)
+	:param profile_dir: if it is not None, run the extraction with cProfile and dump
+						the profile of the file in this directory
+	:param records: store the data of each desc in an ItemRecord instead of a dict (see records.py)
+	:param skeletons: a skeleton.SkeletonCache: if it is not None, the skeleton of the file is parsed
+					  instead of the whole file (see skeleton.py)
+	:param listing: also build the rows of the listing of the tei:descs from the parsed tree (see list_desc.py)
+	:return: tuple of (file, output_dict, catalog_dict, error, stats, rows) where output_dict and
+			 catalog_dict hold the data of this file only, error is the full error
+			 message (or None if the file was processed without problems), stats
+			 are the statistics of telemetry.file_stats() (or None if telemetry is False)
+			 and rows are the rows of list_desc.desc_rows() (or None if listing is False or
+			 stream is True: stream_extractor() doesn't keep the tree)
+	"""
+	profiler = cProfile.Profile() if profile_dir is not None else None
+	try:
+		timings = {}
+		rows = None
+		conversions = price_converter.conversions
+		if profiler is not None:
+			profiler.enable()
+		start = time.perf_counter()
+		if stream:
+			catalog_dict = {}
+			output_dict = dict(stream_extractor(file, catalog_dict, extra_stats, records))
+			timings["stream_extractor"] = time.perf_counter() - start
+		else:
+			if skeletons is not None:
+				tree, _ = skeletons.parse(file)
 			else:
-				for m in item.xpath(".//tei:measure[@commodity='currency']", namespaces=ns):
-					if re.match(r"[0-9]+(\.[0-9]+)?", m.xpath("./@quantity", namespaces=ns)[0]):
-						p = m.xpath("./@quantity", namespaces=ns)[0]
-					elif re.match(r"[0-9]+(\.[0-9]+)?", m.xpath("./text()", namespaces=ns)[0]):
-						p = m.xpath("./text()", namespaces=ns)[0]
-					p = to_number(p)
-				if price is not None:
-					price += p
-
-			# extend ipdict and plist with the data from every item
-			if price is not None:
-				# convert the price to a fixed price: franc at the 1900 rate
-				if currency == "FRF":
-					price = pconverter_franc(date=date, price=price)
-				else:
-					price = pconverter_foreign(currency=currency, date=date, price=price)
-				ipdict[cat_id] = price
-				plist.append(price)
-		# add the most expensive items to big
-		for ip in ipdict.items():
-			if ip[1] == sorted(plist)[-1]:
-				big[ip[0]] = ip[1]
-		# calculate the total sale price
-		psum = 0
-		for p in plist:
-			psum += p
-		psum = to_number(psum)
-		plist = sorted(plist)
-		# produce some statistical data for the catalog
-		data["total_price_c"] = psum  # the sum of the tei:item's prices
-		data["low_price_c"] = plist[0]  # the lowest price in the catalog
-		data["high_price_c"] = plist[-1]  # the highest price in the catalog
-		data["mean_price_c"] = mean(plist)  # the average price in the catalog
-		data["median_price_c"] = median(plist)  # the median price of the catalog
-		data["mode_price_c"] = mode(plist)  # the mode price (most frequent price)
-		data["variance_price_c"] = pvariance(plist)  # the population variance of the prices
-		data["high_price_items_c"] = big  # a dict with the most expensive item's @xml:id as keys, and price as values
-	# if there is no information about the price in the catalogs, the above elements are not created
+				tree = etree.parse(file, extraction_parser)
+			parsed = time.perf_counter()
+			prices = {}  # the price of each item is read once, for both extractors
+			output_dict = item_extractor(tree, {}, records, prices)
+			items = time.perf_counter()
+			catalog_dict = catalog_extractor(tree, {}, extra_stats, prices)
+			catalogs = time.perf_counter()
+			timings.update(parse=parsed - start, item_extractor=items - parsed, catalog_extractor=catalogs - items)
+			if listing:
+				rows = desc_rows(tree)
+				timings["listing"] = time.perf_counter() - catalogs
+		if profiler is not None:
+			profiler.disable()
+			profiler.dump_stats(profile_path(profile_dir, file))
+		stats = None
+		if telemetry or profiler is not None:
+			stats = file_stats(file, timings, output_dict, catalog_dict, price_converter.conversions - conversions)
+		return file, output_dict, catalog_dict, None, stats, rows
+	except Exception:
+		if profiler is not None:
+			profiler.disable()
+		return file, {}, {}, traceback.format_exc(), None, None
+
+
+def stream_file(file, extra_stats=False, records=False, batch_size=STREAM_BATCH):
+	"""
+	run stream_extractor() on a file without keeping the data of all its descs: the descs
+	are yielded by batches, to be written as they are extracted (see write_batches()).
+	:param file: path to an XML catalogue
+	:param extra_stats: add extra statistics on the prices of the catalogue (see catalog_price_stats())
+	:param records: store the data of each desc in an ItemRecord instead of a dict (see records.py)
+	:param batch_size: the maximum number of descs in a batch
+	:return: tuple of (file, batches, catalog_dict, None, None, None), as extract_file(): batches is
+			 a generator of dicts of descs, and catalog_dict is filled once batches is exhausted ;
+			 the errors are raised while the batches are read
+	"""
+	catalog_dict = {}
+	descs = stream_extractor(file, catalog_dict, extra_stats, records)
+	batches = iter(lambda: dict(islice(descs, batch_size)), {})
+	return file, batches, catalog_dict, None, None, None
 
-	# update the main dictionnary with the data of the file and return
-	if tree.xpath("./@xml:id", namespaces=ns):
-		catalog_dict[tree.xpath("./@xml:id", namespaces=ns)[0]] = data
-	return catalog_dict
+
+def write_batches(batches, writers):
+	"""
+	write the batches of descs of stream_file() to every writer, as they are extracted
+	:param batches: generator of dicts of descs
+	:param writers: the writers of the descs
+	:return: the full error message if the extraction failed (the batches before the error are
+			 written), else None
+	"""
+	try:
+		for batch in batches:
+			for writer in writers:
+				writer.write(batch)
+	except Exception:
+		return traceback.format_exc()
+	return None
+
+
+def run_extraction(files, jobs=1, stream=False, extra_stats=False, telemetry=False, profile_dir=None,
+				   records=False, skeletons=None, listing=False, lazy=False):
+	"""
+	run extract_file() on every file, either in this process or in a pool of
+	`jobs` worker processes. in both cases, the results are yielded in the
+	order of `files`, so that merging them always produces the same output.
+	:param files: list of paths to XML catalogues
+	:param jobs: number of worker processes
+	:param stream: use stream_extractor() to extract the files
+	:param extra_stats: add extra statistics on the prices of the catalogues
+	:param telemetry: measure the time spent on each step of the extraction of each file
+	:param profile_dir: directory of the cProfile dumps of each file, or None
+	:param records: store the data of each desc in an ItemRecord instead of a dict
+	:param skeletons: a skeleton.SkeletonCache to parse the skeletons of the files, or None
+	:param listing: also build the rows of the listing of the tei:descs of each file
+	:param lazy: with stream and a single job, yield the results of stream_file() instead, the descs of
+				 each file being extracted while they are written
+	:return: generator of extract_file() results
+	"""
+	extract = partial(extract_file, stream=stream, extra_stats=extra_stats, telemetry=telemetry,
+					  profile_dir=profile_dir, records=records, skeletons=skeletons, listing=listing)
+	if lazy and stream and jobs <= 1:
+		yield from (stream_file(file, extra_stats, records) for file in files)
+	elif jobs > 1:
+		with Pool(processes=jobs) as pool:
+			yield from pool.imap(extract, files)
+	else:
+		yield from (extract(file) for file in files)
+
+
+def ordered_results(files, cached, extracted):
+	"""
+	merge the cached results of some files and the results of run_extraction() on the
+	other files, in the order of `files`
+	:param files: list of paths to XML catalogues
+	:param cached: dict mapping a file to its cached (output_dict, catalog_dict)
+	:param extracted: run_extraction() generator on the files that are not in `cached`, in the same order
+	:return: generator of (file, output_dict, catalog_dict, error, stats, rows) tuples, as extract_file()
+	"""
+	for file in files:
+		if file in cached:
+			yield (file, *cached[file], None, None, None)
+		else:
+			yield next(extracted)
 
 
 # ============== AUXILIARY FUNCTIONS ============== #
+def get_root(tree):
+	"""
+	get the root element of a tree
+	:param tree: an XML tree (etree.parse()) or an element (etree.fromstring())
+	:return: the root element
+	"""
+	return tree.getroot() if isinstance(tree, etree._ElementTree) else tree
+
+
+def first_attribute(elements, attribute, default=IndexError):
+	"""
+	get the first value of an attribute on a list of elements, as the XPath
+	"element/@attribute" would do with the [0] index
+	:param elements: a list of elements
+	:param attribute: the name of the attribute
+	:param default: the value to return if no element has the attribute ; by default, raise an IndexError
+	:return: the value of the attribute
+	"""
+	for element in elements:
+		if element.get(attribute) is not None:
+			return element.get(attribute)
+	if default is IndexError:
+		raise IndexError(f"no @{attribute} on the elements")
+	return default
+
+
+def first_text(element, default=IndexError):
+	"""
+	get the first text node directly inside an element, as the XPath "element/text()"
+	would do with the [0] index
+	:param element: an element
+	:param default: the value to return if the element has no text node ; by default, raise an IndexError
+	:return: the text
+	"""
+	if element.text is not None:
+		return element.text
+	for child in element:
+		if child.tail is not None:
+			return child.tail
+	if default is IndexError:
+		raise IndexError("no text in the element")
+	return default
+
+
 def to_float(string):
 	"""
 	This function tries to convert a string into a float.
@@ -276,45 +724,289 @@ def to_number(string):
 	return string
 
 
+def extraction_hash(digest, extractor_version, tables):
+	"""
+	hash of a file and of everything its extracted data depends on, as in the cache and the shard
+	manifests: the stores only write the data of a file again when this hash changes
+	:param digest: the sha256 of the file
+	:param extractor_version: the version of the extractor, with its options (see EXTRACTOR_VERSION)
+	:param tables: dict mapping each currency to the fingerprint of its price table
+	:return: the hash, as a string
+	"""
+	fingerprint = hashlib.sha1(";".join(f"{c}={h}" for c, h in sorted(tables.items())).encode("utf-8"))
+	return f"{digest}:{extractor_version}:{fingerprint.hexdigest()}"
+
+
 # ============== COMMAND LINE INTERFACE ============== #
 if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="extract the data of the catalogues to output/*.json")
+	parser.add_argument("-j", "--jobs", type=int, default=1,
+						help="number of worker processes (0 to use all the CPUs) ; default: 1")
+	parser.add_argument("-s", "--stream", action="store_true",
+						help="parse the files with stream_extractor(), which doesn't load whole files in memory")
+	parser.add_argument("-x", "--extra-stats", action="store_true",
+						help="add the 10th and 90th percentiles of the prices and statistics for each currency "
+							 "to the catalogues' data")
+	parser.add_argument("-f", "--format", nargs="+", choices=["json", "jsonl", "parquet", "arrow"], default=["json"],
+						help="formats of the output files: json, jsonl (JSON Lines), parquet and/or arrow (Arrow IPC) ; "
+							 "default: json")
+	parser.add_argument("--compact", action="store_true",
+						help="write the json and jsonl outputs as compact JSON (no indentation, UTF-8 characters), "
+							 "which is faster to write and to read")
+	parser.add_argument("--compress", choices=list(COMPRESSIONS), default=None,
+						help="compress the json and jsonl outputs with gzip or zstd (export_item.json.gz or .zst)")
+	parser.add_argument("--json-backend", choices=BACKENDS, default="auto",
+						help="encoder of the compact JSON: orjson, json (standard library) or auto (orjson if "
+							 "it is installed) ; default: auto")
+	parser.add_argument("--sqlite", nargs="?", const=f"{curdir}/../output/export.sqlite",
+						help="also write the data to a SQLite database (default: output/export.sqlite) ; "
+							 "only the rows of the files that changed are replaced")
+	parser.add_argument("--cubes", nargs="?", const=f"{curdir}/../output/cubes.sqlite",
+						help="also write the aggregates of the prices by sell year, type of catalogue, term, format "
+							 "and author to a SQLite database (default: output/cubes.sqlite), to query with "
+							 "aggregates.py ; only the aggregates of the files that changed are computed again")
+	parser.add_argument("--blocking", nargs="?", const=f"{curdir}/../output/blocking.sqlite",
+						help="also write the blocking index of the descs (blocks by author, term, format, date and "
+							 "MinHash of the text) to a SQLite database (default: output/blocking.sqlite), to get "
+							 "the candidate pairs of the reconciliation with blocking.py")
+	parser.add_argument("--tsv", nargs="?", const=f"{curdir}/../output/list_desc.tsv",
+						help="also write the tab-separated listing of the tei:descs of list_desc.xsl "
+							 "(default: output/list_desc.tsv), from the trees parsed for the extraction")
+	parser.add_argument("--authors", nargs="?", const=f"{curdir}/../output/author_index.json",
+						help="also write the index of the authors (wikidata ids, items, catalogues and prices of "
+							 "each author) to a JSON file (default: output/author_index.json), to query with authors.py")
+	parser.add_argument("--shard", default=None, metavar="SHARD",
+						help="only extract a subfolder of Catalogues/ (101-200) or a range of catalogue numbers "
+							 "(101-150) to output/shards/SHARD, with a manifest, to merge with shards.py ; "
+							 "with --incremental, a shard whose files didn't change is not extracted again")
+	parser.add_argument("--shards-dir", default=f"{curdir}/../output/shards",
+						help="folder of the outputs of the shards ; default: output/shards/")
+	parser.add_argument("-i", "--incremental", action="store_true",
+						help="only re-extract the files that changed since the last incremental run")
+	parser.add_argument("--cache-dir", default=f"{curdir}/../cache",
+						help="directory of the cache used by --incremental ; default: cache/")
+	parser.add_argument("--skeletons", action="store_true",
+						help="keep the skeleton of each file (the elements read by the extraction) in the cache "
+							 "directory and parse it instead of the file when the file didn't change")
+	parser.add_argument("--stats-out", default=None,
+						help="write the statistics of the extraction of each file (timings, number of descs, "
+							 "items, price conversions and bytes read) to this JSON file")
+	parser.add_argument("--profile", nargs="?", type=int, const=10, default=None, metavar="N",
+						help="run the extraction of each file with cProfile and keep the profiles and collapsed "
+							 "stacks of the N slowest files in output/profile ; default N: 10")
+	args = parser.parse_args()
+	jobs = args.jobs if args.jobs > 0 else os.cpu_count()
+	try:
+		serializer = Serializer(args.compact, args.json_backend)
+		check_compression(args.compress)
+	except ImportError as error:
+		parser.error(str(error))
+	suffix = COMPRESSIONS.get(args.compress, "")  # extension of the compressed outputs
 
 	# This way, we get every single file contained in any subfolder of Catalogues/.
-	files = glob.glob(f"{curdir}/../Catalogues/**/*.xml", recursive=True)
-
-	output_dict = {}  # dictionary to store the data on the items retrieved in data_extractor()
-	catalog_dict = {}  # dictionary to store the data on the catalogs retrieved in catalog_extractor()
-
-	for file in files:
-		# additional error handling: if there is an error here (the only step where there can
-		# be an error, really), print the name of the file on which the error happened, the
-		# full error message and exit)
+	# the files are sorted so that the output is the same whatever the number of jobs
+	files = sorted(glob.glob(f"{curdir}/../Catalogues/**/*.xml", recursive=True))
+	# with --shard, only the files of the shard are extracted: the cache, the skeletons and the
+	# databases keep the entries of the other files
+	if args.shard is not None:
+		if "json" not in args.format:
+			parser.error("--shard needs the json format, which is merged by shards.py")
 		try:
-			# Each file is parsed and the functions are run
-			tree = etree.parse(file)
-
-			item_extractor(tree, output_dict)
-			catalog_extractor(tree, catalog_dict)
-
-		except:
-			error = traceback.format_exc()  # full error message
-			print(f"ERROR ON FILE --- {file}")
-			print(error)
-			sys.exit(1)
+			files = shard_files(files, args.shard, f"{curdir}/../Catalogues")
+		except ValueError as error:
+			parser.error(str(error))
+	complete = args.shard is None
+	# compile the binary price tables if the price tables changed, before the workers are started
+	price_converter.compile()
+
+	output_dict = {}  # dictionary to store the data on the items retrieved in item_extractor()
+	catalog_dict = {}  # dictionary to store the data on the catalogs retrieved in catalog_extractor()
+	errors = []  # files on which the extraction failed
+	cached = {}  # file -> (output_dict, catalog_dict) of the files whose results are in the cache
+	digests = {}  # file -> sha256 of the file, to store its results in the cache
+
+	extractor_version = EXTRACTOR_VERSION + ("+extra_stats" if args.extra_stats else "")
+	# in incremental mode, get the results of the unchanged files from the cache
+	# and only extract the other files
+	if args.incremental:
+		cache = ExtractionCache(cache_dir=args.cache_dir, source_dir=f"{curdir}/../Catalogues",
+								extractor_version=extractor_version,
+								converter=price_converter)
+		for file in files:
+			digests[file] = cache.file_hash(file)
+			results = cache.lookup(file, digests[file])
+			if results is not None:
+				cached[file] = results
+		todo = [file for file in files if file not in cached]
+	else:
+		cache = None
+		todo = files
+	# the skeletons are kept next to the cached results ; they don't depend on the version of the extractor
+	skeletons = None
+	if args.skeletons:
+		skeletons = SkeletonCache(cache_dir=os.path.join(args.cache_dir, "skeletons"),
+								  source_dir=f"{curdir}/../Catalogues")
+	if args.sqlite or args.cubes or args.blocking or args.shard is not None:
+		for file in files:
+			if file not in digests:
+				digests[file] = ExtractionCache.file_hash(file)
 
 	# check if output directory exists ; if not, create it
 	cwd = os.path.dirname(os.path.abspath(__file__))  # current directory : script
 	root = Path(cwd).parent
 	output_dir = os.path.join(root, "output")
+	if args.shard is not None:
+		output_dir = os.path.join(args.shards_dir, shard_name(args.shard))
+		sources = {source_path(file, f"{curdir}/../Catalogues"): digests[file] for file in files}
+		if args.incremental and is_current(output_dir, sources, extractor_version, price_converter.hashes,
+										   names=[name + suffix for name in OUTPUTS.values()], compact=args.compact):
+			print(f"shard {args.shard}: {len(files)} file(s) unchanged since its last extraction")
+			sys.exit(0)
+		# the shard is incomplete until its new manifest is written
+		if os.path.isfile(os.path.join(output_dir, MANIFEST)):
+			os.remove(os.path.join(output_dir, MANIFEST))
+		shard_sources = {}  # source -> entry of the file in the manifest
 	if not os.path.isdir(output_dir):
 		os.makedirs(output_dir)
 
-	# write the outputs to the output files
-	with open(f'{curdir}/../output/export_item.json', 'w') as outfile:
-		# Older data are deleted. 
-		outfile.truncate(0)
-		json.dump(output_dict, outfile, indent=4)
-	with open(f'{curdir}/../output/export_catalog.json', 'w') as outfile:
-		# Older data are deleted.
-		outfile.truncate(0)
-		json.dump(catalog_dict, outfile, indent=4)
+	# the json outputs are written as each file is processed, to temporary files that replace
+	# the output files at the end ; the columnar outputs need all the data in memory first
+	writers = []  # (item writer, catalog writer) tuples
+	if "json" in args.format:
+		writers.append((JsonObjectWriter(f"{output_dir}/export_item.json{suffix}", serializer=serializer),
+						JsonObjectWriter(f"{output_dir}/export_catalog.json{suffix}", serializer=serializer)))
+	if "jsonl" in args.format:
+		writers.append((JsonLinesWriter(f"{output_dir}/export_item.jsonl{suffix}", id_key="desc_id",
+										serializer=serializer),
+						JsonLinesWriter(f"{output_dir}/export_catalog.jsonl{suffix}", id_key="cat_id",
+										serializer=serializer)))
+	keep = "parquet" in args.format or "arrow" in args.format
+	store = SqliteStore(args.sqlite) if args.sqlite else None
+	cubes = CubeStore(args.cubes) if args.cubes else None
+	blocking = BlockingStore(args.blocking) if args.blocking else None
+	author_index = AuthorIndex() if args.authors else None
+	tsv_writer = TsvWriter(args.tsv, TSV_COLUMNS) if args.tsv else None
+
+	# with --stats-out or --profile, the statistics of each file are collected
+	telemetry = RunTelemetry() if args.stats_out or args.profile is not None else None
+	profile_dir = None
+	if args.profile is not None:
+		profile_dir = os.path.join(output_dir, "profile")
+		os.makedirs(profile_dir, exist_ok=True)
+
+	with ExitStack() as stack:
+		for item_writer, catalog_writer in writers:
+			stack.enter_context(item_writer)
+			stack.enter_context(catalog_writer)
+		if store is not None:
+			stack.enter_context(store)
+		if cubes is not None:
+			stack.enter_context(cubes)
+		if blocking is not None:
+			stack.enter_context(blocking)
+		if tsv_writer is not None:
+			stack.enter_context(tsv_writer)
+		# with --stream and a single job, the descs are written as they are extracted, unless the data
+		# of whole files is needed (cache, databases, author index, columnar formats, telemetry, shards)
+		lazy = all(consumer is None for consumer in (cache, store, cubes, blocking, author_index, telemetry, args.shard)) \
+			and not keep
+		# the manifests of the shards hold the extraction time of each file
+		extracted = run_extraction(todo, jobs, args.stream, args.extra_stats,
+								   telemetry is not None or args.shard is not None, profile_dir,
+								   records=True, skeletons=skeletons, listing=tsv_writer is not None, lazy=lazy)
+		for file, file_output, file_catalog, error, stats, rows in ordered_results(files, cached, extracted):
+			if not isinstance(file_output, dict):
+				error = write_batches(file_output, [item_writer for item_writer, _ in writers])
+				file_output = {}
+			# additional error handling: if there is an error on a file, print the name of the
+			# file on which the error happened and the full error message ; the other files
+			# are still processed and the script exits with an error once the outputs are written
+			if error is not None:
+				print(f"ERROR ON FILE --- {file}")
+				print(error)
+				errors.append(file)
+				continue
+			if telemetry is not None:
+				telemetry.add(stats)
+			if cache is not None and file not in cached:
+				cache.store(file, file_output, file_catalog, digests[file])
+			# write the results of the file, always in the same order
+			for item_writer, catalog_writer in writers:
+				item_writer.write(file_output)
+				catalog_writer.write(file_catalog)
+			if store is not None:
+				store.upsert(os.path.relpath(file, f"{curdir}/../Catalogues"), file_output, file_catalog,
+							 source_hash=extraction_hash(digests[file], extractor_version, price_converter.hashes))
+			if cubes is not None:
+				cubes.update(os.path.relpath(file, f"{curdir}/../Catalogues"), file_output, file_catalog,
+							 source_hash=extraction_hash(digests[file], extractor_version, price_converter.hashes))
+			if blocking is not None:
+				blocking.update(os.path.relpath(file, f"{curdir}/../Catalogues"), file_output, file_catalog,
+								source_hash=extraction_hash(digests[file], extractor_version, price_converter.hashes))
+			if author_index is not None:
+				author_index.add(file_output, file_catalog)
+			if tsv_writer is not None:
+				# the cached files and the files extracted with --stream have no tree: they are parsed again
+				if rows is None:
+					_, rows, error = list_file(file, skeletons)
+				if error is not None:
+					print(f"ERROR ON FILE --- {file}")
+					print(error)
+					errors.append(file)
+				tsv_writer.write(rows)
+			if keep:
+				output_dict.update(file_output)
+				catalog_dict.update(file_catalog)
+			if args.shard is not None:
+				shard_sources[source_path(file, f"{curdir}/../Catalogues")] = {
+					"sha256": digests[file], "items": len(file_output), "catalogues": len(file_catalog),
+					"seconds": stats["total"] if stats is not None else None
+				}
+		if store is not None:
+			if complete:
+				store.prune(os.path.relpath(file, f"{curdir}/../Catalogues") for file in files)
+			print(f"SQLite: {store.updated} file(s) updated, {store.skipped} file(s) unchanged")
+		if cubes is not None:
+			if complete:
+				cubes.prune(os.path.relpath(file, f"{curdir}/../Catalogues") for file in files)
+			print(f"aggregates: {cubes.updated} file(s) updated, {cubes.skipped} file(s) unchanged")
+		if blocking is not None:
+			if complete:
+				blocking.prune(os.path.relpath(file, f"{curdir}/../Catalogues") for file in files)
+			print(f"blocking index: {blocking.updated} file(s) updated, {blocking.skipped} file(s) unchanged")
+
+	if cache is not None:
+		deleted = cache.prune(files) if complete else 0
+		print(f"{cache.hits} file(s) from the cache, {len(todo)} file(s) extracted, "
+			  f"{deleted} outdated cache entry(ies) deleted")
+	if skeletons is not None and complete:
+		skeletons.prune(files)
+
+	# the manifest of a shard is only written if every file of the shard was extracted
+	if args.shard is not None and not errors:
+		# the json writers are the first ones
+		outputs = {os.path.basename(writer.path): {"records": writer.count, "sha256": file_sha256(writer.path)}
+				   for writer in writers[0]}
+		write_manifest(output_dir, build_manifest(args.shard, extractor_version, price_converter.hashes,
+												  shard_sources, outputs, compact=args.compact))
+		print(f"shard {args.shard}: {len(files)} file(s), manifest written to {output_dir}")
+
+	for fmt in ("parquet", "arrow"):
+		if fmt in args.format:
+			write_tables(output_dict, catalog_dict, output_dir, fmt)
+
+	if author_index is not None:
+		author_index.write(args.authors)
+		print(f"index of {len(author_index.authors)} author(s) written to {args.authors}")
+
+	if telemetry is not None:
+		telemetry.report(args.profile or 10)
+		if args.stats_out:
+			telemetry.write(args.stats_out)
+		if profile_dir is not None:
+			kept = telemetry.keep_profiles(profile_dir, args.profile)
+			print(f"profiles of the {len(kept)} slowest file(s) written to {profile_dir} (.prof and .folded)")
+
+	if errors:
+		print(f"{len(errors)} file(s) could not be processed: " + ", ".join(errors))
+		sys.exit(1)
@@ -1,3 +1,7 @@
+import os
+import glob
+import shutil
+import tempfile
 import unittest
 from lxml import etree
 
@@ -40,17 +44,20 @@ class Data_extraction(unittest.TestCase):
 			"""
         )
         output_dict = {}
-        data_extractor(tree, output_dict)
+        item_extractor(tree, output_dict)
 
         test_dict = {
             "CAT_000112_e18_d1": {
                 "author": "Barry",
+                "author_wikidata_id": None,
+                "currency": "FRF",
                 "date": "1846",
                 "desc": "L. a. s. au colonel Fox; 1846, 1 p. in-8.",
                 "format": 8,
                 "number_of_pages": 1.0,
                 "price": 15.0,
-                "sell_date": "1887-11",
+                "price_c": 15.3,
+                "sell_date": "Novembre 1887",
                 "term": 7,
             }
         }
@@ -92,27 +99,33 @@ class Data_extraction(unittest.TestCase):
         )
 
         output_dict = {}
-        data_extractor(tree, output_dict)
+        item_extractor(tree, output_dict)
 
         test_dict = {
             "CAT_000112_e18_d1": {
                 "author": "Barry",
+                "author_wikidata_id": None,
+                "currency": "FRF",
                 "date": "1846",
                 "desc": "L. a. s. au colonel Fox; 1846, 1 p. in-8.",
                 "format": 8,
                 "number_of_pages": 1.0,
                 "price": 55.0,
-                "sell_date": "1887-11",
+                "price_c": 56.1,
+                "sell_date": "Novembre 1887",
                 "term": 7,
             },
             "CAT_000112_e18_d2": {
                 "author": "Barry",
+                "author_wikidata_id": None,
+                "currency": "FRF",
                 "date": "1846-08-01",
                 "desc": "L. a. s. au colonel Fox; 1er août 1846, 3 p. in-4.",
                 "format": 4,
                 "number_of_pages": 3.0,
                 "price": 55.0,
-                "sell_date": "1887-11",
+                "price_c": 56.1,
+                "sell_date": "Novembre 1887",
                 "term": 7,
             }
         }
@@ -151,17 +164,20 @@ class Data_extraction(unittest.TestCase):
 			"""
                                 )
         output_dict = {}
-        data_extractor(tree, output_dict)
+        item_extractor(tree, output_dict)
 
         test_dict = {
             "CAT_000112_e18_d1": {
                 "author": None,
+                "author_wikidata_id": None,
+                "currency": "FRF",
                 "date": "1846",
                 "desc": "L. a. s. au colonel Fox; 1846, in-8.",
                 "format": 8,
                 "number_of_pages": None,
                 "price": 15.0,
-                "sell_date": "1887-11",
+                "price_c": 15.3,
+                "sell_date": "Novembre 1887",
                 "term": 7,
             }
         }
@@ -228,47 +244,59 @@ class Data_extraction(unittest.TestCase):
 			"""
         )
         output_dict = {}
-        data_extractor(tree, output_dict)
+        item_extractor(tree, output_dict)
 
         test_dict = {
             "CAT_000112_e18_d1": {
                 "author": "Barry",
+                "author_wikidata_id": None,
+                "currency": "FRF",
                 "date": "1846",
                 "desc": "L. a. s. au colonel Fox; 1846, 1 p. in-8.",
                 "format": 8,
                 "number_of_pages": 1.0,
                 "price": 15.0,
-                "sell_date": "1887-11",
+                "price_c": 15.3,
+                "sell_date": "Novembre 1887",
                 "term": 7,
             },
             "CAT_000112_e19_d1": {
                 "author": "Barry",
+                "author_wikidata_id": None,
+                "currency": "FRF",
                 "date": "1846",
                 "desc": "L. a. s. au colonel Fox; 1846, 1 p. in-8.",
                 "format": 8,
                 "number_of_pages": 1.0,
                 "price": 15.0,
-                "sell_date": "1887-11",
+                "price_c": 15.3,
+                "sell_date": "Novembre 1887",
                 "term": 7,
             },
             "CAT_000112_e20_d1": {
                 "author": "Barry",
+                "author_wikidata_id": None,
+                "currency": "FRF",
                 "date": "1846",
                 "desc": "L. a. s. au colonel Fox; 1846, 1 p. in-8.",
                 "format": 8,
                 "number_of_pages": 1.0,
                 "price": 15.0,
-                "sell_date": "1887-11",
+                "price_c": 15.3,
+                "sell_date": "Novembre 1887",
                 "term": 7,
             },
             "CAT_000112_e21_d1": {
                 "author": "Barry",
+                "author_wikidata_id": None,
+                "currency": "FRF",
                 "date": "1846",
                 "desc": "L. a. s. au colonel Fox; 1846, 1 p. in-8.",
                 "format": 8,
                 "number_of_pages": 1.0,
                 "price": 15.0,
-                "sell_date": "1887-11",
+                "price_c": 15.3,
+                "sell_date": "Novembre 1887",
                 "term": 7,
             }
         }
@@ -276,5 +304,165 @@ class Data_extraction(unittest.TestCase):
         self.assertDictEqual(output_dict, test_dict)
 
 
+class Parallel_extraction(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.files = sorted(glob.glob(f"{curdir}/../Catalogues/1-100/*.xml"))[:6]
+        bad = os.path.join(self.tmpdir, "CAT_broken.xml")
+        with open(bad, mode="w") as f:
+            f.write("<TEI><text>")
+        self.files.insert(3, bad)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_same_results_as_serial(self):
+        serial = list(run_extraction(self.files, jobs=1))
+        parallel = list(run_extraction(self.files, jobs=3))
+        self.assertEqual([r[0] for r in parallel], self.files)
+        self.assertEqual(serial, parallel)
+
+    def test_bad_file_is_reported(self):
+        results = list(run_extraction(self.files, jobs=2))
+        errors = [r for r in results if r[3] is not None]
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(errors[0][0], self.files[3])
+        self.assertEqual(len([r for r in results if r[2]]), 6)
+
+
+class Stream_extraction(unittest.TestCase):
+
+    def test_same_results_as_tree(self):
+        for file in sorted(glob.glob(f"{curdir}/../Catalogues/301-400/*.xml"))[:10]:
+            tree = etree.parse(file)
+            output_dict = item_extractor(tree, {})
+            catalog_dict = catalog_extractor(tree, {})
+            stream_catalog = {}
+            self.assertEqual(list(stream_extractor(file, stream_catalog)), list(output_dict.items()))
+            self.assertEqual(stream_catalog, catalog_dict)
+
+    def test_batches(self):
+        file = sorted(glob.glob(f"{curdir}/../Catalogues/301-400/*.xml"))[0]
+        tree = etree.parse(file)
+        output_dict = item_extractor(tree, {})
+        _, batches, catalog_dict, _, _, _ = stream_file(file, batch_size=7)
+        self.assertEqual(catalog_dict, {})  # filled once all the descs are read
+        written = []
+
+        class Writer:
+            def write(self, records):
+                written.append(records)
+
+        self.assertIsNone(write_batches(batches, [Writer()]))
+        self.assertTrue(all(len(batch) <= 7 for batch in written))
+        self.assertEqual([item for batch in written for item in batch.items()], list(output_dict.items()))
+        self.assertEqual(catalog_dict, catalog_extractor(tree, {}))
+        _, batches, _, _, _, _ = stream_file(f"{curdir}/../Catalogues/missing.xml")
+        self.assertIn("missing.xml", write_batches(batches, [Writer()]))
+
+
+class Shared_tree(unittest.TestCase):
+
+    # the price of the second item is inside its desc
+    catalogue = """<TEI xmlns="http://www.tei-c.org/ns/1.0" xml:id="CAT_000112">
+ <teiHeader><fileDesc><sourceDesc><bibl><date when="1887-11">Novembre 1887</date></bibl></sourceDesc></fileDesc></teiHeader>
+ <text><body><list>
+  <item n="18" xml:id="CAT_000112_e18">
+   <name type="author">Barry (Ch.)</name>
+   <desc xml:id="CAT_000112_e18_d1"><term ana="#document_type_7">L. a. s.</term> au colonel Fox</desc>
+   <measure commodity="currency" unit="FRF" quantity="15">15</measure>
+  </item>
+  <item n="19" xml:id="CAT_000112_e19">
+   <name type="author">Hugo</name>
+   <desc xml:id="CAT_000112_e19_d1"><term ana="#document_type_3">Pièce</term> signée, <measure commodity="currency" unit="FRF" quantity="40">40 fr.</measure></desc>
+  </item>
+ </list></body></text>
+</TEI>"""
+
+    def test_tree_not_modified(self):
+        tree = etree.fromstring(self.catalogue)
+        before = etree.tostring(tree)
+        output_dict = item_extractor(tree, {})
+        self.assertEqual(etree.tostring(tree), before)
+        self.assertEqual(output_dict["CAT_000112_e19_d1"]["desc"], "Pièce signée, 40 fr.")
+
+    def test_catalog_stats_independent_of_order(self):
+        tree = etree.fromstring(self.catalogue)
+        catalog_first = catalog_extractor(tree, {})
+        item_extractor(tree, {})
+        catalog_after = catalog_extractor(tree, {})
+        self.assertEqual(catalog_first, catalog_after)
+        self.assertEqual(catalog_after["CAT_000112"]["high_price_items_c"], {"CAT_000112_e19": 40.8})
+        for file in sorted(glob.glob(f"{curdir}/../Catalogues/201-300/*.xml"))[:10]:
+            tree = etree.parse(file)
+            catalog_first = catalog_extractor(tree, {})
+            item_extractor(tree, {})
+            self.assertEqual(catalog_extractor(tree, {}), catalog_first)
+
+
+class Shared_prices(unittest.TestCase):
+
+    # the first item has two prices, the @quantity of the second one is not a regular number
+    catalogue = """<TEI xmlns="http://www.tei-c.org/ns/1.0" xml:id="CAT_000175">
+ <teiHeader><fileDesc><sourceDesc><bibl><date when="1887-11">Novembre 1887</date></bibl></sourceDesc></fileDesc></teiHeader>
+ <text><body><list>
+  <item n="12" xml:id="CAT_000175_e12">
+   <desc xml:id="CAT_000175_e12_d1"><term ana="#document_type_7">L. a. s.</term></desc>
+   <measure commodity="currency" unit="FRF" quantity="4">4</measure>
+   <desc xml:id="CAT_000175_e12_d2"><term ana="#document_type_7">L. a. s.</term></desc>
+   <measure commodity="currency" unit="FRF" quantity="5">5</measure>
+  </item>
+  <item n="13" xml:id="CAT_000175_e13">
+   <desc xml:id="CAT_000175_e13_d1"><term ana="#document_type_3">Pièce</term></desc>
+   <measure commodity="currency" unit="FRF" quantity=".5"> 50</measure>
+  </item>
+ </list></body></text>
+</TEI>"""
+
+    def test_item_and_catalogue_prices(self):
+        tree = etree.fromstring(self.catalogue)
+        prices = {}
+        output_dict = item_extractor(tree, {}, prices=prices)
+        # the descs keep the first price of their item, the catalogue adds up the prices of the item
+        self.assertEqual(output_dict["CAT_000175_e12_d1"]["price"], 4.0)
+        self.assertEqual(output_dict["CAT_000175_e12_d2"]["price"], 4.0)
+        self.assertEqual(output_dict["CAT_000175_e13_d1"]["price"], 0.5)
+        catalogue = catalog_extractor(tree, {}, prices=prices)["CAT_000175"]
+        self.assertEqual(catalogue, catalog_extractor(tree, {})["CAT_000175"])
+        self.assertEqual(catalogue["high_price_items_c"],
+                         {"CAT_000175_e12": price_converter.convert(date="1887", currency="FRF", price=9.0)})
+        self.assertEqual(catalogue["low_price_c"], output_dict["CAT_000175_e13_d1"]["price_c"])
+
+    def test_prices_read_once(self):
+        # the catalogues are the same with the prices read by item_extractor(), with fewer conversions,
+        # including when the year of the catalogue is not the year of the sell date of the items
+        files = sorted(glob.glob(f"{curdir}/../Catalogues/**/CAT_00008[5-7]*.xml", recursive=True))
+        for file in files:
+            with self.subTest(file=file):
+                tree = etree.parse(file)
+                prices = {}
+                item_extractor(tree, {}, prices=prices)
+                conversions = price_converter.conversions
+                shared = catalog_extractor(tree, {}, extra_stats=True, prices=prices)
+                shared_conversions = price_converter.conversions - conversions
+                conversions = price_converter.conversions
+                self.assertEqual(shared, catalog_extractor(tree, {}, extra_stats=True))
+                self.assertLessEqual(shared_conversions, price_converter.conversions - conversions)
+
+
+class Extraction_hash(unittest.TestCase):
+
+    def test_depends_on_tables_and_options(self):
+        tables = {"FRF": "a", "GBP": "b"}
+        digest = "0" * 64
+        self.assertEqual(extraction_hash(digest, EXTRACTOR_VERSION, tables),
+                         extraction_hash(digest, EXTRACTOR_VERSION, dict(reversed(tables.items()))))
+        self.assertNotEqual(extraction_hash(digest, EXTRACTOR_VERSION, tables),
+                            extraction_hash(digest, EXTRACTOR_VERSION, {"FRF": "c", "GBP": "b"}))
+        self.assertNotEqual(extraction_hash(digest, EXTRACTOR_VERSION, tables),
+                            extraction_hash(digest, EXTRACTOR_VERSION + "+extra_stats", tables))
+
+
 if __name__ == "__main__":
     unittest.main()
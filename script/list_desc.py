@@ -0,0 +1,184 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# --------------------------------------------------------------------------------------------------
+# Katabase project: github.com/katabase/
+# Tab-separated listing of the tei:descs of the catalogues, as list_desc.xsl (option --tsv)
+#
+# * PROCESS BREAKDOWN *
+# - desc_rows() builds the row of every tei:desc[@xml:id] of a parsed catalogue, in document order:
+#   its tei:term (text and @ana), its tei:measure[@type="length"] (text, @unit and @n), its
+#   tei:measure[@type="format"] (text, @unit and @ana), its tei:date (text and @when) and its
+#   normalised text ; the values are the ones written by list_desc.xsl with an XSLT 3.0 processor:
+#   the whitespace-only text nodes are dropped (xsl:strip-space), the text nodes of a column are
+#   put together without separator and its attributes are separated by a space (xsl:value-of) ;
+# - extractor_json.py --tsv builds the rows from the tree it parsed for the extraction ; list_file()
+#   parses a file and builds its rows, and run_listing() runs it on every file, either in a single
+#   process or in a pool of processes ;
+# - if __name__ == "__main__", the rows of each file are written to output/list_desc.tsv as soon as
+#   the file is processed (see writers.TsvWriter), instead of loading the whole corpus as the
+#   collection() of list_desc.xsl does.
+# usage: python3 list_desc.py [-o ../output/list_desc.tsv] [-j 4] [--skeletons]
+# --------------------------------------------------------------------------------------------------
+
+
+import os
+import re
+import sys
+import glob
+import argparse
+import traceback
+from functools import partial
+from multiprocessing import Pool
+from lxml import etree
+
+from skeleton import SkeletonCache, extraction_parser
+from writers import TsvWriter
+
+
+curdir = os.path.abspath(os.path.dirname(os.path.abspath(__file__)))
+
+TEI = "{http://www.tei-c.org/ns/1.0}"
+XML_ID = "{http://www.w3.org/XML/1998/namespace}id"
+# columns of list_desc.xsl, with the same names (including the space after "Format @unit")
+COLUMNS = ["Id", "Term", "Term @ana", "Length", "Length @unit", "Length @n", "Format", "Format @unit ",
+		   "Format @ana", "Date", "Date @when", "Desc"]
+WHITESPACE = " \t\r\n"  # the whitespace characters of XML ; the text nodes made of them only are dropped
+space_pattern = re.compile(f"[{WHITESPACE}]+")  # as in normalize-space()
+
+
+# ============== ROWS ============== #
+def desc_rows(tree):
+	"""
+	build the rows of the tei:descs of a catalogue
+	:param tree: an XML tree or an element of a catalogue
+	:return: dict mapping the @xml:id of each tei:desc to its row (the values of the columns of COLUMNS
+			 after "Id", as strings), in document order
+	"""
+	rows = {}
+	for desc in tree.iter(f"{TEI}desc"):
+		desc_id = desc.get(XML_ID)
+		if desc_id is not None:
+			rows[desc_id] = desc_row(desc)
+	return rows
+
+
+def desc_row(desc):
+	"""
+	build the row of a tei:desc, in a single pass over its children
+	:param desc: a tei:desc element
+	:return: tuple of strings, in the order of COLUMNS (without "Id")
+	"""
+	terms, lengths, formats, dates = [], [], [], []
+	for child in desc:
+		if child.tag == f"{TEI}term":
+			terms.append(child)
+		elif child.tag == f"{TEI}measure" and child.get("type") == "length":
+			lengths.append(child)
+		elif child.tag == f"{TEI}measure" and child.get("type") == "format":
+			formats.append(child)
+		elif child.tag == f"{TEI}date":
+			dates.append(child)
+	# normalize-space(.): the text of the desc and of its descendants
+	text = "".join([value for value in desc.itertext() if value.strip(WHITESPACE)])
+	return (texts(terms), attributes(terms, "ana"),
+			texts(lengths), attributes(lengths, "unit"), attributes(lengths, "n"),
+			texts(formats), attributes(formats, "unit"), attributes(formats, "ana"),
+			texts(dates), attributes(dates, "when"),
+			space_pattern.sub(" ", text).strip(" "))
+
+
+def texts(elements):
+	"""
+	:param elements: a list of elements
+	:return: the value of "element/text()" in an xsl:value-of: the text nodes directly inside the
+			 elements, without the whitespace-only ones, put together without separator
+	"""
+	values = []
+	for element in elements:
+		values.append(element.text)
+		values.extend(child.tail for child in element)
+	return "".join([value for value in values if value and value.strip(WHITESPACE)])
+
+
+def attributes(elements, attribute):
+	"""
+	:param elements: a list of elements
+	:param attribute: the name of an attribute
+	:return: the value of "element/@attribute" in an xsl:value-of: the values of the attribute,
+			 separated by a space
+	"""
+	values = [element.get(attribute) for element in elements]
+	return " ".join([value for value in values if value is not None])
+
+
+# ============== FILE PROCESSING ============== #
+def list_file(file, skeletons=None):
+	"""
+	parse an XML file and build the rows of its tei:descs. this function is run in the worker
+	processes when listing with several jobs, so errors are caught and returned.
+	:param file: path to an XML catalogue
+	:param skeletons: a skeleton.SkeletonCache: if it is not None, the skeleton of the file is parsed
+					  instead of the whole file (see skeleton.py)
+	:return: tuple of (file, rows, error): the rows of the file (see desc_rows()) and the full error
+			 message (or None if the file was processed without problems)
+	"""
+	try:
+		if skeletons is not None:
+			tree, _ = skeletons.parse(file)
+		else:
+			tree = etree.parse(file, extraction_parser)
+		return file, desc_rows(tree), None
+	except Exception:
+		return file, {}, traceback.format_exc()
+
+
+def run_listing(files, jobs=1, skeletons=None):
+	"""
+	run list_file() on every file, either in this process or in a pool of `jobs` worker
+	processes ; the results are yielded in the order of `files`
+	:param files: list of paths to XML catalogues
+	:param jobs: number of worker processes
+	:param skeletons: a skeleton.SkeletonCache to parse the skeletons of the files, or None
+	:return: generator of list_file() results
+	"""
+	listing = partial(list_file, skeletons=skeletons)
+	if jobs > 1:
+		with Pool(processes=jobs) as pool:
+			yield from pool.imap(listing, files)
+	else:
+		yield from (listing(file) for file in files)
+
+
+# ============== COMMAND LINE INTERFACE ============== #
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="write the tab-separated listing of the tei:descs of the catalogues")
+	parser.add_argument("-o", "--output", default=f"{curdir}/../output/list_desc.tsv",
+						help="path of the listing ; default: output/list_desc.tsv")
+	parser.add_argument("-j", "--jobs", type=int, default=1,
+						help="number of worker processes (0 to use all the CPUs) ; default: 1")
+	parser.add_argument("--cache-dir", default=f"{curdir}/../cache",
+						help="directory of the skeletons used by --skeletons ; default: cache/")
+	parser.add_argument("--skeletons", action="store_true",
+						help="parse the skeletons of the files kept in the cache directory (see extractor_json.py)")
+	args = parser.parse_args()
+	jobs = args.jobs if args.jobs > 0 else os.cpu_count()
+
+	files = sorted(glob.glob(f"{curdir}/../Catalogues/**/*.xml", recursive=True))
+	skeletons = None
+	if args.skeletons:
+		skeletons = SkeletonCache(cache_dir=os.path.join(args.cache_dir, "skeletons"),
+								  source_dir=f"{curdir}/../Catalogues")
+	errors = []
+	with TsvWriter(args.output, COLUMNS) as writer:
+		for file, rows, error in run_listing(files, jobs, skeletons):
+			if error is not None:
+				print(f"ERROR ON FILE --- {file}")
+				print(error)
+				errors.append(file)
+				continue
+			writer.write(rows)
+	print(f"{writer.count} desc(s) written to {args.output}")
+	if errors:
+		print(f"{len(errors)} file(s) could not be processed: " + ", ".join(errors))
+		sys.exit(1)
@@ -0,0 +1,91 @@
+import os
+import glob
+import shutil
+import tempfile
+import unittest
+from lxml import etree
+
+from extractor_json import extract_file, curdir
+from skeleton import SkeletonCache, extraction_parser
+from list_desc import *
+
+
+def xsl_rows(file):
+    # the rows of list_desc.xsl, with the XPath expressions of the stylesheet: the whitespace-only
+    # text nodes are dropped (xsl:strip-space), the text nodes of a column are put together and its
+    # attributes separated by a space (xsl:value-of)
+    ns = {"tei": "http://www.tei-c.org/ns/1.0"}
+    tree = etree.parse(file)
+    for element in tree.iter():
+        if element.text is not None and not element.text.strip(" \t\r\n"):
+            element.text = None
+        if element.tail is not None and not element.tail.strip(" \t\r\n"):
+            element.tail = None
+    rows = {}
+    for desc in tree.xpath("//tei:desc[@xml:id]", namespaces=ns):
+        def value(path, separator):
+            return separator.join(desc.xpath(path, namespaces=ns))
+        rows[desc.xpath("string(@xml:id)")] = (
+            value("tei:term/text()", ""), value("tei:term/@ana", " "),
+            value("tei:measure[@type='length']/text()", ""), value("tei:measure[@type='length']/@unit", " "),
+            value("tei:measure[@type='length']/@n", " "),
+            value("tei:measure[@type='format']/text()", ""), value("tei:measure[@type='format']/@unit", " "),
+            value("tei:measure[@type='format']/@ana", " "),
+            value("tei:date/text()", ""), value("tei:date/@when", " "),
+            desc.xpath("normalize-space(.)")
+        )
+    return rows
+
+
+class Desc_listing(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        # CAT_000091_wd.xml has a tei:desc[@xml:id] in its tei:teiHeader
+        self.files = sorted(glob.glob(f"{curdir}/../Catalogues/101-200/*.xml"))[:8] \
+            + [f"{curdir}/../Catalogues/1-100/CAT_000091_wd.xml"]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_same_as_xsl(self):
+        for file in self.files:
+            rows = desc_rows(etree.parse(file, extraction_parser))
+            self.assertEqual(list(rows.items()), list(xsl_rows(file).items()))
+            self.assertTrue(all(len(row) == len(COLUMNS) - 1 for row in rows.values()))
+
+    def test_row(self):
+        desc = etree.fromstring(
+            '<desc xmlns="http://www.tei-c.org/ns/1.0" xml:id="d1">\n  <term ana="#document_type_7">L. a. s.</term>'
+            '\n  <term ana="#x">à <hi>son</hi> fils</term> <date when="1850">1850</date>,\n'
+            '<measure type="length" unit="p" n="2">2 p.</measure> <measure type="format" unit="f" ana="#document_format_4">'
+            'in-8</measure>\n</desc>'
+        )
+        self.assertEqual(desc_row(desc), ("L. a. s.à  fils", "#document_type_7 #x", "2 p.", "p", "2", "in-8", "f",
+                                          "#document_format_4", "1850", "1850",
+                                          "L. a. s.à son fils1850, 2 p.in-8"))
+
+    def test_extraction_pass(self):
+        skeletons = SkeletonCache(os.path.join(self.tmpdir, "skeletons"), f"{curdir}/../Catalogues")
+        for file in self.files[:3]:
+            expected = list_file(file)
+            self.assertIsNone(expected[2])
+            self.assertEqual(extract_file(file, listing=True)[5], expected[1])
+            self.assertEqual(extract_file(file, listing=True, skeletons=skeletons)[5], expected[1])
+            self.assertIsNone(extract_file(file, stream=True, listing=True)[5])
+
+    def test_tsv(self):
+        path = os.path.join(self.tmpdir, "list_desc.tsv")
+        with TsvWriter(path, COLUMNS) as writer:
+            for file, rows, error in run_listing(self.files, jobs=2):
+                writer.write(rows)
+        with open(path, mode="r", encoding="utf-8") as f:
+            lines = f.read().split("\n")
+        self.assertEqual(lines[0], "Id\tTerm\tTerm @ana\tLength\tLength @unit\tLength @n\tFormat\tFormat @unit \t"
+                                   "Format @ana\tDate\tDate @when\tDesc")
+        expected = {key: row for file in self.files for key, row in xsl_rows(file).items()}
+        self.assertEqual(lines[1:], ["\t".join((key, *row)) for key, row in expected.items()] + [""])
+
+
+if __name__ == '__main__':
+    unittest.main()
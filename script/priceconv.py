@@ -1,10 +1,28 @@
 from decimal import Decimal
+import numpy as np
+import contextlib
+import hashlib
+import struct
+import mmap
 import json
+import io
 import csv
 import os
 
+from serializers import find_output, load_json
+
 
 curdir = os.path.abspath(os.path.dirname(os.path.abspath(__file__)))  # current directory
+# policies of PriceConverter.convert_array() for the years without a price index
+MISSING_POLICIES = ["raise", "nan", "nearest", "interpolate"]
+# Piketty's price indexes, from which price_index_franc.json is built (see build_convtable())
+PIKETTY_INDEX = f"{curdir}/tables/piketty_price_index.csv"
+# binary price tables compiled from the json tables (see compile_tables())
+BINARY_TABLES = f"{curdir}/tables/price_index.bin"
+BINARY_MAGIC = b"KBPRICE\0"
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct("<8sII32s32s")  # magic, version, number of currencies, checksum, sources stamp
+BINARY_ENTRY = struct.Struct("<8siiQ")  # currency, base year, number of years, offset of the rates
 
 
 # ============== GET INFO ON FOREIGN CURRENCIES ============== #
@@ -14,11 +32,10 @@ def currency_checker():
     the franc) ; should be used to add new values to price_index_foreign.json.
     for the moment, currency_checker works on the export json, so extractor_json.py
     must be ran once before updating price_index_foreign.json and the scripts to
-    take into account the new currencies
+    take into account the new currencies (the export may have been compressed with --compress)
     :return: None
     """
-    with open(f"{curdir}/../output/export_catalog.json", mode="r") as f:
-        truc = json.load(f)
+    truc = load_json(find_output(f"{curdir}/../output/export_catalog.json"))
     currency_set = []
     currency_dict = {}
     for t in truc:
@@ -75,16 +92,18 @@ def converter(csvr, m):
     return idxdict
 
 
-def build_convtable():
+def build_convtable(index_path=PIKETTY_INDEX, franc_path=f"{curdir}/tables/price_index_franc.json"):
     """
     build the conversion table for the prices in francs: link to every year
     an index to express the price in 1900 francs
     from Piketty's price indexes, create a json file mapping to each year its
     index (the number by which prices must be multiplied to have constant francs);
     using this dictionary, every year's prices can be converted in 1900 francs
+    :param index_path: path to Piketty's price indexes
+    :param franc_path: path to the price index table for francs
     :return: None
     """
-    with open(f"{curdir}/tables/piketty_price_index.csv", mode="r") as f:
+    with open(index_path, mode="r") as f:
         csvreader = csv.reader(f, delimiter=',', quotechar='"')
         f.seek(0)
         next(f)
@@ -92,17 +111,375 @@ def build_convtable():
         f.seek(0)
         next(f)
         idxdict = converter(csvr=csvreader, m=m)
-        with open(f"{curdir}/tables/price_index_franc.json", mode="w") as out:
+        with open(franc_path, mode="w") as out:
             json.dump(idxdict, out, indent=4)
     return None
 
 
+# ============== BINARY PRICE TABLES ============== #
+# the json tables are compiled into a single binary file that can be memory-mapped:
+# - a header: BINARY_MAGIC, BINARY_VERSION, the number of currencies, the sha256 of the
+#   rest of the file (checksum) and the stamp of the files it was compiled from (sources_stamp()) ;
+# - an entry for each currency: its code, the first year of its table, the number of years
+#   and the offset of its rates in the file ;
+# - the rates of each currency, as float64 indexed by `year - base_year` (NaN for the years
+#   without a price index).
+def read_json_tables(franc_path, foreign_path):
+    """
+    read both json tables as {currency: {year: index}} ("FRF" for the francs)
+    :param franc_path: path to the price index table for francs
+    :param foreign_path: path to the price index table for foreign currencies
+    :return: dict mapping each currency to its {year: index} dictionary
+    """
+    with open(franc_path, mode="r") as f:
+        idxdicts = {"FRF": json.load(f)}
+    with open(foreign_path, mode="r") as f:
+        idxdicts.update(json.load(f))
+    return idxdicts
+
+
+def sources_stamp(*paths):
+    """
+    :param paths: paths to the files the binary tables are compiled from (the json tables
+                  and Piketty's price indexes)
+    :return: the sha256 of the path, size and mtime of each file, to know if the binary tables
+             are outdated without reading the files
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{os.path.abspath(path)}\0{stat.st_size}\0{stat.st_mtime_ns}\0".encode("utf-8"))
+    return digest.digest()
+
+
+def compile_tables(idxdicts, digest, path=BINARY_TABLES):
+    """
+    write the binary tables, through a temporary file so that a process
+    reading the tables never sees a half-written file
+    :param idxdicts: dict mapping each currency to its {year: index} dictionary
+    :param digest: stamp of the files the tables are compiled from (see sources_stamp())
+    :param path: path to the binary file
+    :return: None
+    """
+    entries, body = [], b""
+    offset = BINARY_HEADER.size + BINARY_ENTRY.size * len(idxdicts)
+    for currency, idxdict in idxdicts.items():
+        base_year, table = PriceConverter.build_table(idxdict)
+        rates = np.array([np.nan if idx is None else idx for idx in table], dtype="<f8").tobytes()
+        entries.append(BINARY_ENTRY.pack(currency.encode("ascii"), base_year, len(table), offset + len(body)))
+        body += rates
+    content = b"".join(entries) + body
+    header = BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, len(idxdicts), hashlib.sha256(content).digest(), digest)
+    with open(f"{path}.tmp", mode="wb") as f:
+        f.write(header + content)
+    os.replace(f"{path}.tmp", path)
+    return None
+
+
+def map_tables(path=BINARY_TABLES):
+    """
+    memory-map the binary tables ; the rates are read from the mapped file, without copy
+    :param path: path to the binary file
+    :return: tuple of (tables, digest): dict mapping each currency to a (base_year, numpy array
+             of the rates) tuple and the stamp of the files it was compiled from ;
+             raises a ValueError if the file is not valid
+    """
+    with open(path, mode="rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if mapped.size() < BINARY_HEADER.size:
+        raise ValueError(f"{path} is not a binary price table")
+    magic, version, count, checksum, digest = BINARY_HEADER.unpack_from(mapped, 0)
+    if magic != BINARY_MAGIC or version != BINARY_VERSION:
+        raise ValueError(f"{path} is not a binary price table of version {BINARY_VERSION}")
+    if hashlib.sha256(mapped[BINARY_HEADER.size:]).digest() != checksum:
+        raise ValueError(f"{path} is corrupted")
+    tables = {}
+    for i in range(count):
+        currency, base_year, length, offset = BINARY_ENTRY.unpack_from(mapped, BINARY_HEADER.size + i * BINARY_ENTRY.size)
+        rates = np.frombuffer(mapped, dtype="<f8", count=length, offset=offset)
+        tables[currency.rstrip(b"\0").decode("ascii")] = (base_year, rates)
+    return tables, digest
+
+
 # ============== CONVERT PRICES IN EXTRACTOR_JSON ============== #
+class PriceConverter:
+    """
+    price converter keeping the conversion tables in memory: both json tables
+    are loaded once and stored as arrays indexed by `year - base_year` for every
+    currency ("FRF" for price_index_franc.json, the other currencies for
+    price_index_foreign.json). the tables are only reloaded when the mtime of
+    one of the json files (or of Piketty's price indexes) changes (see refresh()).
+    if binary_path is given, the arrays are memory-mapped from the binary tables
+    (see compile_tables()) when they are up to date ; else the json tables are
+    read, and the binary tables are only written by compile().
+    the conversions give exactly the same results as pconverter_franc() and
+    pconverter_foreign(), which re-read the json tables on every call.
+    """
+    def __init__(self,
+                 franc_path=f"{curdir}/tables/price_index_franc.json",
+                 foreign_path=f"{curdir}/tables/price_index_foreign.json",
+                 binary_path=None,
+                 index_path=PIKETTY_INDEX):
+        """
+        :param franc_path: path to the price index table for francs
+        :param foreign_path: path to the price index table for foreign currencies
+        :param binary_path: path to the binary tables compiled from the json tables, or None
+        :param index_path: path to Piketty's price indexes, from which the table for francs is built
+        """
+        self.franc_path = franc_path
+        self.foreign_path = foreign_path
+        self.binary_path = binary_path
+        self.index_path = index_path
+        self.mapped = False  # the arrays are memory-mapped from the binary tables
+        self.arrays = {}  # currency -> (base_year, numpy array of the rates, NaN for the missing years)
+        self.filled = {}  # (currency, policy) -> the array of the rates, with the missing years filled
+        self.hashes = {}  # currency -> sha1 of its rates
+        self.mtimes = {}  # path -> mtime of the file when it was loaded
+        self.conversions = 0  # number of prices converted, reported by telemetry.py
+        self.load()
+
+    def load(self):
+        """
+        (re)load the binary tables if they are up to date, else both json tables,
+        and build the year-indexed lookup arrays
+        :return: None
+        """
+        self.mtimes = {path: os.stat(path).st_mtime_ns for path in self.sources()}
+        self.arrays = self.load_binary() if self.binary_path is not None else None
+        self.mapped = self.arrays is not None
+        if not self.mapped:
+            self.arrays = {}
+            for currency, idxdict in read_json_tables(self.franc_path, self.foreign_path).items():
+                base_year, table = self.build_table(idxdict)
+                self.arrays[currency] = (base_year, np.array([np.nan if idx is None else idx for idx in table],
+                                                             dtype=np.float64))
+        self.filled = {}
+        # fingerprint of each currency's table, to know which converted prices are outdated
+        self.hashes = {currency: hashlib.sha1(str(base_year).encode("ascii") + rates.tobytes()).hexdigest()
+                       for currency, (base_year, rates) in self.arrays.items()}
+        return None
+
+    def sources(self):
+        """
+        :return: the paths of the files the tables are built from ; Piketty's price indexes
+                 are left out if they are not there
+        """
+        paths = [self.franc_path, self.foreign_path]
+        return paths + [self.index_path] if os.path.isfile(self.index_path) else paths
+
+    def load_binary(self):
+        """
+        memory-map the binary tables
+        :return: dict mapping each currency to a (base_year, numpy array of the rates) tuple,
+                 or None if the binary tables don't exist, are not valid or are outdated
+        """
+        try:
+            tables, compiled_from = map_tables(self.binary_path)
+        except (OSError, ValueError):
+            return None
+        return tables if compiled_from == sources_stamp(*self.sources()) else None
+
+    def compile(self):
+        """
+        compile the binary tables if they are outdated, and map them ; the table for francs
+        is built again first if Piketty's price indexes were modified after it.
+        used by the command line interface of extractor_json.py: importing the module never
+        writes the tables.
+        :return: True if the tables were compiled, else False (they were up to date, or can't be written)
+        """
+        if self.binary_path is None:
+            return False
+        self.refresh()
+        if self.mapped:
+            return False
+        try:
+            if self.index_path in self.mtimes and self.mtimes[self.index_path] > self.mtimes[self.franc_path]:
+                with contextlib.redirect_stdout(io.StringIO()):  # converter() prints the table
+                    build_convtable(self.index_path, self.franc_path)
+            compile_tables(read_json_tables(self.franc_path, self.foreign_path), sources_stamp(*self.sources()),
+                           self.binary_path)
+        except OSError:
+            return False
+        self.load()
+        return True
+
+    @staticmethod
+    def build_table(idxdict):
+        """
+        turn a {year: index} dictionary into a (base_year, list) lookup table
+        in which the index of `year` is stored at position `year - base_year`.
+        years without an index are None.
+        :param idxdict: a dictionary mapping a year (str) to its price index
+        :return: tuple of (base_year, list of price indexes)
+        """
+        years = [int(y) for y in idxdict]
+        base_year = min(years)
+        table = [None] * (max(years) - base_year + 1)
+        for year, idx in idxdict.items():
+            table[int(year) - base_year] = idx
+        return base_year, table
+
+    def refresh(self):
+        """
+        reload the tables if one of the json files has been modified since
+        it was last loaded
+        :return: True if the tables were reloaded, else False
+        """
+        for path, mtime in self.mtimes.items():
+            if os.stat(path).st_mtime_ns != mtime:
+                self.load()
+                return True
+        return False
+
+    def rate(self, currency, date):
+        """
+        get the price index for a currency and a year
+        :param currency: the currency code ("FRF", "GBP"...)
+        :param date: the year (int or str)
+        :return: the price index ; raises KeyError if there is none
+        """
+        year = int(date)
+        try:
+            base_year, rates = self.arrays[currency]
+            idx = float(rates[year - base_year]) if year >= base_year else None
+        except (KeyError, IndexError):
+            idx = None
+        if idx is None or idx != idx:  # NaN for the years without a price index
+            raise KeyError(f"no price index for {currency} in {date}")
+        return idx
+
+    def convert(self, date, currency, price):
+        """
+        convert a price to 1900 constant francs
+        :param date: the sell year
+        :param currency: the currency in which the item is sold
+        :param price: the price of the item
+        :return: the converted price
+        """
+        self.conversions += 1
+        return round(price * self.rate(currency, date), 2)
+
+    def convert_batch(self, rows):
+        """
+        convert several prices at once ; the tables are refreshed once
+        for the whole batch.
+        :param rows: an iterable of (year, currency, price) tuples
+        :return: list of converted prices, in the same order as rows
+        """
+        self.refresh()
+        return [self.convert(date, currency, price) for date, currency, price in rows]
+
+    def convert_array(self, years, currencies, prices, missing="raise", base=None):
+        """
+        convert arrays of prices in one vectorized operation, with the rates of the dense
+        year-indexed tables of each currency. with the default parameters, the results are
+        the same as the ones of convert(). the years that have no price index in the table
+        of a currency are handled according to `missing`:
+        - "raise": raise a KeyError, as convert() does ;
+        - "nan": the converted price is NaN ;
+        - "nearest": use the price index of the nearest year that has one (the earlier
+          year if two years are as near) ;
+        - "interpolate": interpolate linearly between the price indexes of the previous and
+          the next years that have one ; the years before the first (after the last) price
+          index of a currency get the first (the last) price index.
+        prices in a currency that has no table, or without a year, are NaN with every policy
+        but "raise".
+        :param years: array of the sell years (int or str ; None or NaN if there is no year)
+        :param currencies: array of the currencies, or a single currency for all the prices
+        :param prices: array of the prices
+        :param missing: policy for the missing price indexes (see MISSING_POLICIES)
+        :param base: express the prices in constant francs of this year instead of 1900 francs
+        :return: numpy array of the converted prices, rounded to 2 decimals
+        """
+        if missing not in MISSING_POLICIES:
+            raise ValueError(f"unknown policy for the missing price indexes: {missing}")
+        self.refresh()
+        years = np.array([np.nan if y is None else float(y) for y in years], dtype=np.float64) \
+            if not isinstance(years, np.ndarray) or years.dtype.kind not in "iuf" \
+            else years.astype(np.float64)
+        prices = np.asarray(prices, dtype=np.float64)
+        currencies = np.broadcast_to(np.asarray(currencies, dtype=object), prices.shape)
+        rates = np.full(prices.shape, np.nan)
+        for currency in set(currencies.tolist()):
+            mask = currencies == currency
+            if currency in self.arrays:
+                rates[mask] = self.lookup(currency, years[mask], missing)
+        if missing == "raise" and np.isnan(rates).any():
+            i = int(np.flatnonzero(np.isnan(rates))[0])
+            raise KeyError(f"no price index for {currencies[i]} in {years[i]:.0f}")
+        if base is not None:
+            rates = rates / self.rate("FRF", base)
+        self.conversions += prices.size
+        return round_prices(prices * rates)
+
+    def lookup(self, currency, years, missing="nan"):
+        """
+        get the price indexes of a currency for an array of years
+        :param currency: a currency that has a table
+        :param years: float array of years (NaN if there is no year)
+        :param missing: policy for the missing price indexes (see convert_array())
+        :return: float array of the price indexes, NaN where there is none
+        """
+        base_year, table = self.arrays[currency]
+        if missing in ("nearest", "interpolate"):
+            table = self.filled_table(currency, missing)
+        known = ~np.isnan(years)
+        positions = np.where(known, years, base_year) - base_year
+        if missing in ("nearest", "interpolate"):
+            positions = np.clip(positions, 0, len(table) - 1)
+        inside = known & (positions >= 0) & (positions < len(table))
+        rates = np.full(years.shape, np.nan)
+        rates[inside] = table[positions[inside].astype(np.intp)]
+        return rates
+
+    def filled_table(self, currency, missing):
+        """
+        fill the missing years of a currency's table (see convert_array()) ;
+        the filled tables are kept until the tables are reloaded
+        :param currency: a currency that has a table
+        :param missing: "nearest" or "interpolate"
+        :return: the array of the price indexes, without NaN
+        """
+        if (currency, missing) not in self.filled:
+            _, table = self.arrays[currency]
+            positions = np.arange(len(table))
+            known = np.flatnonzero(~np.isnan(table))
+            if missing == "interpolate":
+                filled = np.interp(positions, known, table[known])
+            else:
+                # index of the first known year after each position, and of the last one before it
+                after = np.clip(np.searchsorted(known, positions), 0, len(known) - 1)
+                before = np.clip(after - 1, 0, len(known) - 1)
+                nearest = np.where(np.abs(known[before] - positions) <= np.abs(known[after] - positions),
+                                   known[before], known[after])
+                filled = table[nearest]
+            self.filled[(currency, missing)] = filled
+        return self.filled[(currency, missing)]
+
+
+def round_prices(values):
+    """
+    round an array of prices to 2 decimals exactly as round(price, 2) does: np.round()
+    multiplies the values by 100 before rounding them, which can move a value that is
+    just below (or above) a half cent to the other side ; these values are rounded
+    one by one with round().
+    :param values: float array of prices
+    :return: float array of the rounded prices
+    """
+    rounded = np.round(values, 2)
+    ties = np.flatnonzero(np.abs(np.abs(values * 100) % 1 - 0.5) < 1e-6)
+    for i in ties:
+        rounded.flat[i] = round(float(values.flat[i]), 2)
+    return rounded
+
+
 def pconverter_franc(date, price):
     """
     price converter function for francs: the prices from the catalogue
     do not take inflation into account ; in turn, convert the prices in
-    1900 constant francs
+    1900 constant francs.
+    this function re-reads the conversion table on each call: to convert
+    many prices, use a PriceConverter.
     :param date: the date of the price
     :param price: the price itself
     :return:
@@ -119,6 +496,8 @@ def pconverter_foreign(currency, date, price):
     foreign currencies in their 1900 franc value. the conversion values
     are created "by hand" for specific years and currencies using
     http://www.historicalstatistics.org/Currencyconverter.html
+    this function re-reads the conversion table on each call: to convert
+    many prices, use a PriceConverter.
     :param date: the sell date
     :param currency: the currency in which the item is sold
     :param price: the price of the item
@@ -133,4 +512,5 @@ def pconverter_foreign(currency, date, price):
 # if priceconv.py is called as a main item, build the conversion table;
 # the functions can be called from external scripts
 if __name__ == "__main__":
-    build_convtable()
\ No newline at end of file
+    build_convtable()
+    PriceConverter(binary_path=BINARY_TABLES).compile()
\ No newline at end of file
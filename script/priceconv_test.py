@@ -0,0 +1,145 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from priceconv import *
+
+
+class Price_conversion(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.franc = os.path.join(self.tmpdir, "franc.json")
+        self.foreign = os.path.join(self.tmpdir, "foreign.json")
+        shutil.copy(f"{curdir}/tables/price_index_franc.json", self.franc)
+        shutil.copy(f"{curdir}/tables/price_index_foreign.json", self.foreign)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_same_as_pconverter(self):
+        converter = PriceConverter()
+        with open(f"{curdir}/tables/price_index_franc.json", mode="r") as f:
+            years = list(json.load(f).keys())
+        for year in years:
+            self.assertEqual(converter.convert(year, "FRF", 37.5), pconverter_franc(date=year, price=37.5))
+        self.assertEqual(converter.convert("1904", "GBP", 12.0),
+                         pconverter_foreign(currency="GBP", date="1904", price=12.0))
+
+    def test_convert_batch(self):
+        converter = PriceConverter()
+        rows = [("1887", "FRF", 15.0), (1918, "GBP", 3), ("1926", "USD", 10.0)]
+        self.assertEqual(converter.convert_batch(rows), [converter.convert(*row) for row in rows])
+
+    def test_convert_array(self):
+        converter = PriceConverter()
+        rows = [("1887", "FRF", 2.25), ("1918", "GBP", 3), ("1926", "USD", 10.0), ("1891", "FRF", 12.5)]
+        years, currencies, prices = zip(*rows)
+        self.assertEqual(converter.convert_array(years, currencies, prices).tolist(), converter.convert_batch(rows))
+        self.assertEqual(converter.convert_array(np.array([1887, 1914]), "FRF", [11.8, 11.8], base=1914).tolist(),
+                         [10.2, 11.8])
+
+    def test_missing_rate_policies(self):
+        converter = PriceConverter()
+        years, currencies, prices = [1904, 1905, 1910, 1930, None, 1887], ["GBP"] * 5 + ["CHF"], [1.0] * 6
+        with self.assertRaises(KeyError):
+            converter.convert_array(years, currencies, prices)
+        nan = converter.convert_array(years, currencies, prices, missing="nan")
+        self.assertEqual(nan[0], 25.21)
+        self.assertTrue(np.isnan(nan[1:]).all())
+        nearest = converter.convert_array(years, currencies, prices, missing="nearest")
+        self.assertEqual(nearest[:4].tolist(), [25.21, 25.21, 25.21, 6.93])
+        self.assertTrue(np.isnan(nearest[4:]).all())
+        interpolated = converter.convert_array(years, currencies, prices, missing="interpolate")
+        self.assertEqual(interpolated[:4].tolist(), [25.21, 23.9, 17.38, 6.93])
+        with self.assertRaises(ValueError):
+            converter.convert_array(years, currencies, prices, missing="zero")
+
+    def test_round_prices(self):
+        values = np.array([2.295, 1.005, 2.675, 12.345, 0.125])
+        self.assertEqual(round_prices(values).tolist(), [round(float(v), 2) for v in values])
+
+    def test_missing_rate(self):
+        converter = PriceConverter()
+        with self.assertRaises(KeyError):
+            converter.convert("1905", "GBP", 10.0)
+        with self.assertRaises(KeyError):
+            converter.convert("1887", "CHF", 10.0)
+        with self.assertRaises(KeyError):
+            converter.convert("1700", "FRF", 10.0)
+
+    def test_reload_on_change(self):
+        converter = PriceConverter(franc_path=self.franc, foreign_path=self.foreign)
+        self.assertFalse(converter.refresh())
+        with open(self.foreign, mode="w") as f:
+            json.dump({"GBP": {"1904": 10}}, f)
+        os.utime(self.foreign, ns=(0, 0))
+        self.assertTrue(converter.refresh())
+        self.assertEqual(converter.convert("1904", "GBP", 2.0), 20.0)
+        with self.assertRaises(KeyError):
+            converter.convert("1926", "USD", 10.0)
+
+    def test_binary_tables(self):
+        binary = os.path.join(self.tmpdir, "price_index.bin")
+        converter = PriceConverter(franc_path=self.franc, foreign_path=self.foreign, binary_path=binary)
+        # the tables are only written by compile()
+        self.assertFalse(os.path.isfile(binary) or converter.mapped)
+        self.assertTrue(converter.compile())
+        self.assertTrue(converter.mapped)
+        self.assertFalse(converter.compile())
+        self.assertTrue(PriceConverter(franc_path=self.franc, foreign_path=self.foreign, binary_path=binary).mapped)
+        reference = PriceConverter(franc_path=self.franc, foreign_path=self.foreign)
+        self.assertEqual(converter.hashes, reference.hashes)
+        self.assertEqual(converter.convert("1887", "FRF", 15.0), reference.convert("1887", "FRF", 15.0))
+        tables, _ = map_tables(binary)
+        self.assertEqual(sorted(tables), ["EUR", "FRF", "GBP", "USD"])
+        self.assertTrue(np.isnan(tables["GBP"][1][1]))
+        # the binary tables are compiled again when the json tables change
+        with open(self.foreign, mode="w") as f:
+            json.dump({"GBP": {"1904": 10}}, f)
+        os.utime(self.foreign, ns=(0, 0))
+        self.assertTrue(converter.refresh())
+        self.assertFalse(converter.mapped)
+        self.assertEqual(converter.convert("1904", "GBP", 2.0), 20.0)
+        self.assertTrue(converter.compile())
+        self.assertEqual(sorted(map_tables(binary)[0]), ["FRF", "GBP"])
+
+    def test_piketty_index(self):
+        # the table for francs is built again when Piketty's price indexes are modified after it
+        binary = os.path.join(self.tmpdir, "price_index.bin")
+        index = os.path.join(self.tmpdir, "piketty.csv")
+        shutil.copy(PIKETTY_INDEX, index)
+        os.utime(self.franc, ns=(0, 0))
+        converter = PriceConverter(franc_path=self.franc, foreign_path=self.foreign, binary_path=binary,
+                                   index_path=index)
+        self.assertTrue(converter.compile())
+        self.assertEqual(converter.convert("1887", "FRF", 15.0), PriceConverter().convert("1887", "FRF", 15.0))
+        self.assertGreater(os.stat(self.franc).st_mtime_ns, 0)  # written again
+        with open(index, mode="a") as f:
+            f.write("1999,30\n")
+        self.assertTrue(converter.refresh())
+        self.assertFalse(converter.mapped)
+        self.assertTrue(converter.compile())
+        self.assertTrue(converter.mapped)
+        self.assertEqual(converter.rate("FRF", 1999), round(30 / 0.982, 2))  # index of 1900: 0.982
+
+    def test_corrupted_binary_tables(self):
+        binary = os.path.join(self.tmpdir, "price_index.bin")
+        PriceConverter(franc_path=self.franc, foreign_path=self.foreign, binary_path=binary).compile()
+        with open(binary, mode="r+b") as f:
+            f.seek(-8, os.SEEK_END)
+            f.write(b"\0" * 8)
+        with self.assertRaises(ValueError):
+            map_tables(binary)
+        converter = PriceConverter(franc_path=self.franc, foreign_path=self.foreign, binary_path=binary)
+        self.assertFalse(converter.mapped)
+        self.assertEqual(converter.convert("1926", "USD", 10.0), 25.0)
+        self.assertTrue(converter.compile())
+        map_tables(binary)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+# coding: utf-8
+
+# --------------------------------------------------------------------------------------------------
+# Katabase project: github.com/katabase/
+# Statistics on the prices of a catalogue, used by extractor_json.py
+#
+# * PROCESS BREAKDOWN *
+# - price_stats() computes the statistics on a catalogue's prices (expressed in constant francs):
+#   the sum, min, max, median, mode, most expensive items and, optionally, quantiles come from a
+#   NumPy array sorted once ; the mean and the population variance are deliberately computed in
+#   Python, on exact integer sums rounded once (exact_moments()), so that they are the same, bit
+#   for bit, as the ones of the statistics module (a float64 NumPy pass changes their last digits) ;
+# - currency_breakdown() groups the prices of a catalogue by currency and runs price_stats()
+#   on each group.
+# --------------------------------------------------------------------------------------------------
+
+
+from fractions import Fraction
+
+import numpy as np
+
+
+# names of the optional quantiles, mapped to their value
+QUANTILES = {"p10": 0.1, "p90": 0.9}
+
+
+def price_stats(item_ids, prices, quantiles=False):
+	"""
+	compute statistics on the prices of a catalogue. the results are the same as the ones
+	the statistics module gives on the list of prices:
+	- total_price_c: the sum of the prices, added up in the order of the items
+	- low_price_c, high_price_c: the lowest and the highest price
+	- mean_price_c, median_price_c: the average and the median price
+	- mode_price_c: the most frequent price (the lowest one if several prices are as frequent)
+	- variance_price_c: the population variance of the prices
+	- high_price_items_c: a dict with the most expensive items' @xml:id as keys, and price as values
+	- if quantiles is True, p10_price_c and p90_price_c: the 10th and 90th percentiles
+	:param item_ids: list of the @xml:id of the items
+	:param prices: list of the prices of the items, in the same order, in constant francs
+	:param quantiles: add the quantiles in QUANTILES to the statistics
+	:return: dict with the statistics
+	"""
+	prices = np.asarray(prices, dtype=np.float64)
+	ordered = np.sort(prices)
+	low, high = ordered[0], ordered[-1]
+	values, counts = np.unique(ordered, return_counts=True)  # np.argmax() keeps the first (lowest) mode
+	mean, variance = exact_moments(prices.tolist())
+	stats = {
+		"total_price_c": float(np.cumsum(prices)[-1]),  # cumsum adds the prices in order, as a loop would
+		"low_price_c": float(low),
+		"high_price_c": float(high),
+		"mean_price_c": mean,
+		"median_price_c": float(np.median(ordered)),
+		"mode_price_c": float(values[np.argmax(counts)]),
+		"variance_price_c": variance,
+		"high_price_items_c": {item_ids[i]: float(prices[i]) for i in np.flatnonzero(prices == high)}
+	}
+	if quantiles:
+		for name, q in QUANTILES.items():
+			stats[f"{name}_price_c"] = float(np.quantile(ordered, q))
+	return stats
+
+
+def exact_moments(prices):
+	"""
+	compute the mean and the population variance of prices without rounding errors, as
+	statistics.mean() and statistics.pvariance() do: every price is a multiple of the same
+	power of two, so the sums are computed on integers and the results rounded once.
+	:param prices: list of prices (finite floats)
+	:return: tuple of (mean, variance), as floats
+	"""
+	ratios = [price.as_integer_ratio() for price in prices]
+	scale = max(denominator for _, denominator in ratios)  # all the denominators are powers of two
+	scaled = [numerator * (scale // denominator) for numerator, denominator in ratios]
+	n, total, total_sq = len(scaled), sum(scaled), sum(value * value for value in scaled)
+	mean = float(Fraction(total, n * scale))
+	variance = float(Fraction(n * total_sq - total * total, n * n * scale * scale))
+	return mean, variance
+
+
+def currency_breakdown(item_ids, currencies, prices, quantiles=False):
+	"""
+	compute the statistics of price_stats() separately for each currency of a catalogue
+	:param item_ids: list of the @xml:id of the items
+	:param currencies: list of the currency of each item, in the same order
+	:param prices: list of the prices of the items, in the same order, in constant francs
+	:param quantiles: add the quantiles in QUANTILES to the statistics
+	:return: dict mapping each currency to the number of items sold in it and their statistics
+	"""
+	currencies = np.asarray(currencies, dtype=object)
+	prices = np.asarray(prices, dtype=np.float64)
+	breakdown = {}
+	for currency in sorted(set(currencies)):
+		indexes = np.flatnonzero(currencies == currency)
+		stats = {"item_count": len(indexes)}
+		stats.update(price_stats([item_ids[i] for i in indexes], prices[indexes], quantiles))
+		breakdown[currency] = stats
+	return breakdown
+
@@ -0,0 +1,44 @@
+import random
+import unittest
+from statistics import mean, median, mode, pvariance
+
+from pricestats import *
+
+
+class Price_statistics(unittest.TestCase):
+
+    def test_same_as_statistics(self):
+        rng = random.Random(1887)
+        for n in (1, 2, 7, 250):
+            prices = [round(rng.choice([5, 10, 12.5, 20, 100]) * rng.choice([1.02, 0.97, 1.04]), 2) for _ in range(n)]
+            ids = [f"CAT_000001_e{i}" for i in range(n)]
+            stats = price_stats(ids, prices)
+            psum = 0
+            for p in prices:
+                psum += p
+            self.assertEqual(stats["total_price_c"], psum)
+            self.assertEqual(stats["low_price_c"], min(prices))
+            self.assertEqual(stats["high_price_c"], max(prices))
+            self.assertEqual(stats["median_price_c"], median(sorted(prices)))
+            self.assertEqual(stats["mode_price_c"], mode(sorted(prices)))
+            self.assertEqual(stats["mean_price_c"], mean(prices))
+            self.assertEqual(stats["variance_price_c"], pvariance(prices))
+            self.assertEqual(stats["high_price_items_c"],
+                             {i: p for i, p in zip(ids, prices) if p == max(prices)})
+
+    def test_quantiles(self):
+        stats = price_stats([str(i) for i in range(11)], [float(i) for i in range(11)], quantiles=True)
+        self.assertEqual(stats["p10_price_c"], 1.0)
+        self.assertEqual(stats["p90_price_c"], 9.0)
+        self.assertNotIn("p10_price_c", price_stats(["a"], [1.0]))
+
+    def test_currency_breakdown(self):
+        breakdown = currency_breakdown(["a", "b", "c"], ["GBP", "FRF", "GBP"], [10.0, 3.0, 30.0])
+        self.assertEqual(list(breakdown.keys()), ["FRF", "GBP"])
+        self.assertEqual(breakdown["GBP"]["item_count"], 2)
+        self.assertEqual(breakdown["GBP"]["high_price_items_c"], {"c": 30.0})
+        self.assertEqual(breakdown["FRF"]["total_price_c"], 3.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
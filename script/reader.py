@@ -0,0 +1,263 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# --------------------------------------------------------------------------------------------------
+# Katabase project: github.com/katabase/
+# Random access to the tei:items and tei:descs of the catalogues, without parsing whole files
+#
+# * PROCESS BREAKDOWN *
+# - build_index() scans the bytes of a catalogue (memory-mapped) for the start and end tags of the
+#   tei:items and tei:descs of its tei:body (outside of the comments, CDATA sections and processing
+#   instructions) and returns, for each @xml:id, the byte range of the element in the file ; a tag
+#   without its start or end tag raises a ValueError ; the index of each file is kept in a sidecar JSON file (in cache/reader/,
+#   with the same subfolders as in Catalogues/) and built again when the file changes (mtime or size) ;
+# - CorpusReader.get() finds the file and the byte range of an @xml:id and only parses these bytes
+#   (parse_fragment()) ; the files are memory-mapped once and only the pages of the element are read ;
+# - CorpusReader.iter_items() yields the tei:items of the corpus one by one, in the order of the files,
+#   loading the index of each file only when it is reached ; the items can be filtered on their
+#   @xml:id before they are parsed (ids=) and on the parsed element (filter=).
+# usage: python3 reader.py CAT_000146_e80 [CAT_000146_e80_d1 ...]
+# --------------------------------------------------------------------------------------------------
+
+
+import os
+import re
+import sys
+import glob
+import json
+import mmap
+import argparse
+from lxml import etree
+
+
+curdir = os.path.abspath(os.path.dirname(os.path.abspath(__file__)))
+
+INDEX_VERSION = 2  # version of the sidecar files ; the sidecars of another version are built again
+TEI_NS = b"http://www.tei-c.org/ns/1.0"
+body_pattern = re.compile(rb"<body[\s>]")
+# a comment, a CDATA section, a processing instruction (no group matches: they are skipped), or a
+# start or end tag of a tei:item or a tei:desc (group 1: "/" for an end tag, group 2: the name,
+# group 3: the attributes, group 4: "/" for an empty element)
+tag_pattern = re.compile(rb"<!--.*?-->|<!\[CDATA\[.*?\]\]>|<\?.*?\?>|<(/?)(item|desc)(?=[\s/>])([^>]*?)(/?)>",
+						 re.DOTALL)
+id_pattern = re.compile(rb"""xml:id\s*=\s*(["'])(.*?)\1""")
+# the @xml:id of the tei:items (and of their tei:descs) start with the @xml:id of their catalogue
+catalogue_id_pattern = re.compile(r"^(.+?)_e\d")
+# the fragments are parsed in a tei:TEI element, so that they are in the TEI namespace
+fragment_parser = etree.XMLParser(huge_tree=True)
+
+
+# ============== INDEX ============== #
+def build_index(file):
+	"""
+	get the byte range of each tei:item and tei:desc of the tei:body of a catalogue
+	:param file: path to an XML catalogue
+	:return: dict mapping the @xml:id of each element to a [start, end, tag] list: the byte offsets
+			 of the element (file[start:end] is the element, from its start tag to its end tag) and
+			 its tag ("item" or "desc"), in document order
+	:raise ValueError: if a tei:item or a tei:desc has no end tag, or an end tag has no start tag
+	"""
+	index = {}
+	with open(file, mode="rb") as f:
+		if os.fstat(f.fileno()).st_size == 0:
+			return index
+		with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+			body = body_pattern.search(data)
+			if body is None:
+				return index
+			opened = {b"item": [], b"desc": []}  # (xml:id, start) of the elements not closed yet
+			for match in tag_pattern.finditer(data, body.start()):
+				closing, name, attributes, empty = match.groups()
+				if name is None:
+					continue
+				if closing:
+					if not opened[name]:
+						raise ValueError(f"{file}: end tag </{name.decode()}> without start tag at byte {match.start()}")
+					xml_id, start = opened[name].pop()
+					if xml_id is not None:
+						index[xml_id] = [start, match.end(), name.decode()]
+					continue
+				xml_id = id_pattern.search(attributes)
+				xml_id = xml_id[2].decode("utf-8") if xml_id is not None else None
+				if empty:
+					if xml_id is not None:
+						index[xml_id] = [match.start(), match.end(), name.decode()]
+				else:
+					opened[name].append((xml_id, match.start()))
+			for name, elements in opened.items():
+				if elements:
+					raise ValueError(f"{file}: start tag <{name.decode()}> without end tag at byte {elements[-1][1]}")
+	# the start tags are found before the end tags: the elements are put back in document order
+	return dict(sorted(index.items(), key=lambda entry: entry[1][0]))
+
+
+def parse_fragment(fragment):
+	"""
+	parse the bytes of a tei:item or tei:desc, cut from a catalogue
+	:param fragment: the bytes of the element
+	:return: the element ; it is in the TEI namespace, its parent being an empty tei:TEI element
+	"""
+	wrapper = etree.fromstring(b'<TEI xmlns="' + TEI_NS + b'">' + fragment + b"</TEI>", fragment_parser)
+	return wrapper[0]
+
+
+# ============== READER ============== #
+class CorpusReader:
+	"""
+	random access to the tei:items and tei:descs of the catalogues, by their @xml:id
+	"""
+	def __init__(self, source_dir=f"{curdir}/../Catalogues", index_dir=f"{curdir}/../cache/reader"):
+		"""
+		:param source_dir: the directory of the XML catalogues
+		:param index_dir: the directory of the sidecar index files
+		"""
+		self.source_dir = os.path.abspath(source_dir)
+		self.index_dir = os.path.abspath(index_dir)
+		self.files = sorted(glob.glob(f"{self.source_dir}/**/*.xml", recursive=True))
+		self.indexes = {}  # file -> index of the file (see build_index())
+		self.locations = None  # xml:id -> file, once every index is loaded (see locate())
+		self.maps = {}  # file -> (file object, mmap) of the files that were read
+		self.built = 0  # number of indexes built (instead of being read from their sidecar)
+
+	def sidecar_path(self, file):
+		"""
+		:param file: path to an XML catalogue
+		:return: path of the sidecar index of the file
+		"""
+		relpath = os.path.relpath(os.path.abspath(file), self.source_dir)
+		return os.path.join(self.index_dir, os.path.splitext(relpath)[0] + ".json")
+
+	def file_index(self, file):
+		"""
+		get the index of a file from its sidecar, or build it (and write the sidecar) if the
+		sidecar doesn't exist or was built for another version of the file
+		:param file: path to an XML catalogue
+		:return: the index of the file (see build_index())
+		"""
+		if file in self.indexes:
+			return self.indexes[file]
+		stat = os.stat(file)
+		signature = [stat.st_mtime_ns, stat.st_size]
+		path = self.sidecar_path(file)
+		try:
+			with open(path, mode="r", encoding="utf-8") as f:
+				sidecar = json.load(f)
+			if sidecar["version"] != INDEX_VERSION or sidecar["signature"] != signature:
+				sidecar = None
+		except (FileNotFoundError, json.JSONDecodeError, KeyError):
+			sidecar = None
+		if sidecar is None:
+			sidecar = {"version": INDEX_VERSION, "signature": signature, "index": build_index(file)}
+			os.makedirs(os.path.dirname(path), exist_ok=True)
+			with open(f"{path}.tmp", mode="w", encoding="utf-8") as f:
+				json.dump(sidecar, f)
+			os.replace(f"{path}.tmp", path)
+			self.built += 1
+		self.indexes[file] = sidecar["index"]
+		return self.indexes[file]
+
+	def locate(self, xml_id):
+		"""
+		find a tei:item or a tei:desc in the corpus: the element is first looked for in the files whose
+		name starts with the id of its catalogue (CAT_000146_wd.xml for CAT_000146_e80) ; if it is not
+		found there, the index of every file is loaded
+		:param xml_id: the @xml:id of the element
+		:return: tuple of (file, start, end): the file and the byte range of the element (see build_index())
+		"""
+		catalogue_id = catalogue_id_pattern.match(xml_id)
+		if self.locations is None and catalogue_id is not None:
+			for file in self.files:
+				if os.path.basename(file).startswith(catalogue_id[1]) and xml_id in self.file_index(file):
+					start, end, _ = self.indexes[file][xml_id]
+					return file, start, end
+		if self.locations is None:
+			self.locations = {}
+			for file in self.files:
+				for element_id in self.file_index(file):
+					self.locations[element_id] = file
+		file = self.locations.get(xml_id)
+		if file is None:
+			raise KeyError(xml_id)
+		start, end, _ = self.indexes[file][xml_id]
+		return file, start, end
+
+	def data(self, file):
+		"""
+		:param file: path to an XML catalogue
+		:return: the content of the file, memory-mapped (the file is only mapped once)
+		"""
+		if file not in self.maps:
+			f = open(file, mode="rb")
+			self.maps[file] = (f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+		return self.maps[file][1]
+
+	def raw(self, xml_id):
+		"""
+		:param xml_id: the @xml:id of a tei:item or a tei:desc
+		:return: the bytes of the element, from its start tag to its end tag
+		"""
+		file, start, end = self.locate(xml_id)
+		return self.data(file)[start:end]
+
+	def get(self, xml_id):
+		"""
+		:param xml_id: the @xml:id of a tei:item or a tei:desc
+		:return: the parsed element (see parse_fragment())
+		"""
+		return parse_fragment(self.raw(xml_id))
+
+	def iter_items(self, filter=None, ids=None, files=None):
+		"""
+		yield the tei:items of the corpus, in the order of the files and in document order ;
+		each file is indexed and mapped when it is reached, and each item is only parsed if its
+		@xml:id passes `ids`
+		:param filter: function called on each parsed tei:item ; the item is only yielded if it returns True
+		:param ids: function called on the @xml:id of each tei:item before it is parsed ; the item is
+					skipped if it returns False
+		:param files: the files to read ; default: every file of the corpus
+		:return: generator of (xml:id, element) tuples
+		"""
+		for file in files if files is not None else self.files:
+			for xml_id, (start, end, tag) in self.file_index(file).items():
+				if tag != "item":
+					continue
+				if ids is not None and not ids(xml_id):
+					continue
+				element = parse_fragment(self.data(file)[start:end])
+				if filter is None or filter(element):
+					yield xml_id, element
+
+	def close(self):
+		"""
+		unmap and close the files that were read
+		:return: None
+		"""
+		for f, data in self.maps.values():
+			data.close()
+			f.close()
+		self.maps = {}
+		return None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, exc_traceback):
+		self.close()
+		return False
+
+
+# ============== COMMAND LINE INTERFACE ============== #
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="print tei:items or tei:descs of the corpus, found by their @xml:id")
+	parser.add_argument("ids", nargs="+", help="@xml:id of the tei:items or tei:descs")
+	args = parser.parse_args()
+
+	with CorpusReader() as reader:
+		for xml_id in args.ids:
+			try:
+				file, start, end = reader.locate(xml_id)
+			except KeyError:
+				print(f"no element {xml_id}", file=sys.stderr)
+				continue
+			print(f"<!-- {os.path.relpath(file, reader.source_dir)}, bytes {start}-{end} -->")
+			print(reader.raw(xml_id).decode("utf-8"))
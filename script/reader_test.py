@@ -0,0 +1,101 @@
+import os
+import re
+import glob
+import shutil
+import tempfile
+import unittest
+from lxml import etree
+
+from extractor_json import item_records_extractor, item_extractor, curdir, ns, XML_ID
+from reader import *
+
+
+class Corpus_reader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.source_dir = os.path.join(self.tmpdir.name, "Catalogues")
+        self.index_dir = os.path.join(self.tmpdir.name, "reader")
+        os.makedirs(self.source_dir)
+        self.files = sorted(glob.glob(f"{curdir}/../Catalogues/101-200/*.xml"))[:5]
+        for file in self.files:
+            shutil.copy(file, self.source_dir)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_same_as_parse(self):
+        with CorpusReader(self.source_dir, self.index_dir) as reader:
+            for file in reader.files:
+                elements = etree.parse(file).xpath("//tei:body//tei:item[@xml:id] | //tei:body//tei:desc[@xml:id]",
+                                                   namespaces=ns)
+                self.assertEqual(list(reader.file_index(file)), [e.get(XML_ID) for e in elements])
+                for element in elements:
+                    fragment = reader.get(element.get(XML_ID))
+                    self.assertEqual(fragment.tag, element.tag)
+                    self.assertEqual(dict(fragment.attrib), dict(element.attrib))
+                    self.assertEqual("".join(fragment.itertext()), "".join(element.itertext()))
+
+    def test_extraction_on_fragments(self):
+        # the data extracted from the fragments is the same as from the whole file
+        with CorpusReader(self.source_dir, self.index_dir) as reader:
+            file = reader.files[0]
+            expected = item_extractor(etree.parse(file), {})
+            sell_date = next(iter(expected.values())).get("sell_date")
+            sell_year = re.findall(r"\d{4}", sell_date)[0] if sell_date else None
+            output = {}
+            for _, item in reader.iter_items(files=[file]):
+                output.update(item_records_extractor(item, sell_date, sell_year))
+            self.assertEqual(output, expected)
+
+    def test_iter_items(self):
+        with CorpusReader(self.source_dir, self.index_dir) as reader:
+            items = list(reader.iter_items())
+            self.assertTrue(all(element.tag == "{http://www.tei-c.org/ns/1.0}item" for _, element in items))
+            first = items[0][0]
+            self.assertEqual([i for i, _ in reader.iter_items(ids=lambda xml_id: xml_id == first)], [first])
+            priced = [i for i, _ in reader.iter_items(filter=lambda e: e.find("tei:measure", ns) is not None)]
+            self.assertEqual(priced, [i for i, e in items if e.find("tei:measure", ns) is not None])
+
+    def test_sidecars(self):
+        with CorpusReader(self.source_dir, self.index_dir) as reader:
+            xml_id = list(reader.file_index(reader.files[0]))[-1]
+            reader.raw(xml_id)
+            self.assertEqual(reader.built, 1)
+        with CorpusReader(self.source_dir, self.index_dir) as reader:
+            self.assertEqual(reader.raw(xml_id)[-7:], b"</item>" if "_d" not in xml_id else b"</desc>")
+            self.assertEqual(reader.built, 0)
+            with self.assertRaises(KeyError):
+                reader.locate("CAT_999999_e1")
+            self.assertEqual(reader.built, len(reader.files) - 1)
+        # a modified file is indexed again
+        file = sorted(glob.glob(f"{self.source_dir}/*.xml"))[0]
+        with open(file, mode="rb") as f:
+            data = f.read()
+        with open(file, mode="wb") as f:
+            f.write(data.replace(b"<body>", b"<body>\n<!-- moved -->", 1))
+        with CorpusReader(self.source_dir, self.index_dir) as reader:
+            self.assertEqual(reader.get(xml_id).get(XML_ID), xml_id)
+            self.assertEqual(reader.built, 1)
+
+    def test_markup(self):
+        # the tags of the comments, CDATA sections and processing instructions, and the other elements
+        # whose name starts with "item" or "desc", are not indexed
+        file = os.path.join(self.tmpdir.name, "markup.xml")
+        body = b'<body><!-- <item xml:id="A_e0"> --><itemList><item xml:id="A_e1"><![CDATA[</item>]]>' \
+               b'<?pi <desc xml:id="A_e1_d0"/>?><desc.x/><desc xml:id="A_e1_d1"/></item></itemList></body>'
+        with open(file, mode="wb") as f:
+            f.write(body)
+        self.assertEqual(build_index(file), {"A_e1": [body.index(b'<item xml:id="A_e1"'), body.index(b"</itemList>"), "item"],
+                                             "A_e1_d1": [body.index(b'<desc xml:id="A_e1_d1"'), body.rindex(b"</item>"),
+                                                         "desc"]})
+        # an unbalanced tag
+        for data in (body.replace(b"</item>", b""), body.replace(b'<item xml:id="A_e1">', b"")):
+            with open(file, mode="wb") as f:
+                f.write(data)
+            with self.assertRaisesRegex(ValueError, "markup.xml: (start|end) tag"):
+                build_index(file)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+# coding: utf-8
+
+# --------------------------------------------------------------------------------------------------
+# Katabase project: github.com/katabase/
+# Compact records for the data extracted on each desc by extractor_json.py
+#
+# * PROCESS BREAKDOWN *
+# - with records=True, item_extractor() stores the data of each desc in an ItemRecord instead
+#   of a dict: a class with __slots__, with one attribute per field, that takes a fraction of
+#   the memory of a dict with the same keys. an ItemRecord is a read-only mapping with the same
+#   keys, in the same order, as the dict it replaces: it can be read as a dict (record["price"],
+#   record.get("author"), {**record}) and is equal to that dict ;
+# - the strings that are repeated in many records (sell dates, currencies, authors, dates...)
+#   are interned with intern_text(), so that each value is only stored once in memory ;
+# - the records are only turned into dicts when they are written: json_default() is passed
+#   to json.dump() / json.dumps() as the `default` function.
+# --------------------------------------------------------------------------------------------------
+
+
+import sys
+from itertools import product
+from collections.abc import Mapping
+
+
+def record_keys(priced, has_price_c, has_sell_date):
+	"""
+	:param priced: the desc has a price
+	:param has_price_c: the desc has a price in constant francs
+	:param has_sell_date: the desc has a sell date
+	:return: the keys of the dict built by desc_extractor() for such a desc, in order
+	"""
+	keys = ("currency", "price") if priced else ("price",)
+	if has_price_c:
+		keys += ("price_c",)
+	keys += ("author", "author_wikidata_id", "date", "number_of_pages", "format", "term")
+	if has_sell_date:
+		keys += ("sell_date",)
+	return keys + ("desc",)
+
+
+class ItemRecord(Mapping):
+	"""
+	the data on a desc (see extractor_json.desc_extractor()), stored in slots. the keys
+	of the record depend on its values, as the keys of the dict built by desc_extractor():
+	"currency" and "price_c" only exist if the item has a price (priced is True), and
+	"price_c" and "sell_date" only if they are not None.
+	"""
+	__slots__ = ("priced", "currency", "price", "price_c", "author", "author_wikidata_id",
+				 "date", "number_of_pages", "format", "term", "sell_date", "desc")
+	# the keys of the records, and the same keys as a set, for each (priced, has_price_c, has_sell_date)
+	# combination (see record_keys()): they are only built once, and not for each access
+	KEYS = {flags: record_keys(*flags) for flags in product((False, True), repeat=3)}
+	KEY_SETS = {flags: frozenset(keys) for flags, keys in KEYS.items()}
+
+	def __init__(self, priced, currency, price, price_c, author, author_wikidata_id,
+				 date, number_of_pages, format, term, sell_date, desc):
+		self.priced = priced
+		self.currency = currency
+		self.price = price
+		self.price_c = price_c
+		self.author = author
+		self.author_wikidata_id = author_wikidata_id
+		self.date = date
+		self.number_of_pages = number_of_pages
+		self.format = format
+		self.term = term
+		self.sell_date = sell_date
+		self.desc = desc
+
+	def flags(self):
+		"""
+		:return: the (priced, has_price_c, has_sell_date) combination of the record (see KEYS)
+		"""
+		return bool(self.priced), bool(self.priced) and self.price_c is not None, self.sell_date is not None
+
+	def keys(self):
+		"""
+		:return: the keys of the record, in the order of the dict built by desc_extractor()
+		"""
+		return self.KEYS[self.flags()]
+
+	def __getitem__(self, key):
+		if key not in self.KEY_SETS[self.flags()]:
+			raise KeyError(key)
+		return getattr(self, key)
+
+	def __iter__(self):
+		return iter(self.keys())
+
+	def __len__(self):
+		return len(self.keys())
+
+	def as_dict(self):
+		"""
+		:return: the record as a dict, as desc_extractor() builds it
+		"""
+		return {key: getattr(self, key) for key in self.keys()}
+
+	def __repr__(self):
+		return f"ItemRecord({self.as_dict()!r})"
+
+	def __reduce__(self):
+		# pickle the records as a tuple of values (the records are sent by the worker processes)
+		return ItemRecord, tuple(getattr(self, name) for name in self.__slots__)
+
+
+def intern_text(text):
+	"""
+	intern a string, so that all the records with the same value share it
+	:param text: a string (lxml's "smart strings" are turned into plain strings) or None
+	:return: the interned string, or None
+	"""
+	if text is None:
+		return None
+	return sys.intern(str(text))
+
+
+def json_default(obj):
+	"""
+	`default` function of json.dump() / json.dumps(), which turns the records into dicts
+	:param obj: an object that json can't serialize
+	:return: the object as a dict
+	"""
+	if isinstance(obj, ItemRecord):
+		return obj.as_dict()
+	raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
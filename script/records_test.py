@@ -0,0 +1,46 @@
+import glob
+import json
+import pickle
+import unittest
+from lxml import etree
+
+from extractor_json import item_extractor, curdir
+from records import *
+
+
+class Item_records(unittest.TestCase):
+
+    def test_same_as_dicts(self):
+        for file in sorted(glob.glob(f"{curdir}/../Catalogues/101-200/*.xml"))[:5]:
+            dicts = item_extractor(etree.parse(file), {})
+            records = item_extractor(etree.parse(file), {}, records=True)
+            self.assertEqual(list(records), list(dicts))
+            for desc_id, data in dicts.items():
+                self.assertIsInstance(records[desc_id], ItemRecord)
+                self.assertEqual(records[desc_id], data)
+                self.assertEqual(list(records[desc_id].keys()), list(data.keys()))
+            self.assertEqual(json.dumps(records, indent=4, default=json_default), json.dumps(dicts, indent=4))
+
+    def test_mapping(self):
+        record = ItemRecord(True, "FRF", 15.0, None, "Barry", None, "1846", 1.0, 8, 7, None, "L. a. s.")
+        self.assertEqual(record["price"], 15.0)
+        self.assertNotIn("price_c", record)
+        self.assertNotIn("sell_date", record)
+        self.assertIsNone(record.get("sell_date"))
+        with self.assertRaises(KeyError):
+            record["price_c"]
+        self.assertEqual({**record}, record.as_dict())
+        self.assertEqual(pickle.loads(pickle.dumps(record)), record)
+        unpriced = ItemRecord(False, None, None, None, None, None, None, None, None, None, "1887", "Pièce")
+        self.assertEqual(list(unpriced), ["price", "author", "author_wikidata_id", "date", "number_of_pages",
+                                          "format", "term", "sell_date", "desc"])
+
+    def test_interned_strings(self):
+        file = sorted(glob.glob(f"{curdir}/../Catalogues/101-200/*.xml"))[0]
+        records = list(item_extractor(etree.parse(file), {}, records=True).values())
+        self.assertTrue(all(r.sell_date is records[0].sell_date for r in records))
+        self.assertIs(intern_text("".join(["Nov", "embre"])), intern_text("Novembre"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,176 @@
+# coding: utf-8
+
+# --------------------------------------------------------------------------------------------------
+# Katabase project: github.com/katabase/
+# JSON encoders and compressed files of the outputs (options --compact, --json-backend and --compress)
+#
+# * PROCESS BREAKDOWN *
+# - Serializer encodes the records of the outputs, in one of two modes: pretty, the usual format of the
+#   exports (json.dumps(..., indent=4), the non-ASCII characters being escaped), always written by the
+#   json module of the standard library, or compact (no whitespace, UTF-8 characters), written by orjson
+#   when it is installed and by the json module otherwise ; both backends give the same compact text ;
+# - open_output() opens an output file for writing, compressed with gzip or zstd when its name ends
+#   with .gz or .zst ; open_input() opens a file for reading and decompresses it if it starts with the
+#   magic number of gzip or zstd, whatever its name ; load_json() reads a whole JSON file with the
+#   fastest decoder available ; find_output() finds an output written with or without compression.
+# orjson and zstandard are optional dependencies: they are only needed for the fast backend and for
+# the zstd files.
+# --------------------------------------------------------------------------------------------------
+
+
+import io
+import os
+import json
+import gzip
+
+from records import json_default
+
+try:
+	import orjson
+except ImportError:
+	orjson = None
+try:
+	import zstandard
+except ImportError:
+	zstandard = None
+
+
+BACKENDS = ["auto", "orjson", "json"]
+# compressions of the outputs, and the extension added to the name of the files
+COMPRESSIONS = {"gzip": ".gz", "zstd": ".zst"}
+MAGIC_NUMBERS = {"gzip": b"\x1f\x8b", "zstd": b"\x28\xb5\x2f\xfd"}
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+# ============== ENCODERS ============== #
+class Serializer:
+	"""
+	encoder of the records of the outputs
+	"""
+	def __init__(self, compact=False, backend="auto"):
+		"""
+		:param compact: write compact JSON instead of the indented JSON of json.dump(..., indent=4)
+		:param backend: "orjson", "json" (the standard library) or "auto" (orjson if it is installed) ;
+						it is only used in compact mode: the pretty output is always written by json
+		"""
+		if backend not in BACKENDS:
+			raise ValueError(f"unknown JSON backend {backend}, expected one of {', '.join(BACKENDS)}")
+		if backend == "orjson" and orjson is None:
+			raise ImportError("orjson is needed for the orjson backend: pip install orjson")
+		self.compact = compact
+		self.backend = "json" if not compact or backend == "json" or orjson is None else "orjson"
+
+	def dumps(self, data):
+		"""
+		:param data: a JSON value (the records of records.py included)
+		:return: the value, encoded as a string
+		"""
+		if not self.compact:
+			return json.dumps(data, indent=4, default=json_default)
+		if self.backend == "orjson":
+			return orjson.dumps(data, default=json_default).decode("utf-8")
+		return json.dumps(data, separators=(",", ":"), ensure_ascii=False, default=json_default)
+
+	def key(self, key):
+		"""
+		:param key: the @xml:id of a record
+		:return: the key, encoded as a JSON string
+		"""
+		return json.dumps(key, ensure_ascii=not self.compact)
+
+
+# ============== FILES ============== #
+def compression_of(path):
+	"""
+	:param path: path to a file
+	:return: the compression of the file according to its extension ("gzip", "zstd"), or None
+	"""
+	for compression, extension in COMPRESSIONS.items():
+		if path.endswith(extension):
+			return compression
+	return None
+
+
+def check_compression(compression):
+	"""
+	raise an explicit error if a compression can't be used
+	:param compression: "gzip", "zstd" or None
+	:return: None
+	"""
+	if compression is not None and compression not in COMPRESSIONS:
+		raise ValueError(f"unknown compression {compression}, expected one of {', '.join(COMPRESSIONS)}")
+	if compression == "zstd" and zstandard is None:
+		raise ImportError("zstandard is needed to write or read .zst files: pip install zstandard")
+	return None
+
+
+def open_output(path, compression=None, buffer_size=io.DEFAULT_BUFFER_SIZE):
+	"""
+	open a text file for writing, in UTF-8
+	:param path: path to the file
+	:param compression: "gzip", "zstd" or None to write a plain file
+	:param buffer_size: size of the write buffer, in bytes
+	:return: the file object
+	"""
+	check_compression(compression)
+	if compression is None:
+		return open(path, mode="w", encoding="utf-8", buffering=buffer_size)
+	if compression == "gzip":
+		# mtime=0: the same records always give the same file (and the same sha256 in the shard manifests)
+		stream = gzip.GzipFile(path, mode="wb", compresslevel=GZIP_LEVEL, mtime=0)
+	else:
+		stream = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(open(path, mode="wb"), closefd=True)
+	return io.TextIOWrapper(io.BufferedWriter(stream, buffer_size), encoding="utf-8")
+
+
+def sniff_compression(path):
+	"""
+	:param path: path to a file
+	:return: the compression of the file according to its first bytes ("gzip", "zstd"), or None
+	"""
+	with open(path, mode="rb") as f:
+		start = f.read(4)
+	for compression, magic in MAGIC_NUMBERS.items():
+		if start.startswith(magic):
+			return compression
+	return None
+
+
+def open_input(path):
+	"""
+	open a text file for reading, in UTF-8, decompressing it if it is compressed with gzip or zstd
+	:param path: path to the file
+	:return: the file object
+	"""
+	compression = sniff_compression(path)
+	check_compression(compression)
+	if compression == "gzip":
+		return gzip.open(path, mode="rt", encoding="utf-8")
+	if compression == "zstd":
+		return zstandard.open(path, mode="rt", encoding="utf-8")
+	return open(path, mode="r", encoding="utf-8")
+
+
+def load_json(path):
+	"""
+	read a JSON file, compressed or not (see open_input()), with orjson if it is installed
+	:param path: path to the file
+	:return: the decoded JSON value
+	"""
+	with open_input(path) as f:
+		if orjson is not None:
+			return orjson.loads(f.read())
+		return json.load(f)
+
+
+def find_output(path):
+	"""
+	find an output file, that may have been written with compression
+	:param path: path to the plain output file (output/export_catalog.json)
+	:return: the last modified of path, path + ".gz" and path + ".zst" (the output of the last run) ;
+			 path if none of them exists
+	"""
+	candidates = [candidate for candidate in [path] + [path + extension for extension in COMPRESSIONS.values()]
+				  if os.path.isfile(candidate)]
+	return max(candidates, key=os.path.getmtime) if candidates else path
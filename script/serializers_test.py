@@ -0,0 +1,85 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+import serializers
+from serializers import *
+from writers import JsonObjectWriter, JsonLinesWriter
+
+
+class Serializers(unittest.TestCase):
+
+    records = {
+        "CAT_000112_e18_d1": {"price": 15.0, "author": "Barry", "desc": "L. a. s.\n1846", "term": 7},
+        "CAT_000113_e1_d1": {"price": None, "high_price_items_c": {"CAT_000113_e1": 2.0}},
+        "CAT_000113_e1_d2": {"author": "Mérimée", "format": None, "desc": "Lettre à « M. » 🎵"}
+    }
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.orjson = serializers.orjson
+
+    def tearDown(self):
+        serializers.orjson = self.orjson
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, serializer):
+        path = os.path.join(self.tmpdir, name)
+        with JsonObjectWriter(path, serializer=serializer) as writer:
+            writer.write(dict(list(self.records.items())[:1]))
+            writer.write(dict(list(self.records.items())[1:]))
+        return path
+
+    def test_pretty_is_unchanged(self):
+        for backend in BACKENDS:
+            serializer = Serializer(backend=backend)
+            self.assertEqual(serializer.dumps(self.records), json.dumps(self.records, indent=4))
+        path = self.write("export_item.json", Serializer(backend="orjson" if self.orjson else "json"))
+        with open(path, mode="r", encoding="utf-8") as f:
+            self.assertEqual(f.read(), json.dumps(self.records, indent=4))
+
+    def test_compact(self):
+        expected = json.dumps(self.records, separators=(",", ":"), ensure_ascii=False)
+        self.assertEqual(Serializer(compact=True, backend="json").dumps(self.records), expected)
+        if self.orjson is not None:
+            self.assertEqual(Serializer(compact=True, backend="orjson").dumps(self.records), expected)
+        path = self.write("export_item.json", Serializer(compact=True))
+        with open(path, mode="r", encoding="utf-8") as f:
+            self.assertEqual(json.load(f), self.records)
+
+    def test_backend_fallback(self):
+        serializers.orjson = None
+        self.assertEqual(Serializer(compact=True).backend, "json")
+        with self.assertRaisesRegex(ImportError, "pip install orjson"):
+            Serializer(compact=True, backend="orjson")
+        with self.assertRaises(ValueError):
+            Serializer(backend="ujson")
+
+    def test_compressed_outputs(self):
+        compressions = ["gzip"] + (["zstd"] if serializers.zstandard is not None else [])
+        for compression in compressions:
+            path = self.write("export_item.json" + COMPRESSIONS[compression], Serializer(compact=True))
+            self.assertEqual(sniff_compression(path), compression)
+            self.assertEqual(load_json(path), self.records)
+            # the compression is found from the content of the file, whatever its name
+            os.replace(path, os.path.join(self.tmpdir, "renamed.json"))
+            self.assertEqual(load_json(os.path.join(self.tmpdir, "renamed.json")), self.records)
+        path = os.path.join(self.tmpdir, "export_item.jsonl.gz")
+        with JsonLinesWriter(path, id_key="desc_id", serializer=Serializer(compact=True)) as writer:
+            writer.write(self.records)
+        with open_input(path) as f:
+            self.assertEqual([json.loads(line)["desc_id"] for line in f], list(self.records))
+
+    def test_find_output(self):
+        base = os.path.join(self.tmpdir, "export_catalog.json")
+        self.assertEqual(find_output(base), base)
+        self.write("export_catalog.json", Serializer())
+        os.utime(base, (0, 0))
+        path = self.write("export_catalog.json.gz", Serializer(compact=True))
+        self.assertEqual(find_output(base), path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,316 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# --------------------------------------------------------------------------------------------------
+# Katabase project: github.com/katabase/
+# Long-running extraction: watch the catalogues, re-extract the files that change and serve the results
+#
+# * PROCESS BREAKDOWN *
+# - CorpusState keeps the results of extractor_json.extract_file() for every catalogue in memory ;
+#   update() polls Catalogues/ (mtime and size of each file) and only re-extracts the files that
+#   were added or modified since the last poll ; the results of deleted files are dropped. if a
+#   file can't be extracted (a file being saved, for example), the error is kept and the previous
+#   results of the file are kept until the file changes again. the price tables are polled too:
+#   when one of them changes, every file is extracted again ;
+# - after each update, the export files of the 'output' directory are written again, in the same
+#   order as extractor_json.py does: the records of each catalogue are formatted once (see
+#   writers.StreamWriter.fragment()), so only the modified catalogues are serialized again. if
+#   the export files can't be written, the error is printed, the previous export files are left
+#   as they were and the export is tried again at the next poll ;
+# - a local HTTP server gives the current data on a catalogue: GET /catalogues/<id> returns its
+#   data and the data on its items (the id is the @xml:id of the catalogue, or the name of its
+#   file without extension) ; GET /status returns the state of the extraction.
+# usage: python3 serve.py [--port 8765] [--interval 0.5] [--format json jsonl] [--jobs N]
+# --------------------------------------------------------------------------------------------------
+
+
+import os
+import gc
+import sys
+import glob
+import json
+import time
+import argparse
+import threading
+import traceback
+from contextlib import ExitStack
+from urllib.parse import urlsplit, unquote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from extractor_json import run_extraction, price_converter, curdir
+from writers import JsonObjectWriter, JsonLinesWriter
+from records import json_default
+
+
+# output files of each format: (writer class, item file, catalogue file, writer arguments)
+FORMATS = {
+	"json": (JsonObjectWriter, "export_item.json", "export_catalog.json", ({}, {})),
+	"jsonl": (JsonLinesWriter, "export_item.jsonl", "export_catalog.jsonl", ({"id_key": "desc_id"}, {"id_key": "cat_id"}))
+}
+
+
+# ============== STATE OF THE CORPUS ============== #
+class CorpusState:
+	"""
+	the results of the extraction of every catalogue, kept in memory and updated
+	when the files change. the HTTP server reads the state from its own threads:
+	the results are only modified with the lock held.
+	"""
+	def __init__(self, source_dir, output_dir=None, formats=("json",), extra_stats=False):
+		"""
+		:param source_dir: the directory of the XML catalogues
+		:param output_dir: the directory of the export files, or None to keep the results in memory only
+		:param formats: formats of the export files (see FORMATS)
+		:param extra_stats: add extra statistics on the prices of the catalogues
+		"""
+		self.source_dir = source_dir
+		self.output_dir = output_dir
+		self.formats = formats
+		self.extra_stats = extra_stats
+		self.results = {}  # file -> (output_dict, catalog_dict) of its last successful extraction
+		self.fragments = {}  # (file, format) -> the formatted records of the file (see write_exports())
+		self.signatures = {}  # file -> (mtime, size) of the file when it was last extracted
+		self.errors = {}  # file -> error message of its last extraction, if it failed
+		self.index = {}  # catalogue id -> file
+		self.tables = None  # fingerprints of the price tables used by the last extraction (see PriceConverter.hashes)
+		self.export_error = None  # error message of the last export, if it failed (see write_exports())
+		self.updated = None  # time of the last update
+		self.lock = threading.Lock()
+
+	def scan(self, everything=False):
+		"""
+		compare the files of the source directory to the ones that were extracted
+		:param everything: consider that every file was modified
+		:return: tuple of (changed, removed): the sorted lists of the files that were
+				 added or modified, and of the files that were deleted
+		"""
+		signatures = {}
+		for file in glob.glob(f"{self.source_dir}/**/*.xml", recursive=True):
+			try:
+				stat = os.stat(file)
+			except FileNotFoundError:  # deleted since the glob
+				continue
+			signatures[file] = (stat.st_mtime_ns, stat.st_size)
+		changed = sorted(file for file, signature in signatures.items()
+						 if everything or self.signatures.get(file) != signature)
+		removed = sorted(file for file in self.signatures if file not in signatures)
+		for file in changed:
+			self.signatures[file] = signatures[file]
+		return changed, removed
+
+	def update(self, jobs=1):
+		"""
+		re-extract the files that changed (every file if the price tables changed), drop the
+		deleted ones and write the export files again
+		:param jobs: number of worker processes to extract the files
+		:return: tuple of (changed, removed), as scan()
+		"""
+		price_converter.refresh()
+		tables = dict(price_converter.hashes)
+		changed, removed = self.scan(everything=tables != self.tables)
+		self.tables = tables
+		if not changed and not removed:
+			if self.export_error is not None:
+				self.export()
+			return changed, removed
+		extracted = list(run_extraction(changed, jobs, extra_stats=self.extra_stats, records=True))
+		with self.lock:
+			for file in removed:
+				self.forget(file)
+				del self.signatures[file]
+				self.errors.pop(file, None)
+			for file, output_dict, catalog_dict, error, *_ in extracted:
+				if error is not None:
+					self.errors[file] = error
+					continue
+				self.errors.pop(file, None)
+				self.forget(file)
+				self.results[file] = (output_dict, catalog_dict)
+				self.index[self.file_id(file)] = file
+				for cat_id in catalog_dict:
+					self.index[cat_id] = file
+			self.updated = time.time()
+		self.export()
+		return changed, removed
+
+	def export(self):
+		"""
+		write the export files (if there is an output directory) ; if they can't be written, the
+		previous export files are left as they were and the error is printed, once for each new error
+		:return: True if the export files were written, else False
+		"""
+		if self.output_dir is None:
+			return False
+		try:
+			self.write_exports()
+		except Exception:
+			error = traceback.format_exc()
+			if error != self.export_error:
+				print(f"ERROR ON EXPORT --- {self.output_dir}")
+				print(error)
+			self.export_error = error
+			return False
+		self.export_error = None
+		return True
+
+	def forget(self, file):
+		"""
+		drop the results of a file, its formatted records and its ids
+		:param file: path to an XML catalogue
+		:return: None
+		"""
+		self.results.pop(file, None)
+		for fmt in FORMATS:
+			self.fragments.pop((file, fmt), None)
+		for cat_id in [cat_id for cat_id, indexed in self.index.items() if indexed == file]:
+			del self.index[cat_id]
+		return None
+
+	@staticmethod
+	def file_id(file):
+		"""
+		:param file: path to an XML catalogue
+		:return: the name of the file without its extension
+		"""
+		return os.path.splitext(os.path.basename(file))[0]
+
+	def write_exports(self):
+		"""
+		write the export files in every format, in the order of the files (as extractor_json.py) ;
+		the formatted records of each file are kept until the file changes
+		:return: None
+		"""
+		with self.lock:
+			results = sorted(self.results.items())
+		with ExitStack() as stack:
+			for fmt in self.formats:
+				writer, item_file, catalog_file, (item_args, catalog_args) = FORMATS[fmt]
+				item_writer = stack.enter_context(writer(os.path.join(self.output_dir, item_file), **item_args))
+				catalog_writer = stack.enter_context(writer(os.path.join(self.output_dir, catalog_file), **catalog_args))
+				for file, (output_dict, catalog_dict) in results:
+					if (file, fmt) not in self.fragments:
+						self.fragments[(file, fmt)] = (item_writer.fragment(output_dict), len(output_dict),
+													   catalog_writer.fragment(catalog_dict), len(catalog_dict))
+					item_fragment, item_count, catalog_fragment, catalog_count = self.fragments[(file, fmt)]
+					item_writer.write_fragment(item_fragment, item_count)
+					catalog_writer.write_fragment(catalog_fragment, catalog_count)
+		return None
+
+	def catalogue(self, cat_id):
+		"""
+		get the current data on a catalogue and its items
+		:param cat_id: the @xml:id of the catalogue, or the name of its file without extension
+		:return: dict with the data, or None if there is no such catalogue
+		"""
+		with self.lock:
+			file = self.index.get(cat_id)
+			if file is None:
+				return None
+			output_dict, catalog_dict = self.results[file]
+			return {"file": os.path.relpath(file, self.source_dir), "catalog": catalog_dict,
+					"items": output_dict, "error": self.errors.get(file)}
+
+	def status(self):
+		"""
+		:return: dict with the number of files extracted, the files whose last extraction
+				 failed, the error of the last export (if it failed) and the time of the last update
+		"""
+		with self.lock:
+			return {"files": len(self.results), "descs": sum(len(o) for o, _ in self.results.values()),
+					"errors": {os.path.relpath(file, self.source_dir): error for file, error in self.errors.items()},
+					"export_error": self.export_error, "updated": self.updated}
+
+
+# ============== HTTP SERVER ============== #
+class RequestHandler(BaseHTTPRequestHandler):
+	"""
+	answer GET /catalogues/<id> and GET /status with the data of the server's CorpusState
+	"""
+	def do_GET(self):
+		parts = unquote(urlsplit(self.path).path).strip("/").split("/")
+		if parts == ["status"]:
+			self.send_json(200, self.server.state.status())
+		elif len(parts) == 2 and parts[0] == "catalogues":
+			data = self.server.state.catalogue(parts[1])
+			if data is None:
+				self.send_json(404, {"error": f"no catalogue {parts[1]}"})
+			else:
+				self.send_json(200, data)
+		else:
+			self.send_json(404, {"error": "unknown path: use /catalogues/<id> or /status"})
+
+	def send_json(self, code, data):
+		"""
+		:param code: the HTTP status code
+		:param data: the data to send, as JSON
+		:return: None
+		"""
+		body = json.dumps(data, default=json_default).encode("utf-8")
+		self.send_response(code)
+		self.send_header("Content-Type", "application/json; charset=utf-8")
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+		return None
+
+	def log_message(self, format, *args):
+		return None  # the requests are not logged
+
+
+def start_server(state, host="127.0.0.1", port=8765):
+	"""
+	start the HTTP server in a background thread
+	:param state: the CorpusState to serve
+	:param host: the address of the server (only local by default)
+	:param port: the port of the server (0 to choose a free port)
+	:return: the server ; server.shutdown() stops it
+	"""
+	server = ThreadingHTTPServer((host, port), RequestHandler)
+	server.state = state
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	return server
+
+
+# ============== COMMAND LINE INTERFACE ============== #
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="watch Catalogues/, re-extract the files that change and serve the results")
+	parser.add_argument("-p", "--port", type=int, default=8765, help="port of the HTTP server ; default: 8765")
+	parser.add_argument("--host", default="127.0.0.1", help="address of the HTTP server ; default: 127.0.0.1")
+	parser.add_argument("-n", "--interval", type=float, default=0.5,
+						help="time between two scans of Catalogues/, in seconds ; default: 0.5")
+	parser.add_argument("-f", "--format", nargs="*", choices=list(FORMATS), default=["json"],
+						help="formats of the export files written after each update ; none to only serve the "
+							 "results ; default: json")
+	parser.add_argument("-j", "--jobs", type=int, default=1,
+						help="number of worker processes for the first extraction (0 to use all the CPUs) ; default: 1")
+	parser.add_argument("-x", "--extra-stats", action="store_true", help="add extra statistics on the prices")
+	args = parser.parse_args()
+
+	output_dir = os.path.join(curdir, "..", "output")
+	os.makedirs(output_dir, exist_ok=True)
+	state = CorpusState(os.path.abspath(f"{curdir}/../Catalogues"), output_dir if args.format else None,
+						args.format, args.extra_stats)
+
+	start = time.perf_counter()
+	state.update(args.jobs if args.jobs > 0 else os.cpu_count())
+	# the results of the first extraction stay in memory as long as their file doesn't change:
+	# they are moved out of the generations scanned by the garbage collector
+	gc.freeze()
+	print(f"{len(state.results)} file(s) extracted in {time.perf_counter() - start:.1f} s")
+	server = start_server(state, args.host, args.port)
+	print(f"serving on http://{args.host}:{server.server_address[1]}/catalogues/<id> ; Ctrl+C to stop")
+	try:
+		while True:
+			time.sleep(args.interval)
+			start = time.perf_counter()
+			changed, removed = state.update()
+			for file in changed:
+				if file in state.errors:
+					print(f"ERROR ON FILE --- {file}")
+					print(state.errors[file])
+			if changed or removed:
+				print(f"{len(changed)} file(s) re-extracted, {len(removed)} file(s) removed "
+					  f"in {time.perf_counter() - start:.2f} s")
+	except KeyboardInterrupt:
+		server.shutdown()
+		sys.exit(0)
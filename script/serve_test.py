@@ -0,0 +1,92 @@
+import os
+import json
+import glob
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from urllib.request import urlopen
+from urllib.error import HTTPError
+
+from extractor_json import price_converter, curdir
+from serve import CorpusState, start_server
+
+
+class Corpus_state(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmpdir, "Catalogues")
+        self.output = os.path.join(self.tmpdir, "output")
+        os.makedirs(os.path.join(self.source, "1-100"))
+        os.makedirs(self.output)
+        for file in sorted(glob.glob(f"{curdir}/../Catalogues/1-100/*.xml"))[:3]:
+            shutil.copy(file, os.path.join(self.source, "1-100"))
+        self.state = CorpusState(self.source, self.output, formats=["json", "jsonl"])
+        self.state.update()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def read_export(self):
+        with open(os.path.join(self.output, "export_catalog.json"), mode="r") as f:
+            return json.load(f)
+
+    def test_only_changed_files(self):
+        self.assertEqual(sorted(self.read_export()), ["CAT_000001", "CAT_000002", "CAT_000003"])
+        self.assertEqual(self.state.update(), ([], []))
+        file = os.path.join(self.source, "1-100", "CAT_000002_wd.xml")
+        os.utime(file, ns=(0, 0))
+        self.assertEqual(self.state.update(), ([file], []))
+        os.remove(file)
+        self.assertEqual(self.state.update(), ([], [file]))
+        self.assertEqual(sorted(self.read_export()), ["CAT_000001", "CAT_000003"])
+        self.assertIsNone(self.state.catalogue("CAT_000002"))
+
+    def test_broken_file_keeps_previous_results(self):
+        file = os.path.join(self.source, "1-100", "CAT_000003_wd.xml")
+        with open(file, mode="w") as f:
+            f.write("<TEI><text>")
+        self.state.update()
+        data = self.state.catalogue("CAT_000003")
+        self.assertIsNotNone(data["error"])
+        self.assertIn("CAT_000003", data["catalog"])
+        self.assertEqual(self.state.catalogue("CAT_000003_wd")["file"], os.path.join("1-100", "CAT_000003_wd.xml"))
+
+    def test_price_tables_change(self):
+        with mock.patch.object(price_converter, "hashes", {**price_converter.hashes, "FRF": "changed"}):
+            self.assertEqual(len(self.state.update()[0]), 3)
+            self.assertEqual(self.state.update(), ([], []))
+        self.assertEqual(len(self.state.update()[0]), 3)
+
+    def test_export_error(self):
+        file = os.path.join(self.source, "1-100", "CAT_000002_wd.xml")
+        os.remove(file)
+        with mock.patch.object(self.state, "write_exports", side_effect=OSError("No space left on device")):
+            self.assertEqual(self.state.update(), ([], [file]))
+        # the previous export files are served until the export succeeds
+        self.assertIn("No space left on device", self.state.status()["export_error"])
+        self.assertIn("CAT_000002", self.read_export())
+        self.assertEqual(self.state.update(), ([], []))
+        self.assertIsNone(self.state.status()["export_error"])
+        self.assertEqual(sorted(self.read_export()), ["CAT_000001", "CAT_000003"])
+
+    def test_http(self):
+        server = start_server(self.state, port=0)
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}"
+            with urlopen(f"{url}/catalogues/CAT_000001") as response:
+                data = json.load(response)
+            self.assertEqual(list(data["catalog"]), ["CAT_000001"])
+            self.assertTrue(all(desc_id.startswith("CAT_000001_") for desc_id in data["items"]))
+            with urlopen(f"{url}/status") as response:
+                self.assertEqual(json.load(response)["files"], 3)
+            with self.assertRaises(HTTPError):
+                urlopen(f"{url}/catalogues/CAT_999999")
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,346 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# --------------------------------------------------------------------------------------------------
+# Katabase project: github.com/katabase/
+# Sharded extraction (option --shard of extractor_json.py) and merge of the shards
+#
+# * PROCESS BREAKDOWN *
+# - a shard is a part of the corpus: a subfolder of Catalogues/ ("101-200") or a range of catalogue
+#   numbers ("101-150", from CAT_000101 to CAT_000150) ; shard_files() selects its files ;
+# - extractor_json.py --shard extracts the files of a shard to output/shards/<shard>/export_item.json
+#   and export_catalog.json, then writes the manifest of the shard (manifest.json): the sha256, the
+#   number of descs and catalogues and the extraction time of each file, the version of the extractor,
+#   the fingerprints of the price tables and the sha256 of the outputs ; the manifest is written last,
+#   so that a shard without manifest is incomplete ; with --incremental, a shard whose manifest is
+#   still valid (see is_current()) is not extracted again ;
+# - merge_shards() checks a set of shards (complete, not modified since their manifest, from the same
+#   extractor and price tables, without a file or an @xml:id in two shards, covering every file of
+#   Catalogues/ in their current version) and writes their records to output/export_item.json and
+#   export_catalog.json, in the order of the files: the output is the same as the one of a single
+#   extraction of the whole corpus ; the outputs of the shards and of the merge can be compact and
+#   compressed (export_item.json.gz, export_item.json.zst, see serializers.py) ;
+# - if __name__ == "__main__", the shards given on the command line are merged.
+# usage: python3 shards.py ../output/shards/* [--output-dir ../output] [--partial] [--compact] [--compress zstd]
+# --------------------------------------------------------------------------------------------------
+
+
+import os
+import re
+import sys
+import glob
+import json
+import hashlib
+import argparse
+from itertools import islice
+
+from serializers import Serializer, BACKENDS, COMPRESSIONS, check_compression, open_input
+from writers import JsonObjectWriter
+
+
+curdir = os.path.abspath(os.path.dirname(os.path.abspath(__file__)))
+
+MANIFEST_VERSION = 1  # version of the format of the manifests ; the other versions are refused
+MANIFEST = "manifest.json"
+OUTPUTS = {"items": "export_item.json", "catalogues": "export_catalog.json"}
+range_pattern = re.compile(r"^(\d+)-(\d+)$")
+catalogue_number_pattern = re.compile(r"^CAT_(\d+)")
+
+
+# ============== SHARDS ============== #
+def shard_files(files, spec, source_dir):
+	"""
+	select the files of a shard
+	:param files: list of paths to the XML catalogues
+	:param spec: a subfolder of source_dir ("101-200"), or a range of catalogue numbers ("101-150")
+	:param source_dir: the directory of the XML catalogues (Catalogues/)
+	:return: the files of the shard, in the order of `files`
+	"""
+	folder = os.path.join(os.path.abspath(source_dir), spec)
+	if os.path.isdir(folder):
+		return [file for file in files if os.path.abspath(file).startswith(folder + os.sep)]
+	match = range_pattern.match(spec)
+	if match is None:
+		raise ValueError(f"{spec} is neither a subfolder of {source_dir} nor a range of catalogue numbers (101-150)")
+	low, high = int(match[1]), int(match[2])
+	selected = []
+	for file in files:
+		number = catalogue_number_pattern.match(os.path.basename(file))
+		if number is not None and low <= int(number[1]) <= high:
+			selected.append(file)
+	return selected
+
+
+def shard_name(spec):
+	"""
+	:param spec: a shard, as given to shard_files()
+	:return: the name of the folder of the shard's outputs
+	"""
+	return os.path.normpath(spec).replace(os.sep, "_")
+
+
+def source_path(file, source_dir):
+	"""
+	:param file: path to an XML catalogue
+	:param source_dir: the directory of the XML catalogues
+	:return: the path of the file relative to source_dir, with "/" separators, as stored in the manifests
+	"""
+	return os.path.relpath(os.path.abspath(file), os.path.abspath(source_dir)).replace(os.sep, "/")
+
+
+def file_sha256(path):
+	"""
+	:param path: path to a file
+	:return: the sha256 of the file's content
+	"""
+	digest = hashlib.sha256()
+	with open(path, mode="rb") as f:
+		for chunk in iter(lambda: f.read(1024 * 1024), b""):
+			digest.update(chunk)
+	return digest.hexdigest()
+
+
+# ============== MANIFESTS ============== #
+def build_manifest(shard, extractor_version, tables, sources, outputs, compact=False):
+	"""
+	:param shard: the shard, as given to shard_files()
+	:param extractor_version: the version of the extractor (with its options)
+	:param tables: dict mapping each currency to the fingerprint of its price table
+	:param sources: dict mapping the path of each file of the shard (see source_path()) to a dict
+					with its "sha256", its number of "items" (descs) and "catalogues" and the
+					"seconds" spent on its extraction (None if its results came from the cache)
+	:param outputs: dict mapping the name of each output file (export_item.json, or export_item.json.gz
+					if it is compressed) to its number of "records" and its "sha256"
+	:param compact: True if the outputs were written as compact JSON
+	:return: the manifest, as a dict
+	"""
+	sources = dict(sorted(sources.items()))
+	return {
+		"version": MANIFEST_VERSION,
+		"shard": shard,
+		"extractor_version": extractor_version,
+		"tables": dict(sorted(tables.items())),
+		"items": sum(entry["items"] for entry in sources.values()),
+		"catalogues": sum(entry["catalogues"] for entry in sources.values()),
+		"seconds": sum(entry["seconds"] or 0 for entry in sources.values()),
+		"sources": sources,
+		"outputs": outputs,
+		"compact": compact,
+	}
+
+
+def write_manifest(shard_dir, manifest):
+	"""
+	write the manifest of a shard ; the file is replaced only once it is fully written
+	:param shard_dir: the folder of the shard's outputs
+	:param manifest: the manifest, from build_manifest()
+	:return: None
+	"""
+	path = os.path.join(shard_dir, MANIFEST)
+	with open(f"{path}.part", mode="w", encoding="utf-8") as f:
+		json.dump(manifest, f, indent=4)
+	os.replace(f"{path}.part", path)
+	return None
+
+
+def load_manifest(shard_dir):
+	"""
+	read the manifest of a shard
+	:param shard_dir: the folder of the shard's outputs
+	:return: the manifest, or None if the shard has no manifest (it is incomplete)
+	"""
+	path = os.path.join(shard_dir, MANIFEST)
+	if not os.path.isfile(path):
+		return None
+	with open(path, mode="r", encoding="utf-8") as f:
+		manifest = json.load(f)
+	if manifest.get("version") != MANIFEST_VERSION:
+		raise ValueError(f"{path}: version {manifest.get('version')} of the manifest, expected {MANIFEST_VERSION} ; "
+						 f"extract the shard again")
+	return manifest
+
+
+def is_current(shard_dir, sources, extractor_version, tables, names=None, compact=False):
+	"""
+	check if the outputs of a shard are up to date
+	:param shard_dir: the folder of the shard's outputs
+	:param sources: dict mapping the path of each current file of the shard to its sha256
+	:param extractor_version: the current version of the extractor (with its options)
+	:param tables: dict mapping each currency to the fingerprint of its current price table
+	:param names: the names of the output files that the shard must have (export_item.json.gz...) ;
+				  default: the names of OUTPUTS
+	:param compact: True if the outputs must be compact JSON
+	:return: True if the shard is complete and was extracted from the same files, by the same
+			 extractor, with the same price tables, to the same output files
+	"""
+	try:
+		manifest = load_manifest(shard_dir)
+	except ValueError:
+		return False
+	return manifest is not None \
+		and manifest["extractor_version"] == extractor_version \
+		and manifest["tables"] == dict(sorted(tables.items())) \
+		and {source: entry["sha256"] for source, entry in manifest["sources"].items()} == sources \
+		and sorted(manifest["outputs"]) == sorted(names or OUTPUTS.values()) \
+		and manifest.get("compact", False) == compact \
+		and not output_problems(shard_dir, manifest)
+
+
+def output_problems(shard_dir, manifest):
+	"""
+	:param shard_dir: the folder of the shard's outputs
+	:param manifest: the manifest of the shard
+	:return: list of the outputs of the shard that are missing or were modified since the manifest was written
+	"""
+	problems = []
+	for name, output in manifest["outputs"].items():
+		path = os.path.join(shard_dir, name)
+		if not os.path.isfile(path) or file_sha256(path) != output["sha256"]:
+			problems.append(f"{path}: missing or modified since the manifest was written")
+	return problems
+
+
+# ============== MERGE ============== #
+def check_shards(manifests, source_dir=None):
+	"""
+	find the problems that prevent a set of shards from being merged
+	:param manifests: dict mapping the folder of each shard to its manifest (None if it has none)
+	:param source_dir: the directory of the XML catalogues: if it is not None, the shards must cover
+					   all of its files, in their current version
+	:return: list of the problems, as messages
+	"""
+	problems = []
+	owners = {}  # source -> folder of the shard that holds it
+	versions = set()
+	for shard_dir, manifest in manifests.items():
+		if manifest is None:
+			problems.append(f"{shard_dir}: no {MANIFEST}, the shard is incomplete")
+			continue
+		versions.add((manifest["extractor_version"], json.dumps(manifest["tables"])))
+		problems.extend(output_problems(shard_dir, manifest))
+		for source in manifest["sources"]:
+			if source in owners:
+				problems.append(f"{source}: in the shards {owners[source]} and {shard_dir}")
+			owners.setdefault(source, shard_dir)
+	if len(versions) > 1:
+		problems.append("the shards were extracted with different versions of the extractor or of the price tables")
+	if source_dir is not None:
+		current = {source_path(file, source_dir): file
+				   for file in glob.glob(f"{source_dir}/**/*.xml", recursive=True)}
+		missing = sorted(set(current) - set(owners))
+		if missing:
+			problems.append(f"{len(missing)} file(s) of {source_dir} in no shard: " + ", ".join(missing[:5])
+							+ (", ..." if len(missing) > 5 else ""))
+		for source in sorted(set(owners) - set(current)):
+			problems.append(f"{source}: in the shard {owners[source]}, but not in {source_dir} anymore")
+		for source in sorted(set(owners) & set(current)):
+			if manifests[owners[source]]["sources"][source]["sha256"] != file_sha256(current[source]):
+				problems.append(f"{source}: modified since the shard {owners[source]} was extracted")
+	return problems
+
+
+def output_name(manifest, output):
+	"""
+	:param manifest: the manifest of a shard
+	:param output: "items" or "catalogues" (see OUTPUTS)
+	:return: the name of the output file in the shard, with the extension of its compression if it has one
+	"""
+	for name in [OUTPUTS[output]] + [OUTPUTS[output] + extension for extension in COMPRESSIONS.values()]:
+		if name in manifest["outputs"]:
+			return name
+	raise ValueError(f"no {OUTPUTS[output]} in the manifest of the shard {manifest['shard']}")
+
+
+def shard_records(shard_dir, manifest, output):
+	"""
+	read the records of a shard, grouped by file
+	:param shard_dir: the folder of the shard's outputs
+	:param manifest: the manifest of the shard
+	:param output: "items" or "catalogues" (see OUTPUTS)
+	:return: dict mapping the path of each file of the shard to the list of its (@xml:id, data) records
+	"""
+	pairs = []
+
+	def keep_pairs(object_pairs):
+		# the outermost object is decoded last: its pairs are kept as they are, so that an @xml:id
+		# written twice is not lost
+		pairs[:] = object_pairs
+		return dict(object_pairs)
+
+	with open_input(os.path.join(shard_dir, output_name(manifest, output))) as f:
+		json.load(f, object_pairs_hook=keep_pairs)
+	records = iter(pairs)
+	# the records of each file follow each other, in the order of the files, as in the manifest
+	return {source: list(islice(records, entry[output])) for source, entry in manifest["sources"].items()}
+
+
+def merge_shards(shard_dirs, output_dir, source_dir=None, serializer=None, compression=None):
+	"""
+	check a set of shards (see check_shards()) and merge their outputs
+	:param shard_dirs: the folders of the shards' outputs
+	:param output_dir: the folder in which export_item.json and export_catalog.json are written ; it is created
+					   if it doesn't exist
+	:param source_dir: the directory of the XML catalogues: if it is not None, the shards must cover
+					   all of its files, in their current version
+	:param serializer: the serializers.Serializer of the merged outputs ; default: pretty JSON
+	:param compression: "gzip" or "zstd" to compress the merged outputs, or None
+	:return: dict with the number of "items" and "catalogues" written
+	"""
+	manifests = {shard_dir: load_manifest(shard_dir) for shard_dir in shard_dirs}
+	problems = check_shards(manifests, source_dir)
+	if problems:
+		raise ValueError("the shards cannot be merged:\n" + "\n".join(problems))
+	os.makedirs(output_dir, exist_ok=True)
+	counts = {}
+	for output, name in OUTPUTS.items():
+		records = {}
+		for shard_dir, manifest in manifests.items():
+			records.update(shard_records(shard_dir, manifest, output))
+		# an @xml:id can only be in one file
+		seen = {}
+		for source, file_records in records.items():
+			for key, _ in file_records:
+				if key in seen:
+					problems.append(f"{key}: in {seen[key]} and {source}")
+				seen[key] = source
+		if problems:
+			raise ValueError("the shards cannot be merged:\n" + "\n".join(problems))
+		with JsonObjectWriter(os.path.join(output_dir, name + COMPRESSIONS.get(compression, "")),
+							  serializer=serializer) as writer:
+			for source in sorted(records):
+				writer.write(dict(records[source]))
+		counts[output] = writer.count
+	return counts
+
+
+# ============== COMMAND LINE INTERFACE ============== #
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="merge the shards written by extractor_json.py --shard")
+	parser.add_argument("shards", nargs="+", help="the folders of the shards (output/shards/*)")
+	parser.add_argument("--output-dir", default=f"{curdir}/../output",
+						help="folder of the merged export_item.json and export_catalog.json ; default: output/")
+	parser.add_argument("--partial", action="store_true",
+						help="don't check that the shards cover every file of Catalogues/ in its current version")
+	parser.add_argument("--compact", action="store_true",
+						help="write the merged outputs as compact JSON, without indentation")
+	parser.add_argument("--compress", choices=list(COMPRESSIONS), default=None,
+						help="compress the merged outputs (export_item.json.gz or .zst)")
+	parser.add_argument("--json-backend", choices=BACKENDS, default="auto",
+						help="encoder of the compact JSON: orjson, json (standard library) or auto (orjson if "
+							 "it is installed) ; default: auto")
+	args = parser.parse_args()
+	try:
+		serializer = Serializer(args.compact, args.json_backend)
+		check_compression(args.compress)
+	except ImportError as error:
+		parser.error(str(error))
+
+	try:
+		counts = merge_shards(args.shards, args.output_dir,
+							  source_dir=None if args.partial else f"{curdir}/../Catalogues",
+							  serializer=serializer, compression=args.compress)
+	except ValueError as error:
+		print(error)
+		sys.exit(1)
+	print(f"{len(args.shards)} shard(s) merged: {counts['items']} desc(s) and {counts['catalogues']} catalogue(s) "
+		  f"written to {args.output_dir}")
@@ -0,0 +1,148 @@
+import os
+import glob
+import json
+import shutil
+import tempfile
+import unittest
+
+from extractor_json import extract_file, price_converter, EXTRACTOR_VERSION, curdir
+from writers import JsonObjectWriter
+from serializers import Serializer
+from shards import *
+
+
+def extract_shard(files, shard_dir, source_dir, shard="test", suffix="", compact=False):
+    # what extractor_json.py --shard does: write the outputs of the files, then the manifest
+    os.makedirs(shard_dir, exist_ok=True)
+    sources = {}
+    serializer = Serializer(compact)
+    with JsonObjectWriter(os.path.join(shard_dir, OUTPUTS["items"] + suffix), serializer=serializer) as items, \
+            JsonObjectWriter(os.path.join(shard_dir, OUTPUTS["catalogues"] + suffix), serializer=serializer) as catalogues:
+        for file in files:
+            _, output_dict, catalog_dict, _, stats, _ = extract_file(file, telemetry=True)
+            items.write(output_dict)
+            catalogues.write(catalog_dict)
+            sources[source_path(file, source_dir)] = {"sha256": file_sha256(file), "items": len(output_dict),
+                                                      "catalogues": len(catalog_dict), "seconds": stats["total"]}
+    outputs = {os.path.basename(writer.path): {"records": writer.count, "sha256": file_sha256(writer.path)}
+               for writer in (items, catalogues)}
+    write_manifest(shard_dir, build_manifest(shard, EXTRACTOR_VERSION, price_converter.hashes, sources, outputs,
+                                             compact=compact))
+
+
+class Shards(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        # a small corpus, in two subfolders
+        self.source_dir = os.path.join(self.tmpdir, "Catalogues")
+        for folder, pattern in (("1-100", "1-100/CAT_00000[1-4]*"), ("101-200", "101-200/CAT_00010[1-3]*")):
+            os.makedirs(os.path.join(self.source_dir, folder))
+            for file in sorted(glob.glob(f"{curdir}/../Catalogues/{pattern}.xml")):
+                shutil.copy(file, os.path.join(self.source_dir, folder))
+        self.files = sorted(glob.glob(f"{self.source_dir}/**/*.xml", recursive=True))
+        self.shards = os.path.join(self.tmpdir, "shards")
+        self.output_dir = os.path.join(self.tmpdir, "output")
+        os.makedirs(self.output_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def shard(self, spec, suffix="", compact=False):
+        shard_dir = os.path.join(self.shards, shard_name(spec))
+        extract_shard(shard_files(self.files, spec, self.source_dir), shard_dir, self.source_dir, spec,
+                      suffix, compact)
+        return shard_dir
+
+    def test_shard_files(self):
+        names = lambda files: [os.path.basename(file) for file in files]
+        self.assertEqual(names(shard_files(self.files, "101-200", self.source_dir)),
+                         ["CAT_000101_wd.xml", "CAT_000102_wd.xml", "CAT_000103_wd.xml"])
+        self.assertEqual(names(shard_files(self.files, "3-101", self.source_dir)),
+                         ["CAT_000003_wd.xml", "CAT_000004_wd.xml", "CAT_000101_wd.xml"])
+        with self.assertRaises(ValueError):
+            shard_files(self.files, "CAT_000003", self.source_dir)
+
+    def test_same_as_single_extraction(self):
+        # shards that are not folders, merged in any order
+        shard_dirs = [self.shard("101-200"), self.shard("1-2"), self.shard("3-100")]
+        self.assertEqual(merge_shards(shard_dirs, self.output_dir, self.source_dir),
+                         {"items": sum(load_manifest(d)["items"] for d in shard_dirs), "catalogues": 7})
+        extract_shard(self.files, self.tmpdir, self.source_dir)
+        for name in OUTPUTS.values():
+            with open(os.path.join(self.tmpdir, name), mode="r", encoding="utf-8") as f:
+                expected = f.read()
+            with open(os.path.join(self.output_dir, name), mode="r", encoding="utf-8") as f:
+                self.assertEqual(f.read(), expected)
+
+    def test_compressed_shards(self):
+        # compact and compressed shards give the same merged outputs as the pretty ones
+        shard_dirs = [self.shard("1-100", ".zst", compact=True), self.shard("101-200", ".gz")]
+        sources = {source: entry["sha256"] for source, entry in load_manifest(shard_dirs[0])["sources"].items()}
+        self.assertTrue(is_current(shard_dirs[0], sources, EXTRACTOR_VERSION, price_converter.hashes,
+                                   names=[name + ".zst" for name in OUTPUTS.values()], compact=True))
+        self.assertFalse(is_current(shard_dirs[0], sources, EXTRACTOR_VERSION, price_converter.hashes))
+        merge_shards(shard_dirs, self.output_dir, self.source_dir)
+        extract_shard(self.files, self.tmpdir, self.source_dir)
+        for name in OUTPUTS.values():
+            with open(os.path.join(self.tmpdir, name), mode="r", encoding="utf-8") as f:
+                expected = f.read()
+            with open(os.path.join(self.output_dir, name), mode="r", encoding="utf-8") as f:
+                self.assertEqual(f.read(), expected)
+
+    def test_checks(self):
+        shard_dirs = [self.shard("1-100"), self.shard("101-200")]
+        self.assertFalse(check_shards({d: load_manifest(d) for d in shard_dirs}, self.source_dir))
+        # overlapping shards
+        overlap = self.shard("4-101")
+        with self.assertRaisesRegex(ValueError, "CAT_000004_wd.xml: in the shards"):
+            merge_shards(shard_dirs + [overlap], self.output_dir, self.source_dir)
+        # incomplete corpus, unless the check is skipped
+        with self.assertRaisesRegex(ValueError, "3 file"):
+            merge_shards(shard_dirs[:1], self.output_dir, self.source_dir)
+        self.assertEqual(merge_shards(shard_dirs[:1], self.output_dir)["catalogues"], 4)
+        # the output folder is created if needed
+        self.assertEqual(merge_shards(shard_dirs[:1], os.path.join(self.output_dir, "new"))["catalogues"], 4)
+        # a modified catalogue
+        with open(self.files[0], mode="a", encoding="utf-8") as f:
+            f.write("\n")
+        with self.assertRaisesRegex(ValueError, "modified since the shard"):
+            merge_shards(shard_dirs, self.output_dir, self.source_dir)
+        # a shard without manifest, or with a modified output
+        os.remove(os.path.join(shard_dirs[0], MANIFEST))
+        with open(os.path.join(shard_dirs[1], OUTPUTS["items"]), mode="a", encoding="utf-8") as f:
+            f.write(" ")
+        problems = check_shards({d: load_manifest(d) for d in shard_dirs})
+        self.assertEqual(len(problems), 2)
+
+    def test_duplicate_ids(self):
+        shard_dirs = [self.shard("1-100"), self.shard("101-200")]
+        # the same desc in two files
+        path = os.path.join(shard_dirs[1], OUTPUTS["items"])
+        with open(path, mode="r", encoding="utf-8") as f:
+            items = json.load(f)
+        with open(os.path.join(shard_dirs[0], OUTPUTS["items"]), mode="r", encoding="utf-8") as f:
+            duplicate = next(iter(json.load(f)))
+        items = {duplicate: {}, **dict(list(items.items())[1:])}
+        with JsonObjectWriter(path) as writer:
+            writer.write(items)
+        manifest = load_manifest(shard_dirs[1])
+        manifest["outputs"][OUTPUTS["items"]]["sha256"] = file_sha256(path)
+        write_manifest(shard_dirs[1], manifest)
+        with self.assertRaisesRegex(ValueError, f"{duplicate}: in 1-100/"):
+            merge_shards(shard_dirs, self.output_dir, self.source_dir)
+
+    def test_is_current(self):
+        shard_dir = self.shard("1-100")
+        files = shard_files(self.files, "1-100", self.source_dir)
+        sources = {source_path(file, self.source_dir): file_sha256(file) for file in files}
+        self.assertTrue(is_current(shard_dir, sources, EXTRACTOR_VERSION, price_converter.hashes))
+        self.assertFalse(is_current(shard_dir, sources, EXTRACTOR_VERSION + "+extra_stats", price_converter.hashes))
+        self.assertFalse(is_current(shard_dir, {**sources, "1-100/CAT_000005_wd.xml": "0"}, EXTRACTOR_VERSION,
+                                    price_converter.hashes))
+        os.remove(os.path.join(shard_dir, OUTPUTS["catalogues"]))
+        self.assertFalse(is_current(shard_dir, sources, EXTRACTOR_VERSION, price_converter.hashes))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+# coding: utf-8
+
+# --------------------------------------------------------------------------------------------------
+# Katabase project: github.com/katabase/
+# Parser settings of the extraction and cache of reduced trees of the catalogues (option --skeletons)
+#
+# * PROCESS BREAKDOWN *
+# - extraction_parser is the lxml parser used by extractor_json.py: it is created once and reused
+#   for every file, drops the comments and processing instructions and accepts very big text nodes
+#   and trees (huge_tree). the whitespace-only text nodes are kept: in the tei:descs, they are part
+#   of the text of the desc ;
+# - prune_tree() reduces a parsed catalogue to its skeleton: the elements that the extractors never
+#   read are deleted (the taxonomies and the revisions of the tei:teiHeader, the children of the
+#   tei:items that hold no tei:desc, tei:name, tei:measure, tei:date or tei:bibl, such as tei:num,
+#   tei:trait and tei:note, and the text around the children of the tei:items) ; item_extractor() and catalog_extractor() give the same results on the
+#   skeleton as on the whole tree ;
+# - SkeletonCache stores the skeleton of each file (in cache/skeletons/, with the same subfolders as in
+#   Catalogues/), after a binary header holding the mtime and the size of the file: when the results
+#   of a file must be extracted again although the file didn't change (new version of the extractor,
+#   new price tables, run without --incremental), the skeleton, which is about a third smaller than the
+#   file and without comments or indentation between the children of the tei:items, is parsed instead
+#   of the whole file.
+# --------------------------------------------------------------------------------------------------
+
+
+import os
+import struct
+from lxml import etree
+
+
+TEI = "{http://www.tei-c.org/ns/1.0}"
+SKELETON_MAGIC = b"KTBSKEL1"  # start of the skeleton files ; must change with prune_tree()
+# header of the skeleton files: magic, mtime (in nanoseconds) and size of the XML file it was built from
+SKELETON_HEADER = struct.Struct("<8sqq")
+# elements read by the extractors inside the tei:items
+ITEM_TAGS = (f"{TEI}desc", f"{TEI}name", f"{TEI}measure", f"{TEI}date", f"{TEI}bibl")
+# children of the tei:teiHeader that the extractors never read
+PRUNED_HEADER = (f"{TEI}encodingDesc", f"{TEI}profileDesc", f"{TEI}revisionDesc")
+
+extraction_parser = etree.XMLParser(remove_comments=True, remove_pis=True, huge_tree=True)
+
+
+# ============== SKELETONS ============== #
+def prune_tree(tree):
+	"""
+	reduce a catalogue to the elements read by item_extractor() and catalog_extractor(). the
+	tei:descs, tei:names and tei:measures are kept whole, so that their text doesn't change.
+	:param tree: an XML tree or the tei:TEI element of a catalogue ; it is modified in place
+	:return: the tree
+	"""
+	root = tree.getroot() if isinstance(tree, etree._ElementTree) else tree
+	header = root.find(f"{TEI}teiHeader")
+	if header is not None:
+		for child in [child for child in header if child.tag in PRUNED_HEADER]:
+			header.remove(child)
+	for item in root.iter(f"{TEI}item"):
+		# the text directly inside the tei:items (around their children) is never read either
+		item.text, item.tail = None, None
+		for child in list(item):
+			if child.tag in ITEM_TAGS or item_tags(child):
+				child.tail = None
+			else:
+				item.remove(child)
+	return tree
+
+
+def item_tags(element):
+	"""
+	:param element: a child of a tei:item
+	:return: True if an element read by the extractors (see ITEM_TAGS) is inside the element
+	"""
+	return any(True for _ in element.iter(*ITEM_TAGS))
+
+
+class SkeletonCache:
+	"""
+	per-file cache of the skeletons of the catalogues (see prune_tree()) ; the skeleton of a file is
+	built again when the file is modified (its mtime or its size changes)
+	"""
+	def __init__(self, cache_dir, source_dir):
+		"""
+		:param cache_dir: the directory in which the skeletons are stored
+		:param source_dir: the directory containing the XML catalogues (Catalogues/)
+		"""
+		self.cache_dir = os.path.abspath(cache_dir)
+		self.source_dir = os.path.abspath(source_dir)
+
+	def entry_path(self, file):
+		"""
+		:param file: path to an XML catalogue
+		:return: path of the skeleton of the file
+		"""
+		relpath = os.path.relpath(os.path.abspath(file), self.source_dir)
+		return os.path.join(self.cache_dir, os.path.splitext(relpath)[0] + ".skel")
+
+	def parse(self, file):
+		"""
+		parse the skeleton of a file if it is up to date ; else, parse the file, reduce it
+		to its skeleton and store the skeleton
+		:param file: path to an XML catalogue
+		:return: tuple of (tree, hit): the skeleton, as an XML tree, and True if it was read from the cache
+		"""
+		stat = os.stat(file)
+		header = SKELETON_HEADER.pack(SKELETON_MAGIC, stat.st_mtime_ns, stat.st_size)
+		path = self.entry_path(file)
+		try:
+			with open(path, mode="rb") as f:
+				if f.read(SKELETON_HEADER.size) == header:
+					return etree.parse(f, extraction_parser), True
+		except OSError:
+			pass
+		tree = prune_tree(etree.parse(file, extraction_parser))
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		with open(f"{path}.tmp", mode="wb") as f:
+			f.write(header)
+			tree.write(f, encoding="utf-8")
+		os.replace(f"{path}.tmp", path)
+		return tree, False
+
+	def prune(self, files):
+		"""
+		delete the skeletons of the XML files that are not in `files` anymore
+		:param files: list of paths to the current XML catalogues
+		:return: the number of deleted skeletons
+		"""
+		keep = {self.entry_path(file) for file in files}
+		deleted = 0
+		for dirpath, dirnames, filenames in os.walk(self.cache_dir):
+			for filename in filenames:
+				path = os.path.join(dirpath, filename)
+				if path not in keep:
+					os.remove(path)
+					deleted += 1
+		return deleted
@@ -0,0 +1,58 @@
+import os
+import glob
+import shutil
+import tempfile
+import unittest
+from lxml import etree
+
+from extractor_json import item_extractor, catalog_extractor, extract_file, curdir
+from skeleton import *
+
+
+class Skeletons(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.source_dir = os.path.join(self.tmpdir.name, "Catalogues")
+        os.makedirs(self.source_dir)
+        for file in sorted(glob.glob(f"{curdir}/../Catalogues/101-200/*.xml"))[:5]:
+            shutil.copy(file, self.source_dir)
+        self.files = sorted(glob.glob(f"{self.source_dir}/*.xml"))
+        self.skeletons = SkeletonCache(os.path.join(self.tmpdir.name, "skeletons"), self.source_dir)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_same_results(self):
+        for file in self.files:
+            expected = extract_file(file, extra_stats=True)
+            for hit in (False, True):
+                tree, from_cache = self.skeletons.parse(file)
+                self.assertEqual(from_cache, hit)
+                self.assertEqual(item_extractor(tree, {}), expected[1])
+                self.assertEqual(catalog_extractor(tree, {}, extra_stats=True), expected[2])
+            self.assertEqual(extract_file(file, extra_stats=True, skeletons=self.skeletons)[1:3], expected[1:3])
+
+    def test_pruned(self):
+        tree, _ = self.skeletons.parse(self.files[0])
+        self.assertEqual(tree.xpath("//tei:encodingDesc | //tei:item/tei:num | //tei:item/tei:trait",
+                                    namespaces={"tei": TEI[1:-1]}), [])
+        self.assertLess(os.path.getsize(self.skeletons.entry_path(self.files[0])), os.path.getsize(self.files[0]))
+
+    def test_modified_file(self):
+        file = self.files[0]
+        self.skeletons.parse(file)
+        with open(file, mode="rb") as f:
+            data = f.read()
+        with open(file, mode="wb") as f:
+            f.write(data.replace(b"<body>", b"<body><!-- comment -->", 1))
+        tree, hit = self.skeletons.parse(file)
+        self.assertFalse(hit)
+        self.assertEqual(tree.xpath("//comment()"), [])
+        self.assertTrue(self.skeletons.parse(file)[1])
+        self.assertEqual(self.skeletons.prune(self.files[1:]), 1)
+        self.assertFalse(os.path.exists(self.skeletons.entry_path(file)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,299 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# --------------------------------------------------------------------------------------------------
+# Katabase project: github.com/katabase/
+# SQLite store of the extracted data, with indexes to query the items and catalogues
+#
+# * PROCESS BREAKDOWN *
+# - SqliteStore creates (if needed) a database with an `items` table (one row per desc), a
+#   `catalogs` table (one row per catalogue), a `sources` table (the hash of each XML file
+#   the rows were extracted from) and an FTS5 index over the text of the descs ;
+# - extractor_json.py (option --sqlite) calls SqliteStore.upsert() with the results of each
+#   file: the rows of the file are replaced, unless the file is unchanged since the last run ;
+#   SqliteStore.prune() deletes the rows of the files that no longer exist ;
+# - query_items() answers queries on the author, the sell year, the price, the term, the format
+#   and the text of the descs using the indexes ; if __name__ == "__main__", it is run from
+#   the command line and prints the matching items as JSON Lines.
+# --------------------------------------------------------------------------------------------------
+
+
+import os
+import re
+import json
+import sqlite3
+import argparse
+
+
+curdir = os.path.abspath(os.path.dirname(os.path.abspath(__file__)))
+
+# columns of the items table, in the order of the data of item_extractor()
+ITEM_COLUMNS = ["desc_id", "cat_id", "source", "currency", "price", "price_c", "author", "author_wikidata_id",
+				"date", "number_of_pages", "format", "term", "sell_date", "sell_year", "desc"]
+# columns of the catalogs table ; the full data of the catalogue is also stored as JSON in `data`
+CATALOG_COLUMNS = ["cat_id", "source", "title", "cat_type", "sell_date", "sell_year", "item_count", "currency",
+				   "total_price_c", "low_price_c", "high_price_c", "mean_price_c", "median_price_c",
+				   "mode_price_c", "variance_price_c", "data"]
+# quoted column names, to use in the queries ("desc" is an SQL keyword)
+ITEM_SQL_COLUMNS = ", ".join(f'"{c}"' for c in ITEM_COLUMNS)
+CATALOG_SQL_COLUMNS = ", ".join(f'"{c}"' for c in CATALOG_COLUMNS)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+	source TEXT PRIMARY KEY,
+	hash TEXT
+);
+CREATE TABLE IF NOT EXISTS catalogs (
+	cat_id TEXT PRIMARY KEY,
+	source TEXT NOT NULL,
+	title TEXT,
+	cat_type TEXT,
+	sell_date TEXT,
+	sell_year INTEGER,
+	item_count INTEGER,
+	currency TEXT,
+	total_price_c REAL,
+	low_price_c REAL,
+	high_price_c REAL,
+	mean_price_c REAL,
+	median_price_c REAL,
+	mode_price_c REAL,
+	variance_price_c REAL,
+	data TEXT
+);
+CREATE TABLE IF NOT EXISTS items (
+	desc_id TEXT PRIMARY KEY,
+	cat_id TEXT,
+	source TEXT NOT NULL,
+	currency TEXT,
+	price REAL,
+	price_c REAL,
+	author TEXT,
+	author_wikidata_id TEXT,
+	date TEXT,
+	number_of_pages REAL,
+	format INTEGER,
+	term INTEGER,
+	sell_date TEXT,
+	sell_year INTEGER,
+	"desc" TEXT
+);
+CREATE INDEX IF NOT EXISTS items_source ON items(source);
+CREATE INDEX IF NOT EXISTS items_author ON items(author COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS items_author_wikidata_id ON items(author_wikidata_id);
+CREATE INDEX IF NOT EXISTS items_sell_year ON items(sell_year);
+CREATE INDEX IF NOT EXISTS items_term ON items(term);
+CREATE INDEX IF NOT EXISTS items_format ON items(format);
+CREATE INDEX IF NOT EXISTS items_price_c ON items(price_c);
+CREATE INDEX IF NOT EXISTS catalogs_source ON catalogs(source);
+CREATE INDEX IF NOT EXISTS catalogs_sell_year ON catalogs(sell_year);
+CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5("desc", content='items', content_rowid='rowid');
+CREATE TRIGGER IF NOT EXISTS items_fts_insert AFTER INSERT ON items BEGIN
+	INSERT INTO items_fts(rowid, "desc") VALUES (new.rowid, new."desc");
+END;
+CREATE TRIGGER IF NOT EXISTS items_fts_delete AFTER DELETE ON items BEGIN
+	INSERT INTO items_fts(items_fts, rowid, "desc") VALUES ('delete', old.rowid, old."desc");
+END;
+"""
+
+
+class SqliteStore:
+	"""
+	SQLite database holding the items and the catalogues. used as a context manager,
+	the changes are committed if no exception is raised, else rolled back.
+	"""
+	def __init__(self, path):
+		"""
+		:param path: path to the database ; it is created if it doesn't exist
+		"""
+		self.path = path
+		self.connection = sqlite3.connect(path)
+		self.connection.executescript(SCHEMA)
+		self.updated = 0  # number of files whose rows were replaced
+		self.skipped = 0  # number of files that were unchanged
+
+	def upsert(self, source, output_dict, catalog_dict, source_hash=None):
+		"""
+		replace the rows extracted from an XML file
+		:param source: the path of the XML file, relative to Catalogues/
+		:param output_dict: the items of the file, as returned by item_extractor()
+		:param catalog_dict: the catalogue data of the file, as returned by catalog_extractor()
+		:param source_hash: a hash of the file and of the extraction ; if it is the same as
+							the one stored, the rows of the file are left as they are
+		:return: True if the rows were replaced, False if the file was unchanged
+		"""
+		row = self.connection.execute("SELECT hash FROM sources WHERE source = ?", (source,)).fetchone()
+		if source_hash is not None and row is not None and row[0] == source_hash:
+			self.skipped += 1
+			return False
+		self.delete(source)
+		cat_id = next(iter(catalog_dict), None)
+		# a desc that moved from another file: its old row is deleted first, with a DELETE that fires
+		# the trigger of the FTS index (INSERT OR REPLACE doesn't, without PRAGMA recursive_triggers)
+		self.connection.executemany("DELETE FROM items WHERE desc_id = ?", ((desc_id,) for desc_id in output_dict))
+		self.connection.executemany(
+			f"INSERT INTO items ({ITEM_SQL_COLUMNS}) "
+			f"VALUES ({', '.join('?' * len(ITEM_COLUMNS))})",
+			(item_row(desc_id, cat_id, source, data) for desc_id, data in output_dict.items())
+		)
+		self.connection.executemany(
+			f"INSERT OR REPLACE INTO catalogs ({CATALOG_SQL_COLUMNS}) "
+			f"VALUES ({', '.join('?' * len(CATALOG_COLUMNS))})",
+			(catalog_row(cat_id, source, data) for cat_id, data in catalog_dict.items())
+		)
+		self.connection.execute("INSERT OR REPLACE INTO sources (source, hash) VALUES (?, ?)", (source, source_hash))
+		self.updated += 1
+		return True
+
+	def delete(self, source):
+		"""
+		delete the rows extracted from an XML file
+		:param source: the path of the XML file, relative to Catalogues/
+		:return: None
+		"""
+		self.connection.execute("DELETE FROM items WHERE source = ?", (source,))
+		self.connection.execute("DELETE FROM catalogs WHERE source = ?", (source,))
+		self.connection.execute("DELETE FROM sources WHERE source = ?", (source,))
+		return None
+
+	def prune(self, sources):
+		"""
+		delete the rows of the XML files that are not in `sources`
+		:param sources: the paths of the current XML files, relative to Catalogues/
+		:return: the number of files whose rows were deleted
+		"""
+		sources = set(sources)
+		stored = [row[0] for row in self.connection.execute("SELECT source FROM sources")]
+		deleted = [source for source in stored if source not in sources]
+		for source in deleted:
+			self.delete(source)
+		return len(deleted)
+
+	def commit(self):
+		self.connection.commit()
+		self.connection.close()
+
+	def abort(self):
+		self.connection.rollback()
+		self.connection.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, exc_traceback):
+		if exc_type is None:
+			self.commit()
+		else:
+			self.abort()
+		return False
+
+
+# ============== ROWS ============== #
+def sell_year(sell_date):
+	"""
+	:param sell_date: a sell date, or None
+	:return: the first year (4 digits) in the sell date as an int, or None
+	"""
+	years = re.findall(r"\d{4}", sell_date) if sell_date else []
+	return int(years[0]) if years else None
+
+
+def item_row(desc_id, cat_id, source, data):
+	"""
+	build a row of the items table
+	:param desc_id: the @xml:id of the desc
+	:param cat_id: the @xml:id of the catalogue
+	:param source: the path of the XML file, relative to Catalogues/
+	:param data: the data of the desc, from item_extractor()
+	:return: tuple of values, in the order of ITEM_COLUMNS
+	"""
+	values = {**data, "desc_id": desc_id, "cat_id": cat_id, "source": source,
+			  "sell_year": sell_year(data.get("sell_date"))}
+	return tuple(values.get(c) for c in ITEM_COLUMNS)
+
+
+def catalog_row(cat_id, source, data):
+	"""
+	build a row of the catalogs table
+	:param cat_id: the @xml:id of the catalogue
+	:param source: the path of the XML file, relative to Catalogues/
+	:param data: the data of the catalogue, from catalog_extractor()
+	:return: tuple of values, in the order of CATALOG_COLUMNS
+	"""
+	values = {**data, "cat_id": cat_id, "source": source, "sell_year": sell_year(data.get("sell_date")),
+			  "data": json.dumps(data)}
+	return tuple(values.get(c) for c in CATALOG_COLUMNS)
+
+
+# ============== QUERIES ============== #
+def query_items(path, author=None, author_wikidata_id=None, year_from=None, year_to=None, min_price_c=None,
+				max_price_c=None, term=None, desc_format=None, text=None, limit=None):
+	"""
+	get the items matching all the given criteria ; the criteria that are None are ignored.
+	:param path: path to the database
+	:param author: the surname of the author (case insensitive)
+	:param author_wikidata_id: the wikidata id of the author ("wd:Q...")
+	:param year_from: the first sell year
+	:param year_to: the last sell year
+	:param min_price_c: the minimum price, in constant francs
+	:param max_price_c: the maximum price, in constant francs
+	:param term: the normalised term of the document (int)
+	:param desc_format: the normalised format of the document (int)
+	:param text: an FTS5 query on the text of the descs
+	:param limit: the maximum number of items to return
+	:return: list of dicts, with the data of item_extractor() and desc_id, cat_id and sell_year
+	"""
+	conditions, params = [], []
+	criteria = [
+		("items.author = ? COLLATE NOCASE", author),
+		("items.author_wikidata_id = ?", author_wikidata_id),
+		("items.sell_year >= ?", year_from),
+		("items.sell_year <= ?", year_to),
+		("items.price_c >= ?", min_price_c),
+		("items.price_c <= ?", max_price_c),
+		("items.term = ?", term),
+		("items.format = ?", desc_format),
+		("items.rowid IN (SELECT rowid FROM items_fts WHERE items_fts MATCH ?)", text)
+	]
+	for condition, value in criteria:
+		if value is not None:
+			conditions.append(condition)
+			params.append(value)
+	query = "SELECT " + ", ".join(f'items."{c}"' for c in ITEM_COLUMNS if c != "source") + " FROM items"
+	if conditions:
+		query += " WHERE " + " AND ".join(conditions)
+	query += " ORDER BY items.desc_id"
+	if limit is not None:
+		query += " LIMIT ?"
+		params.append(limit)
+	connection = sqlite3.connect(path)
+	connection.row_factory = sqlite3.Row
+	try:
+		return [dict(row) for row in connection.execute(query, params)]
+	finally:
+		connection.close()
+
+
+# ============== COMMAND LINE INTERFACE ============== #
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="query the items of the SQLite database written by "
+												 "extractor_json.py --sqlite")
+	parser.add_argument("--db", default=f"{curdir}/../output/export.sqlite",
+						help="path to the database ; default: output/export.sqlite")
+	parser.add_argument("--author", help="surname of the author")
+	parser.add_argument("--wikidata", help="wikidata id of the author (wd:Q...)")
+	parser.add_argument("--from", dest="year_from", type=int, help="first sell year")
+	parser.add_argument("--to", dest="year_to", type=int, help="last sell year")
+	parser.add_argument("--min-price", type=float, help="minimum price, in constant francs")
+	parser.add_argument("--max-price", type=float, help="maximum price, in constant francs")
+	parser.add_argument("--term", type=int, help="normalised term of the document")
+	parser.add_argument("--format", dest="desc_format", type=int, help="normalised format of the document")
+	parser.add_argument("--text", help="full-text (FTS5) query on the descs")
+	parser.add_argument("--limit", type=int, help="maximum number of items")
+	args = parser.parse_args()
+
+	for item in query_items(args.db, author=args.author, author_wikidata_id=args.wikidata,
+							year_from=args.year_from, year_to=args.year_to, min_price_c=args.min_price,
+							max_price_c=args.max_price, term=args.term, desc_format=args.desc_format,
+							text=args.text, limit=args.limit):
+		print(json.dumps(item, ensure_ascii=False))
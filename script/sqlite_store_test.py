@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from sqlite_store import SqliteStore, query_items
+
+
+class Sqlite_store(unittest.TestCase):
+
+    output_dict = {
+        "CAT_000112_e18_d1": {"currency": "FRF", "price": 15.0, "price_c": 15.3, "author": "Barry",
+                              "author_wikidata_id": "wd:Q123", "date": "1846", "number_of_pages": 1.0,
+                              "format": 8, "term": 7, "sell_date": "Novembre 1887",
+                              "desc": "L. a. s. au colonel Fox; 1846, 1 p. in-8."},
+        "CAT_000112_e19_d1": {"price": None, "author": "Hugo", "author_wikidata_id": None, "date": None,
+                              "number_of_pages": None, "format": None, "term": 3, "sell_date": "Novembre 1887",
+                              "desc": "Pièce signée, sur vélin."}
+    }
+    catalog_dict = {"CAT_000112": {"title": "REVUE", "sell_date": "1887-11", "item_count": 2, "currency": "FRF",
+                                   "total_price_c": 15, "high_price_items_c": {"CAT_000112_e18": 15.3}}}
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "export.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_query(self):
+        with SqliteStore(self.path) as store:
+            store.upsert("101-200/CAT_000112_wd.xml", self.output_dict, self.catalog_dict, "h1")
+        items = query_items(self.path, author="barry", year_from=1880, year_to=1890, max_price_c=50)
+        self.assertEqual([i["desc_id"] for i in items], ["CAT_000112_e18_d1"])
+        self.assertEqual(items[0]["cat_id"], "CAT_000112")
+        self.assertEqual(items[0]["sell_year"], 1887)
+        self.assertEqual(query_items(self.path, author="Barry", max_price_c=10), [])
+        self.assertEqual([i["desc_id"] for i in query_items(self.path, text="vélin")], ["CAT_000112_e19_d1"])
+        self.assertEqual(len(query_items(self.path, term=7, desc_format=8, author_wikidata_id="wd:Q123")), 1)
+
+    def test_upsert_and_prune(self):
+        with SqliteStore(self.path) as store:
+            store.upsert("101-200/CAT_000112_wd.xml", self.output_dict, self.catalog_dict, "h1")
+        with SqliteStore(self.path) as store:
+            self.assertFalse(store.upsert("101-200/CAT_000112_wd.xml", {}, {}, "h1"))
+            self.assertTrue(store.upsert("101-200/CAT_000112_wd.xml",
+                                         {"CAT_000112_e19_d1": self.output_dict["CAT_000112_e19_d1"]},
+                                         self.catalog_dict, "h2"))
+        self.assertEqual([i["desc_id"] for i in query_items(self.path)], ["CAT_000112_e19_d1"])
+        self.assertEqual(query_items(self.path, text="colonel"), [])
+        with SqliteStore(self.path) as store:
+            self.assertEqual(store.prune([]), 1)
+        self.assertEqual(query_items(self.path), [])
+
+    def test_moved_desc(self):
+        # a desc that moves to another file: its old text must leave the FTS index
+        moved = dict(self.output_dict["CAT_000112_e18_d1"], desc="L. a. s. au général Fox.")
+        with SqliteStore(self.path) as store:
+            store.upsert("101-200/CAT_000112_wd.xml", self.output_dict, self.catalog_dict, "h1")
+            store.upsert("101-200/CAT_000113_wd.xml", {"CAT_000112_e18_d1": moved}, {}, "h1")
+        self.assertEqual(query_items(self.path, text="colonel"), [])
+        self.assertEqual([i["desc_id"] for i in query_items(self.path, text="général")], ["CAT_000112_e18_d1"])
+        with SqliteStore(self.path) as store:
+            self.assertEqual(store.connection.execute(
+                "INSERT INTO items_fts(items_fts, rank) VALUES ('integrity-check', 1)").fetchall(), [])
+
+    def test_rollback(self):
+        with self.assertRaises(RuntimeError):
+            with SqliteStore(self.path) as store:
+                store.upsert("101-200/CAT_000112_wd.xml", self.output_dict, self.catalog_dict, "h1")
+                raise RuntimeError("the extraction failed")
+        self.assertEqual(query_items(self.path), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,194 @@
+# coding: utf-8
+
+# --------------------------------------------------------------------------------------------------
+# Katabase project: github.com/katabase/
+# Telemetry of the runs of extractor_json.py (options --stats-out and --profile)
+#
+# * PROCESS BREAKDOWN *
+# - extract_file() measures the time spent on each step of the extraction of a file and
+#   file_stats() turns these measures into the statistics of the file: parse time, time spent in
+#   item_extractor() and catalog_extractor(), time spent on the listing of the descs (--tsv),
+#   number of descs, items and price conversions, and number of bytes read ; with --profile, the
+#   extraction of each file is also run with cProfile and its statistics are dumped in the profile
+#   directory (profile_path()) ;
+# - RunTelemetry collects the statistics of every file of a run, prints a summary with the
+#   slowest files (report()) and writes them to a JSON file (write()) ;
+# - keep_profiles() only keeps the cProfile dumps of the slowest files and writes, for each of
+#   them, a collapsed-stack file (one "caller;callee;... microseconds" line per stack) that can
+#   be turned into a flame graph (with flamegraph.pl or speedscope, for example).
+# --------------------------------------------------------------------------------------------------
+
+
+import os
+import json
+import pstats
+
+
+STEPS = ["parse", "item_extractor", "catalog_extractor", "listing", "stream_extractor"]
+MAX_DEPTH = 64  # maximum depth of the collapsed stacks
+
+
+# ============== STATISTICS OF A FILE ============== #
+def file_stats(file, timings, output_dict, catalog_dict, conversions):
+	"""
+	build the statistics on the extraction of a file
+	:param file: path to the XML catalogue
+	:param timings: dict mapping the steps of the extraction (see STEPS) to the time spent on them, in seconds
+	:param output_dict: the data on the descs of the file
+	:param catalog_dict: the data on the catalogue
+	:param conversions: the number of prices converted during the extraction
+	:return: dict with the statistics of the file
+	"""
+	stats = {"file": file, "bytes": os.path.getsize(file)}
+	stats.update({step: timings.get(step) for step in STEPS})
+	stats["total"] = sum(t for t in timings.values() if t is not None)
+	stats["descs"] = len(output_dict)
+	stats["items"] = sum(data.get("item_count", 0) for data in catalog_dict.values())
+	stats["conversions"] = conversions
+	return stats
+
+
+def profile_path(profile_dir, file):
+	"""
+	:param profile_dir: the directory of the cProfile dumps
+	:param file: path to an XML catalogue
+	:return: path of the cProfile dump of the file
+	"""
+	return os.path.join(profile_dir, os.path.splitext(os.path.basename(file))[0] + ".prof")
+
+
+# ============== TELEMETRY OF A RUN ============== #
+class RunTelemetry:
+	"""
+	statistics on every file extracted during a run of extractor_json.py
+	"""
+	def __init__(self):
+		self.files = []  # statistics of each file, from file_stats()
+
+	def add(self, stats):
+		"""
+		:param stats: the statistics of a file, from file_stats() (ignored if None)
+		:return: None
+		"""
+		if stats is not None:
+			self.files.append(stats)
+		return None
+
+	def slowest(self, n):
+		"""
+		:param n: number of files
+		:return: the statistics of the n files that took the longest to extract, slowest first
+		"""
+		return sorted(self.files, key=lambda stats: stats["total"], reverse=True)[:n]
+
+	def totals(self):
+		"""
+		:return: dict with the sum of each statistic over all the files
+		"""
+		totals = {"files": len(self.files)}
+		for key in ["bytes", *STEPS, "total", "descs", "items", "conversions"]:
+			values = [stats[key] for stats in self.files if stats[key] is not None]
+			totals[key] = sum(values) if values else None
+		return totals
+
+	def report(self, n=10):
+		"""
+		print the totals of the run and the n slowest files
+		:param n: number of files
+		:return: None
+		"""
+		if not self.files:
+			print("no file extracted")
+			return None
+		totals = self.totals()
+		steps = ", ".join(f"{step} {totals[step]:.2f} s" for step in STEPS if totals[step] is not None)
+		print(f"{totals['files']} file(s) extracted in {totals['total']:.2f} s ({steps}) ; "
+			  f"{totals['descs']} descs, {totals['items']} items, {totals['conversions']} price conversions, "
+			  f"{totals['bytes'] / 1024 / 1024:.1f} MB read")
+		for stats in self.slowest(n):
+			steps = ", ".join(f"{step} {stats[step] * 1000:.0f} ms" for step in STEPS if stats[step] is not None)
+			print(f"    {os.path.basename(stats['file'])}: {stats['total'] * 1000:.0f} ms ({steps}) ; "
+				  f"{stats['descs']} descs, {stats['bytes'] / 1024:.0f} KB")
+		return None
+
+	def write(self, path):
+		"""
+		write the totals and the statistics of every file to a JSON file
+		:param path: path to the JSON file
+		:return: None
+		"""
+		with open(path, mode="w") as f:
+			json.dump({"totals": self.totals(), "files": self.files}, f, indent=4)
+		return None
+
+	def keep_profiles(self, profile_dir, n=10):
+		"""
+		delete the cProfile dumps of every file but the n slowest ones and write
+		the collapsed stacks of these files next to their dumps
+		:param profile_dir: the directory of the cProfile dumps
+		:param n: number of files
+		:return: list of the paths of the kept cProfile dumps
+		"""
+		slowest = {profile_path(profile_dir, stats["file"]) for stats in self.slowest(n)}
+		for stats in self.files:
+			path = profile_path(profile_dir, stats["file"])
+			if path not in slowest and os.path.exists(path):
+				os.remove(path)
+		kept = sorted(path for path in slowest if os.path.exists(path))
+		for path in kept:
+			with open(os.path.splitext(path)[0] + ".folded", mode="w") as f:
+				f.writelines(f"{stack} {value}\n" for stack, value in collapsed_stacks(path))
+		return kept
+
+
+# ============== FLAME GRAPHS ============== #
+def collapsed_stacks(path):
+	"""
+	rebuild the call stacks of a cProfile dump, in the "collapsed" format of flamegraph.pl.
+	cProfile only records the callers of each function, not the full stacks: the stacks are
+	rebuilt from the functions that have no caller, and the time of a function called from
+	several places is shared between its callers in proportion to the time of each call.
+	recursive calls are cut.
+	:param path: path to a cProfile dump
+	:return: list of ("function;function;...", microseconds) tuples, one for each stack
+	"""
+	stats = pstats.Stats(path).stats  # function -> (calls, primitive calls, tottime, cumtime, callers)
+	callees = {function: [] for function in stats}
+	for function, (_, _, _, _, callers) in stats.items():
+		for caller in callers:
+			if caller in callees:
+				callees[caller].append(function)
+
+	stacks = {}
+
+	def walk(function, stack, share):
+		# share: the part of the cumulative time of the function spent in this stack
+		_, _, tottime, cumtime, _ = stats[function]
+		stack = stack + [function_name(function)]
+		key = ";".join(stack)
+		stacks[key] = stacks.get(key, 0) + tottime * share
+		if len(stack) >= MAX_DEPTH or cumtime == 0:
+			return
+		for callee in callees[function]:
+			if function_name(callee) in stack:
+				continue
+			edge = stats[callee][4][function][3]  # cumulative time of the callee when called by this function
+			if edge > 0 and stats[callee][3] > 0:
+				walk(callee, stack, share * edge / stats[callee][3])
+		return
+
+	for function, (_, _, _, _, callers) in stats.items():
+		if not callers:
+			walk(function, [], 1.0)
+	return [(stack, round(value * 1_000_000)) for stack, value in stacks.items() if round(value * 1_000_000) > 0]
+
+
+def function_name(function):
+	"""
+	:param function: a (file, line, name) tuple, as in the pstats statistics
+	:return: a readable name for the function
+	"""
+	file, line, name = function
+	if file == "~":  # built-in function
+		return name
+	return f"{os.path.basename(file)}:{line}({name})"
@@ -0,0 +1,54 @@
+import os
+import glob
+import shutil
+import tempfile
+import unittest
+
+from extractor_json import extract_file, curdir
+from telemetry import *
+
+
+class Run_telemetry(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.files = sorted(glob.glob(f"{curdir}/../Catalogues/1-100/*.xml"))[:3]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_file_stats(self):
+        file, output_dict, catalog_dict, error, stats, _ = extract_file(self.files[2], telemetry=True)
+        self.assertEqual(stats["descs"], len(output_dict))
+        self.assertEqual(stats["bytes"], os.path.getsize(file))
+        # the price of each item is converted once, for its descs and for the catalogue
+        items = {desc_id.rsplit("_d", 1)[0] for desc_id, data in output_dict.items() if "price_c" in data}
+        self.assertTrue(items)
+        self.assertEqual(stats["conversions"], len(items))
+        self.assertIsNone(stats["stream_extractor"])
+        self.assertIsNone(stats["listing"])
+        listing_stats = extract_file(self.files[2], telemetry=True, listing=True)[4]
+        self.assertGreater(listing_stats["listing"], 0)
+        self.assertGreater(listing_stats["catalog_extractor"], 0)
+        self.assertIsNone(extract_file(self.files[2])[4])
+        stream_stats = extract_file(self.files[2], stream=True, telemetry=True)[4]
+        self.assertIsNone(stream_stats["parse"])
+        self.assertEqual(stream_stats["descs"], stats["descs"])
+
+    def test_profiles(self):
+        telemetry = RunTelemetry()
+        for file in self.files:
+            telemetry.add(extract_file(file, profile_dir=self.tmpdir)[4])
+        self.assertEqual(telemetry.totals()["files"], 3)
+        slowest = telemetry.slowest(1)[0]
+        kept = telemetry.keep_profiles(self.tmpdir, n=1)
+        self.assertEqual(kept, [profile_path(self.tmpdir, slowest["file"])])
+        self.assertEqual(len(os.listdir(self.tmpdir)), 2)
+        stacks = collapsed_stacks(kept[0])
+        self.assertTrue(any(stack.startswith("extractor_json.py") and "(desc_extractor)" in stack
+                            for stack, _ in stacks))
+        self.assertTrue(all(value > 0 for _, value in stacks))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,225 @@
+# coding: utf-8
+
+# --------------------------------------------------------------------------------------------------
+# Katabase project: github.com/katabase/
+# Streaming writers for the JSON and TSV outputs of extractor_json.py
+#
+# * PROCESS BREAKDOWN *
+# - a writer is opened on an output file and receives the records of each catalogue as soon as
+#   the catalogue is processed (write()) ; the records are written in one chunk per catalogue,
+#   through a large write buffer, and flushed so that the output can be followed while the
+#   extraction is running ;
+# - everything is written to a temporary file (the output's path + ".part") that replaces the
+#   output file only once the whole extraction is done (commit()) ; if the extraction fails,
+#   the temporary file is deleted (abort()) and the previous output file is left untouched ;
+#   the temporary file is only created when the writer is entered as a context manager (or on
+#   the first write), so that a writer that is never entered leaves no file behind ;
+# - JsonObjectWriter writes the usual format: a JSON object mapping an @xml:id to its data,
+#   exactly as json.dump(..., indent=4) would ; JsonLinesWriter writes one record per line,
+#   the @xml:id being added to the record ; TsvWriter writes one tab-separated row per record, after
+#   a row of column names (the listing of the descs of list_desc.py) ;
+# - the records of a catalogue can also be formatted once (fragment()) and the formatted text
+#   written to several successive files (write_fragment()), as serve.py does ;
+# - the records are encoded by a serializers.Serializer: indented as above by default, or compact
+#   (--compact), and the file is compressed with gzip or zstd if the name of the output ends with .gz
+#   or .zst (--compress).
+# --------------------------------------------------------------------------------------------------
+
+
+import os
+import json
+
+from records import json_default
+from serializers import Serializer, compression_of, open_output
+
+
+BUFFER_SIZE = 1024 * 1024  # size of the write buffer, in bytes
+
+
+class StreamWriter:
+	"""
+	base class for the streaming writers: write the records to a temporary file,
+	which replaces the output file when the writer is committed. used as a context
+	manager, the writer is committed if no exception is raised, else aborted.
+	"""
+	def __init__(self, path, buffer_size=BUFFER_SIZE, serializer=None):
+		"""
+		:param path: path to the output file ; it is compressed if it ends with .gz or .zst
+		:param buffer_size: size of the write buffer, in bytes
+		:param serializer: the serializers.Serializer encoding the records ; default: pretty JSON
+		"""
+		self.path = path
+		self.tmp_path = f"{path}.part"
+		self.count = 0  # number of records written
+		self.serializer = serializer if serializer is not None else Serializer()
+		self.buffer_size = buffer_size
+		self.file = None  # the temporary file, created by open()
+
+	def open(self):
+		"""
+		create the temporary file and write its header, if it is not already open
+		:return: the writer
+		"""
+		if self.file is None:
+			self.file = open_output(self.tmp_path, compression_of(self.path), self.buffer_size)
+			self.file.write(self.header())
+		return self
+
+	def header(self):
+		"""
+		:return: the text written at the start of the file
+		"""
+		return ""
+
+	def footer(self):
+		"""
+		:return: the text written at the end of the file
+		"""
+		return ""
+
+	def format_record(self, key, data):
+		"""
+		:param key: the @xml:id of the record
+		:param data: the data of the record
+		:return: the record as it must be written in the file
+		"""
+		raise NotImplementedError
+
+	def fragment(self, records):
+		"""
+		format records as a fragment of the file that doesn't depend on its position
+		in the file, so that it can be kept and written again (see serve.py)
+		:param records: dict mapping an @xml:id to its data
+		:return: the formatted records
+		"""
+		return "".join(self.format_record(key, data) for key, data in records.items())
+
+	def separator(self):
+		"""
+		:return: the text written before a fragment, after the records already written
+		"""
+		return ""
+
+	def write(self, records):
+		"""
+		write records in a single chunk, then flush the buffer so that the
+		records can be read from the temporary file
+		:param records: dict mapping an @xml:id to its data
+		:return: None
+		"""
+		if records:
+			self.write_fragment(self.fragment(records), len(records))
+		return None
+
+	def write_fragment(self, fragment, count):
+		"""
+		write a fragment built by fragment() and flush the buffer
+		:param fragment: the formatted records
+		:param count: the number of records in the fragment
+		:return: None
+		"""
+		if count:
+			self.open()
+			self.file.write(self.separator() + fragment)
+			self.file.flush()
+			self.count += count
+		return None
+
+	def commit(self):
+		"""
+		finish the file and replace the output file with it
+		:return: None
+		"""
+		self.open()
+		self.file.write(self.footer())
+		self.file.close()
+		os.replace(self.tmp_path, self.path)
+		return None
+
+	def abort(self):
+		"""
+		delete the temporary file and leave the output file as it was
+		:return: None
+		"""
+		if self.file is not None:
+			self.file.close()
+		if os.path.exists(self.tmp_path):
+			os.remove(self.tmp_path)
+		return None
+
+	def __enter__(self):
+		return self.open()
+
+	def __exit__(self, exc_type, exc_value, exc_traceback):
+		if exc_type is None:
+			self.commit()
+		else:
+			self.abort()
+		return False
+
+
+class JsonObjectWriter(StreamWriter):
+	"""
+	write the records as a JSON object, with the same output as json.dump(..., indent=4) ; with
+	a compact serializer, each record is written on a line of its own, without whitespace
+	"""
+	def header(self):
+		return "{"
+
+	def footer(self):
+		return "\n}" if self.count else "}"
+
+	def format_record(self, key, data):
+		if self.serializer.compact:
+			return f"{self.serializer.key(key)}:{self.serializer.dumps(data)}"
+		value = self.serializer.dumps(data).replace("\n", "\n    ")
+		return f"    {json.dumps(key)}: {value}"
+
+	def fragment(self, records):
+		return ",\n".join(self.format_record(key, data) for key, data in records.items())
+
+	def separator(self):
+		return ",\n" if self.count else "\n"
+
+
+class JsonLinesWriter(StreamWriter):
+	"""
+	write the records in the JSON Lines format: one JSON object per line, the @xml:id
+	of the record being stored in the `id_key` field, before the other fields
+	"""
+	def __init__(self, path, id_key, buffer_size=BUFFER_SIZE, serializer=None):
+		"""
+		:param path: path to the output file ; it is compressed if it ends with .gz or .zst
+		:param id_key: name of the field in which the @xml:id is stored ("desc_id", "cat_id")
+		:param buffer_size: size of the write buffer, in bytes
+		:param serializer: the serializers.Serializer encoding the records ; default: json.dumps()
+		"""
+		self.id_key = id_key
+		super().__init__(path, buffer_size, serializer)
+
+	def format_record(self, key, data):
+		if self.serializer.compact:
+			return self.serializer.dumps({self.id_key: key, **data}) + "\n"
+		return json.dumps({self.id_key: key, **data}, default=json_default) + "\n"
+
+
+class TsvWriter(StreamWriter):
+	"""
+	write the records as tab-separated values: a first row with the names of the columns, then one row
+	per record, the @xml:id of the record being in the first column ; the values are written as they
+	are, without quotes or escapes
+	"""
+	def __init__(self, path, columns, buffer_size=BUFFER_SIZE):
+		"""
+		:param path: path to the output file ; it is compressed if it ends with .gz or .zst
+		:param columns: names of the columns, the first one being the column of the @xml:id
+		:param buffer_size: size of the write buffer, in bytes
+		"""
+		self.columns = columns
+		super().__init__(path, buffer_size)
+
+	def header(self):
+		return "\t".join(self.columns) + "\n"
+
+	def format_record(self, key, data):
+		return "\t".join((key, *data)) + "\n"
@@ -0,0 +1,73 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from writers import *
+
+
+class Stream_writers(unittest.TestCase):
+
+    records = [
+        {"CAT_000112_e18_d1": {"price": 15.0, "author": "Barry", "desc": "L. a. s.\n1846", "term": 7}},
+        {},
+        {"CAT_000113_e1_d1": {"price": None, "high_price_items_c": {"CAT_000113_e1": 2.0}},
+         "CAT_000113_e1_d2": {"author": "Mérimée", "format": None}}
+    ]
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "export_item.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_same_as_json_dump(self):
+        with JsonObjectWriter(self.path) as writer:
+            for records in self.records:
+                writer.write(records)
+        merged = {k: v for records in self.records for k, v in records.items()}
+        with open(self.path, mode="r", encoding="utf-8") as f:
+            self.assertEqual(f.read(), json.dumps(merged, indent=4))
+        with JsonObjectWriter(self.path):
+            pass
+        with open(self.path, mode="r", encoding="utf-8") as f:
+            self.assertEqual(f.read(), json.dumps({}, indent=4))
+
+    def test_json_lines(self):
+        with JsonLinesWriter(self.path, id_key="desc_id") as writer:
+            for records in self.records:
+                writer.write(records)
+                # the records can be read while the file is being written
+                with open(writer.tmp_path, mode="r", encoding="utf-8") as f:
+                    self.assertEqual(len(f.readlines()), writer.count)
+        with open(self.path, mode="r", encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual([line["desc_id"] for line in lines],
+                         ["CAT_000112_e18_d1", "CAT_000113_e1_d1", "CAT_000113_e1_d2"])
+        self.assertEqual(lines[0]["price"], 15.0)
+
+    def test_abort_keeps_previous_output(self):
+        with open(self.path, mode="w") as f:
+            f.write("{}")
+        with self.assertRaises(RuntimeError):
+            with JsonObjectWriter(self.path) as writer:
+                writer.write(self.records[0])
+                raise RuntimeError("the extraction failed")
+        with open(self.path, mode="r") as f:
+            self.assertEqual(f.read(), "{}")
+        self.assertFalse(os.path.exists(f"{self.path}.part"))
+
+    def test_part_file_created_on_enter(self):
+        # a writer that is never entered (the extraction failed before) leaves no .part file
+        writer = JsonObjectWriter(self.path)
+        self.assertFalse(os.path.exists(writer.tmp_path))
+        with writer:
+            self.assertTrue(os.path.exists(writer.tmp_path))
+        self.assertFalse(os.path.exists(writer.tmp_path))
+        self.assertTrue(os.path.exists(self.path))
+
+
+if __name__ == "__main__":
+    unittest.main()